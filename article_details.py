@@ -0,0 +1,342 @@
+import csv
+import json
+import time
+import queue
+import sqlite3
+import logging
+import argparse
+import threading
+
+from tqdm import tqdm
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from elib_http import ElibraryHttpClient, BlockedResponse, BASE_URL, item_url, parse_item_html
+from proxy_pool import ProxyPool
+from scheduler import Scheduler
+from metrics import METRICS
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS item_queue (
+    elib_id TEXT PRIMARY KEY,
+    link TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS item_queue_status ON item_queue (status);
+CREATE TABLE IF NOT EXISTS item_details (
+    elib_id TEXT PRIMARY KEY,
+    title TEXT,
+    authors TEXT,
+    year INTEGER,
+    doi TEXT,
+    abstract TEXT,
+    keywords TEXT,
+    fetched_at REAL
+);
+"""
+
+DETAIL_FIELDS = ("title", "authors", "year", "doi", "abstract", "keywords")
+
+
+def iter_csv_rows(journals_path="data/journals") -> Iterator[Tuple[str, str]]:
+    # Файлы читаются построчно, в памяти не держится ни один csv целиком
+    for csv_file in sorted(Path(journals_path).glob("*/*.csv")):
+        with open(csv_file, newline="", encoding="utf-8") as f:
+            for row in csv.reader(f):
+                if len(row) == 3 and row[0] and row[2]:
+                    yield row[0], row[2]
+
+
+class ItemDetailsStore():
+    # Очередь статей и результаты лежат в одной базе: повтор elib_id отсекается первичным ключом
+    # на диске, а каждая записанная пачка служит точкой восстановления
+    def __init__(self, path="./data/item_details.sqlite", max_attempts=5):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.max_attempts = max_attempts
+        self.conn = self._connect()
+        self.conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.path), isolation_level=None, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def enqueue(self, rows: Iterator[Tuple[str, str]], batch_size=1000) -> int:
+        inserted = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                inserted += self._enqueue_batch(batch)
+                batch = []
+        if len(batch) != 0:
+            inserted += self._enqueue_batch(batch)
+        return inserted
+
+    def _enqueue_batch(self, batch: List[Tuple[str, str]]) -> int:
+        self.conn.execute("BEGIN IMMEDIATE")
+        before = self.conn.total_changes
+        self.conn.executemany("INSERT OR IGNORE INTO item_queue (elib_id, link) VALUES (?, ?)", batch)
+        inserted = self.conn.total_changes - before
+        self.conn.execute("COMMIT")
+        return inserted
+
+    def requeue(self, statuses=("error", "blocked")) -> int:
+        placeholders = ",".join("?" * len(statuses))
+        cursor = self.conn.execute(f"UPDATE item_queue SET status = 'pending' WHERE status IN ({placeholders}) "
+                                   "AND attempts < ?", (*statuses, self.max_attempts))
+        return cursor.rowcount
+
+    def count(self, status="pending") -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM item_queue WHERE status = ?", (status,)).fetchone()[0]
+
+    def iter_pending(self, status="pending", chunk=500) -> Iterator[Tuple[str, str]]:
+        # Постраничный проход по rowid через отдельное соединение, пока основное пишет результаты
+        conn = self._connect()
+        last_rowid = 0
+        try:
+            while True:
+                rows = conn.execute("SELECT rowid, elib_id, link FROM item_queue WHERE status = ? AND rowid > ? "
+                                    "ORDER BY rowid LIMIT ?", (status, last_rowid, chunk)).fetchall()
+                if len(rows) == 0:
+                    return
+                for rowid, elib_id, link in rows:
+                    yield elib_id, link
+                last_rowid = rows[-1][0]
+        finally:
+            conn.close()
+
+    def save_batch(self, results: List[Tuple[str, str, Optional[Dict]]]):
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            for elib_id, status, details in results:
+                if details is not None:
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO item_details (elib_id, title, authors, year, doi, abstract, keywords, "
+                        "fetched_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (elib_id, details["title"], json.dumps(details["authors"], ensure_ascii=False),
+                         details["year"], details["doi"], details["abstract"],
+                         json.dumps(details["keywords"], ensure_ascii=False), now))
+                self.conn.execute("UPDATE item_queue SET status = ?, attempts = attempts + ? WHERE elib_id = ?",
+                                  (status, int(status != "done"), elib_id))
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def export_jsonl(self, path="./data/item_details.jsonl") -> int:
+        exported = 0
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding="utf-8") as fp:
+            for row in self.conn.execute(f"SELECT elib_id, {', '.join(DETAIL_FIELDS)} FROM item_details ORDER BY rowid"):
+                item = dict(zip(("elib_id",) + DETAIL_FIELDS, row))
+                item["authors"] = json.loads(item["authors"])
+                item["keywords"] = json.loads(item["keywords"])
+                fp.write(json.dumps(item, ensure_ascii=False) + "\n")
+                exported += 1
+        Path(tmp_path).replace(path)
+        return exported
+
+    def stats(self) -> Dict:
+        stats = dict(self.conn.execute("SELECT status, COUNT(*) FROM item_queue GROUP BY status").fetchall())
+        stats["details"] = self.conn.execute("SELECT COUNT(*) FROM item_details").fetchone()[0]
+        return stats
+
+    def close(self):
+        self.conn.close()
+
+
+class ItemHarvester():
+    # Поток-производитель читает очередь из базы, N потоков качают страницы по HTTP,
+    # основной поток пишет результаты пачками. Очереди между ними ограничены, поэтому
+    # память не зависит от размера корпуса
+    def __init__(self, store: ItemDetailsStore, proxy_pool: Optional[ProxyPool] = None, workers=16,
+                 base_url=BASE_URL, scheduler: Optional[Scheduler] = None, commit_every=200):
+        self.store = store
+        self.proxy_pool = proxy_pool
+        self.workers = workers
+        self.base_url = base_url
+        self.scheduler = scheduler or Scheduler(global_rate=workers / 2, proxy_rate=1.0, max_global_rate=workers * 2.0)
+        self.commit_every = commit_every
+
+    def _produce(self, tasks: queue.Queue):
+        try:
+            for task in self.store.iter_pending():
+                tasks.put(task)
+        finally:
+            for _ in range(self.workers):
+                tasks.put(None)
+
+    def _acquire_proxy(self, exclude=None) -> Tuple[Optional[Dict], bool]:
+        if self.proxy_pool is None:
+            return None, True
+        proxy = self.proxy_pool.acquire_wait(exclude=exclude)
+        return proxy, proxy is not None
+
+    def _fetch(self, tasks: queue.Queue, results: queue.Queue):
+        proxy, client = None, None
+        try:
+            # Даже если прокси или клиент не получены, run() дождется None от этого потока
+            proxy, usable = self._acquire_proxy()
+            client = ElibraryHttpClient(proxy=proxy, pool_size=2, base_url=self.base_url)
+            while True:
+                task = tasks.get()
+                if task is None:
+                    break
+                elib_id, link = task
+                if not usable:
+                    # Прокси закончились: оставшиеся статьи уходят на догрузку через браузер
+                    results.put((elib_id, "blocked", None))
+                    continue
+
+                self.scheduler.wait(proxy)
+                start = time.monotonic()
+                try:
+                    details = client.get_item(link)
+                except BlockedResponse as e:
+                    logging.error(f"Item {elib_id} blocked: {e}")
+                    self.scheduler.on_failure(proxy, e.kind)
+                    METRICS.inc("retries_total", stage="item", reason=e.kind)
+                    results.put((elib_id, "error" if e.kind == "error" else "blocked", None))
+                    if self.proxy_pool is not None:
+                        self.proxy_pool.report_failure(proxy, e.kind)
+                        self.proxy_pool.release(proxy)
+                        client.close()
+                        blocked, proxy, client = proxy, None, None
+                        proxy, usable = self._acquire_proxy(exclude=blocked)
+                        client = ElibraryHttpClient(proxy=proxy, pool_size=2, base_url=self.base_url)
+                    continue
+                except Exception as e:
+                    logging.error(f"Item {elib_id} failed: {e}")
+                    self.scheduler.on_failure(proxy, "error")
+                    METRICS.inc("retries_total", stage="item", reason="error")
+                    results.put((elib_id, "error", None))
+                    continue
+
+                latency = time.monotonic() - start
+                self.scheduler.on_success(proxy, latency)
+                if self.proxy_pool is not None:
+                    self.proxy_pool.report_success(proxy, latency)
+                METRICS.observe("item_fetch_seconds", latency)
+                results.put((elib_id, "done", details))
+        finally:
+            if client is not None:
+                client.close()
+            if self.proxy_pool is not None and proxy is not None:
+                self.proxy_pool.release(proxy)
+            results.put(None)
+
+    def run(self) -> Dict:
+        total = self.store.count()
+        tasks = queue.Queue(maxsize=self.workers * 4)
+        results = queue.Queue(maxsize=self.workers * 4)
+        # Поставщик не ждем: если потоки загрузки завершились раньше, он остается заблокирован на полной очереди
+        producer = threading.Thread(target=self._produce, args=(tasks,), daemon=True)
+        threads = [threading.Thread(target=self._fetch, args=(tasks, results), daemon=True)
+                   for _ in range(self.workers)]
+        producer.start()
+        for thread in threads:
+            thread.start()
+
+        counters = {"done": 0, "blocked": 0, "error": 0}
+        batch = []
+        finished = 0
+        with tqdm(total=total) as progress:
+            while finished < self.workers:
+                result = results.get()
+                if result is None:
+                    finished += 1
+                    continue
+                batch.append(result)
+                counters[result[1]] += 1
+                METRICS.inc("items_total", status=result[1])
+                progress.update(1)
+                if len(batch) >= self.commit_every:
+                    self.store.save_batch(batch)
+                    batch = []
+        if len(batch) != 0:
+            self.store.save_batch(batch)
+        for thread in threads:
+            thread.join()
+        return counters
+
+
+def fetch_blocked_with_browser(store: ItemDetailsStore, parser, commit_every=50) -> int:
+    # Статьи, которые не отдались по HTTP, догружаются через браузер парсера
+    fetched = 0
+    batch = []
+    for elib_id, link in store.iter_pending(status="blocked"):
+        try:
+            page = parser.open_url(item_url(link, parser.base_url))
+            html = page.content()
+            parser.page_pool.release(page)
+            batch.append((elib_id, "done", parse_item_html(html)))
+            fetched += 1
+        except Exception as e:
+            logging.error(f"Browser fetch failed for item {elib_id}: {e}")
+            batch.append((elib_id, "error", None))
+        if len(batch) >= commit_every:
+            store.save_batch(batch)
+            batch = []
+    if len(batch) != 0:
+        store.save_batch(batch)
+    return fetched
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Harvest article details from item.asp pages")
+    arg_parser.add_argument("command", choices=["harvest", "export", "stats"])
+    arg_parser.add_argument("--db", default="./data/item_details.sqlite")
+    arg_parser.add_argument("--journals", default="data/journals")
+    arg_parser.add_argument("--workers", type=int, default=16)
+    arg_parser.add_argument("--proxies", default=None)
+    arg_parser.add_argument("--base-url", default=BASE_URL)
+    arg_parser.add_argument("--browser-fallback", action="store_true")
+    arg_parser.add_argument("--output", default="./data/item_details.jsonl")
+    args = arg_parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        filename="parser_log.log",
+        format="%(asctime)s - %(module)s - %(levelname)s - %(funcName)s: %(lineno)d - %(message)s",
+        datefmt='%H:%M:%S',
+    )
+    store = ItemDetailsStore(args.db)
+    try:
+        if args.command == "harvest":
+            queued = store.enqueue(iter_csv_rows(args.journals))
+            requeued = store.requeue()
+            logging.info(f"Queued {queued} new items, {requeued} failed items requeued")
+
+            proxy_pool = None
+            if args.proxies:
+                proxy_pool = ProxyPool.from_json(args.proxies)
+                proxy_pool.load("./data/proxy_stats.json")
+            harvester = ItemHarvester(store, proxy_pool=proxy_pool, workers=args.workers, base_url=args.base_url)
+            counters = harvester.run()
+            logging.info(f"HTTP pass: {counters}")
+
+            if args.browser_fallback and store.count("blocked") != 0:
+                from journals_parser import ElibraryParser
+                parser = ElibraryParser(headless_mode=True, proxy_pool=proxy_pool)
+                parser.base_url = args.base_url
+                try:
+                    logging.info(f"Browser pass: {fetch_blocked_with_browser(store, parser)} items")
+                finally:
+                    parser.close()
+            if proxy_pool is not None:
+                proxy_pool.save("./data/proxy_stats.json")
+        elif args.command == "export":
+            print(f"Exported {store.export_jsonl(args.output)} items to {args.output}")
+        print(json.dumps(store.stats(), ensure_ascii=False))
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import sqlite3
+import argparse
+import tempfile
+import threading
+import psutil
+
+from pathlib import Path
+from typing import Dict
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from stand_in_server import StandInServer, generate_catalog, write_inputs
+from journals_parser import ElibraryParser
+from crawl_engine import AsyncCrawlEngine
+
+
+class BenchParser(ElibraryParser):
+    # Прокси на стенде не нужны: при ошибке контекст просто пересоздается
+    def __init__(self, *args, **kwargs):
+        self.retries = 0
+        super().__init__(*args, **kwargs)
+
+    def change_proxy(self, failure_kind="error"):
+        self.retries += 1
+        self.close_context(failure_kind)
+        self.open_context()
+        return True
+
+
+class MemorySampler(threading.Thread):
+    def __init__(self, interval=0.25):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._stopped = threading.Event()
+
+    def run(self):
+        process = psutil.Process(os.getpid())
+        while not self._stopped.is_set():
+            rss = process.memory_info().rss
+            for child in process.children(recursive=True):
+                try:
+                    rss += child.memory_info().rss
+                except (psutil.NoSuchProcess, psutil.AccessDenied):
+                    continue
+            self.peak_mb = max(self.peak_mb, rss / 1024 / 1024)
+            self._stopped.wait(self.interval)
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+def count_rows(state_path: str) -> int:
+    with sqlite3.connect(state_path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM articles").fetchone()[0]
+
+
+def run_pipeline(base_url: str, args) -> Dict:
+    stages = {}
+    parser = BenchParser(headless_mode=True)
+    parser.base_url = base_url
+    try:
+        start = time.perf_counter()
+        parser.get_issn_links(f"{base_url}/titles.asp", http_mode=args.http_prepare)
+        stages["resolve_links"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        parser.prepare_journals_info(parser.read_issn_json("data/interrest_cats.json"), http_mode=args.http_prepare)
+        stages["prepare"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        if args.mode == "sync":
+            parser.parse_journals(single_pass=args.single_pass)
+            retries = parser.retries
+        else:
+            engine = AsyncCrawlEngine(concurrency=args.concurrency, rate=args.rate)
+            engine.base_url = base_url
+            asyncio.run(engine.run())
+            retries = parser.retries + engine.retries
+        stages["crawl"] = time.perf_counter() - start
+    finally:
+        parser.close()
+    return {"stages": stages, "retries": retries}
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="End-to-end crawler benchmark against the local stand-in server")
+    arg_parser.add_argument("--mode", choices=["sync", "async"], default="sync")
+    arg_parser.add_argument("--journals", type=int, default=5)
+    arg_parser.add_argument("--articles", type=int, default=200)
+    arg_parser.add_argument("--latency", type=float, default=0.05)
+    arg_parser.add_argument("--captcha-rate", type=float, default=0.0)
+    arg_parser.add_argument("--blocked-rate", type=float, default=0.0)
+    arg_parser.add_argument("--error-rate", type=float, default=0.0)
+    arg_parser.add_argument("--concurrency", type=int, default=4)
+    arg_parser.add_argument("--rate", type=float, default=0.5, help="initial requests per second per proxy")
+    arg_parser.add_argument("--http-prepare", action="store_true")
+    arg_parser.add_argument("--single-pass", action="store_true", help="sync mode: one search over all rubrics")
+    arg_parser.add_argument("--output", default=None, help="append JSON result to this file")
+    args = arg_parser.parse_args()
+
+    catalog = generate_catalog(journals=args.journals, articles_per_journal=args.articles)
+    server = StandInServer(catalog, latency=args.latency, captcha_rate=args.captcha_rate,
+                           blocked_rate=args.blocked_rate, error_rate=args.error_rate)
+    base_url = server.start()
+    output = Path(args.output).resolve() if args.output else None
+
+    workdir = tempfile.mkdtemp(prefix="elib_bench_")
+    os.chdir(workdir)
+    write_inputs(Path("data"), catalog)
+
+    sampler = MemorySampler()
+    sampler.start()
+    start = time.perf_counter()
+    try:
+        result = run_pipeline(base_url, args)
+    finally:
+        elapsed = time.perf_counter() - start
+        sampler.stop()
+        server.stop()
+
+    served = server.stats()
+    rows = count_rows("data/crawl_state.sqlite")
+    expected_rows = sum(len(ids) for journal in catalog for ids in journal.rubrics.values())
+    report = {
+        "mode": args.mode + ("/single-pass" if args.single_pass else ""),
+        "journals": args.journals,
+        "elapsed_s": round(elapsed, 2),
+        "stages_s": {stage: round(value, 2) for stage, value in result["stages"].items()},
+        "pages": served["pages"],
+        "pages_per_s": round(served["pages"] / elapsed, 2),
+        "rows": rows,
+        "expected_rows": expected_rows,
+        "rows_per_s": round(rows / elapsed, 2),
+        "retries": result["retries"],
+        "faults_served": {kind: served[kind] for kind in ("captcha", "blocked", "error")},
+        "peak_rss_mb": round(sampler.peak_mb, 1),
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if output is not None:
+        with open(output, 'a') as fp:
+            fp.write(json.dumps(report, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import re
+import sys
+import time
+import argparse
+
+from pathlib import Path
+from playwright.sync_api import sync_playwright
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from extractors import (RESULT_ROWS_JS, JOURNAL_LINKS_JS, RUBRIC_ROWS_JS,
+                        result_rows_to_links, rubric_rows_to_info)
+
+
+FIXTURES_PATH = Path(__file__).resolve().parent / "fixtures"
+
+
+# Извлечение в прежнем виде: по одному IPC-запросу на каждую строку и ячейку
+
+def legacy_result_rows(page):
+    pub_links = []
+    rows = page.locator("table#restab").locator("tr[id^='arw']")
+    for i in range(rows.count()):
+        row = rows.nth(i)
+        link = row.locator("a[href^='/item.asp?id=']").first
+        href = link.get_attribute("href") if link else None
+        id_value = href.split("=")[1] if href else None
+        title_element = row.locator("b span")
+        title_text = title_element.text_content().strip() if title_element else None
+        pub_links.append([id_value, title_text.lower(), href])
+    return pub_links
+
+
+def legacy_journal_links(page):
+    links = []
+    rows = page.locator("#restab").locator("tr")
+    for i in range(rows.count()):
+        link = rows.nth(i).locator("a[href^='title_items.asp?id='][title]")
+        if link.count() > 0:
+            href = link.first.get_attribute("href")
+            if href:
+                links.append(href)
+    return links
+
+
+def legacy_rubrics(page):
+    data = {}
+    rows = page.locator("#rubrics_table").locator("tr[id^='rubric_']")
+    for i in range(rows.count()):
+        row = rows.nth(i)
+        cat_id = re.search(r"rubric_(\d+)", row.get_attribute("id")).group(1)
+        row_text = row.locator("td:nth-child(2)").text_content()
+        data[cat_id] = {"amount": int(re.search(r"\((\d+)\)", row_text).group(1)), "parsed": 0}
+    return data
+
+
+def bulk_result_rows(page):
+    return result_rows_to_links(page.locator("table#restab").evaluate(RESULT_ROWS_JS))
+
+
+def bulk_journal_links(page):
+    return page.locator("#restab").evaluate(JOURNAL_LINKS_JS)
+
+
+def bulk_rubrics(page):
+    rows = page.locator("#rubrics_table").evaluate(RUBRIC_ROWS_JS)
+    return rubric_rows_to_info((row["row_id"], row["text"]) for row in rows)
+
+
+CASES = [
+    ("restab.html", "parse_links_from_table", legacy_result_rows, bulk_result_rows),
+    ("titles_restab.html", "get_journal_link", legacy_journal_links, bulk_journal_links),
+    ("rubrics_table.html", "get_journal_pubs_info", legacy_rubrics, bulk_rubrics),
+]
+
+
+def measure(func, page, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(page)
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Compare per-locator and single-evaluate DOM extraction")
+    arg_parser.add_argument("--repeat", type=int, default=20)
+    args = arg_parser.parse_args()
+
+    with sync_playwright() as playwright:
+        browser = playwright.chromium.launch(headless=True)
+        page = browser.new_page()
+        print(f"{'extractor':<24}{'legacy, ms':>12}{'bulk, ms':>12}{'speedup':>10}")
+        for fixture, name, legacy, bulk in CASES:
+            page.set_content((FIXTURES_PATH / fixture).read_text(encoding="utf-8"))
+            if legacy(page) != bulk(page):
+                raise RuntimeError(f"{name}: legacy and bulk extraction results differ")
+
+            legacy_time = measure(legacy, page, args.repeat)
+            bulk_time = measure(bulk, page, args.repeat)
+            print(f"{name:<24}{legacy_time * 1000:>12.2f}{bulk_time * 1000:>12.2f}{legacy_time / bulk_time:>9.1f}x")
+        browser.close()
+
+
+if __name__ == "__main__":
+    main()
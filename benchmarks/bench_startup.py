@@ -0,0 +1,96 @@
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+
+from pathlib import Path
+from playwright.sync_api import sync_playwright
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from stand_in_server import StandInServer, generate_catalog
+from elib_http import USER_AGENT
+from journals_parser import make_stealth_config
+from page_pool import apply_stealth
+from session_store import SessionStore
+
+
+# Время до первой загруженной страницы: холодный запуск браузера на каждую смену прокси,
+# новый контекст в уже запущенном браузере и новый контекст с восстановленной сессией
+
+def first_page(context, url: str):
+    apply_stealth(context, make_stealth_config())
+    page = context.new_page()
+    page.goto(url, wait_until="domcontentloaded")
+    page.wait_for_selector("#titlename", state="attached")
+
+
+def bench_cold(playwright, url: str, runs: int):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        browser = playwright.chromium.launch(headless=True, args=["--disable-web-security"])
+        context = browser.new_context(ignore_https_errors=True, user_agent=USER_AGENT)
+        first_page(context, url)
+        timings.append(time.perf_counter() - start)
+        browser.close()
+    return timings
+
+
+def bench_swap(playwright, url: str, runs: int, sessions=None):
+    timings = []
+    browser = playwright.chromium.launch(headless=True, args=["--disable-web-security"])
+    try:
+        if sessions is not None:
+            # Сессия сохранена прошлым запуском
+            context = browser.new_context(ignore_https_errors=True, user_agent=USER_AGENT)
+            first_page(context, url)
+            sessions.save(context, None)
+            context.close()
+        for _ in range(runs):
+            start = time.perf_counter()
+            storage_state = sessions.load(None) if sessions is not None else None
+            context = browser.new_context(storage_state=storage_state, ignore_https_errors=True, user_agent=USER_AGENT)
+            first_page(context, url)
+            timings.append(time.perf_counter() - start)
+            if sessions is not None:
+                sessions.save(context, None)
+            context.close()
+    finally:
+        browser.close()
+    return timings
+
+
+def summary(timings):
+    return {"median_s": round(statistics.median(timings), 3), "max_s": round(max(timings), 3)}
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Browser startup benchmark: cold launch vs context swap")
+    arg_parser.add_argument("--runs", type=int, default=5)
+    arg_parser.add_argument("--latency", type=float, default=0.05)
+    arg_parser.add_argument("--challenge-latency", type=float, default=1.0,
+                            help="stand-in delay for requests without a session cookie")
+    args = arg_parser.parse_args()
+
+    server = StandInServer(generate_catalog(journals=1), latency=args.latency,
+                           challenge_latency=args.challenge_latency)
+    url = f"{server.start()}/titles.asp"
+    sessions = SessionStore(tempfile.mkdtemp(prefix="elib_sessions_"))
+    try:
+        with sync_playwright() as playwright:
+            report = {
+                "cold_launch": summary(bench_cold(playwright, url, args.runs)),
+                "context_swap": summary(bench_swap(playwright, url, args.runs)),
+                "context_swap_restored": summary(bench_swap(playwright, url, args.runs, sessions)),
+            }
+    finally:
+        server.stop()
+    report["challenges_served"] = server.stats()["challenges"]
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import tempfile
+import subprocess
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from stand_in_server import StandInServer, generate_catalog, write_inputs
+
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def check_dataset(state_path: str, catalog) -> dict:
+    with sqlite3.connect(state_path) as conn:
+        rows = conn.execute("SELECT COUNT(*) FROM articles").fetchone()[0]
+        counters_mismatch = conn.execute(
+            "SELECT COUNT(*) FROM rubrics r WHERE parsed != "
+            "(SELECT COUNT(*) FROM articles a WHERE a.issn = r.issn AND a.rubric = r.rubric)").fetchone()[0]
+        leases = dict(conn.execute("SELECT kind || ':' || status, COUNT(*) FROM leases GROUP BY 1").fetchall())
+        reclaimed = conn.execute("SELECT COUNT(*) FROM leases WHERE attempts > 1").fetchone()[0]
+    expected_rows = sum(len(ids) for journal in catalog for ids in journal.rubrics.values())
+    return {"rows": rows, "expected_rows": expected_rows, "counters_mismatch": counters_mismatch,
+            "leases": leases, "units_retried": reclaimed}
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Run several shard workers as local processes against the stand-in server")
+    arg_parser.add_argument("--workers", type=int, default=3)
+    arg_parser.add_argument("--journals", type=int, default=6)
+    arg_parser.add_argument("--articles", type=int, default=200)
+    arg_parser.add_argument("--latency", type=float, default=0.05)
+    arg_parser.add_argument("--error-rate", type=float, default=0.0)
+    arg_parser.add_argument("--lease-ttl", type=float, default=15.0)
+    arg_parser.add_argument("--kill-after", type=float, default=None,
+                            help="kill the first worker after N seconds to check lease reclaim")
+    args = arg_parser.parse_args()
+
+    catalog = generate_catalog(journals=args.journals, articles_per_journal=args.articles)
+    server = StandInServer(catalog, latency=args.latency, error_rate=args.error_rate)
+    base_url = server.start()
+
+    workdir = Path(tempfile.mkdtemp(prefix="elib_shards_"))
+    write_inputs(workdir / "data", catalog)
+    state_path = str(workdir / "data" / "crawl_state.sqlite")
+
+    start = time.perf_counter()
+    processes = []
+    for n in range(args.workers):
+        command = [sys.executable, str(ROOT / "shard_worker.py"), "all", "--db", state_path,
+                   "--worker-id", f"local-{n}", "--base-url", base_url, "--headless",
+                   "--lease-ttl", str(args.lease_ttl)]
+        processes.append(subprocess.Popen(command, cwd=workdir))
+
+    try:
+        if args.kill_after is not None:
+            time.sleep(args.kill_after)
+            if processes[0].poll() is None:
+                processes[0].kill()
+                print(f"Killed worker local-0 after {args.kill_after}s")
+        codes = [process.wait() for process in processes]
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.kill()
+        server.stop()
+
+    report = {"workers": args.workers, "exit_codes": codes, "elapsed_s": round(time.perf_counter() - start, 2),
+              "workdir": str(workdir), **check_dataset(state_path, catalog)}
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if report["rows"] != report["expected_rows"] or report["counters_mismatch"] != 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+import json
+import time
+import random
+import argparse
+import threading
+
+from pathlib import Path
+from html import escape
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from typing import List, Dict, Optional
+
+
+RESULTS_PER_PAGE = 20
+WORDS = ("модель анализ система развитие метод исследование оценка управление технология процесс "
+         "свойства структура влияние условия применение расчет синтез контроль динамика материал").split()
+SURNAMES = "Иванов Петров Смирнов Кузнецов Соколов Попов Лебедев Козлов Новиков Морозов Волков Зайцев".split()
+
+
+class SyntheticJournal():
+    def __init__(self, journal_id: int, issn: str, title: str, rubrics: Dict[str, List[int]], titles: Dict[int, str]):
+        self.journal_id = journal_id
+        self.issn = issn
+        self.title = title
+        self.rubrics = rubrics  # rubric -> id статей, новые первыми
+        self.titles = titles
+
+    def search(self, rubrics: List[str]) -> List[int]:
+        ids = set()
+        for rubric in rubrics:
+            ids.update(self.rubrics.get(rubric, []))
+        return sorted(ids, reverse=True)
+
+
+def generate_catalog(journals=10, rubrics_per_journal=4, articles_per_journal=300, seed=0) -> List[SyntheticJournal]:
+    rnd = random.Random(seed)
+    rubric_codes = [f"{code}0000" for code in range(20, 90, 3)]
+    catalog = []
+    for n in range(journals):
+        journal_id = 10000 + n
+        issn = f"{1000 + n:04d}-{rnd.randint(0, 9999):04d}"
+        title = " ".join(rnd.choice(WORDS) for _ in range(3)).capitalize()
+        codes = rnd.sample(rubric_codes, rubrics_per_journal)
+        rubrics = {code: [] for code in codes}
+        titles = {}
+        for k in range(articles_per_journal, 0, -1):
+            article_id = journal_id * 100000 + k
+            titles[article_id] = " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(4, 9))).upper()
+            # Часть статей относится сразу к нескольким рубрикам
+            for code in rnd.sample(codes, 1 if rnd.random() < 0.7 else 2):
+                rubrics[code].append(article_id)
+        catalog.append(SyntheticJournal(journal_id, issn, title, rubrics, titles))
+    return catalog
+
+
+def write_inputs(data_path: Path, catalog: List[SyntheticJournal]):
+    # Входные файлы пайплайна: issn_codes.json, пустой issn_links.json и interrest_cats.json
+    data_path.mkdir(parents=True, exist_ok=True)
+    with open(data_path / "issn_codes.json", 'w') as fp:
+        json.dump({journal.title: [journal.issn] for journal in catalog}, fp, ensure_ascii=False)
+    with open(data_path / "issn_links.json", 'w') as fp:
+        json.dump({}, fp)
+    codes = sorted({code for journal in catalog for code in journal.rubrics})
+    with open(data_path / "interrest_cats.json", 'w') as fp:
+        json.dump(codes, fp)
+
+
+PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{title}</title>
+<script>{script}</script></head>
+<body>{body}</body></html>
+"""
+
+JOURNAL_SCRIPT = """
+var journalId = {journal_id};
+var currentRubrics = "{current}";
+var selected = new Set();
+function toggle_rubrics() {{
+    var table = document.getElementById("rubrics_table");
+    table.style.display = table.style.display == "none" ? "" : "none";
+}}
+function select_option(kind, id) {{
+    if (selected.has(id)) selected.delete(id); else selected.add(id);
+    document.getElementById("rubric_" + id).style.background = selected.has(id) ? "#ccc" : "";
+}}
+function deselect_options(kind) {{
+    selected.forEach(function(id) {{ document.getElementById("rubric_" + id).style.background = ""; }});
+    selected.clear();
+}}
+function pub_search() {{
+    location.href = "title_items.asp?id=" + journalId + "&rubrics=" + Array.from(selected).join(",") + "&pagenum=1";
+}}
+function goto_page(num) {{
+    location.href = "title_items.asp?id=" + journalId + "&rubrics=" + currentRubrics + "&pagenum=" + num;
+}}
+"""
+
+TITLES_SCRIPT = """
+function title_search() {
+    location.href = "titles.asp?titlename=" + encodeURIComponent(document.getElementById("titlename").value);
+}
+"""
+
+FAULT_PAGES = {
+    "captcha": '<form action="page_captcha.asp" method="post">'
+               '<iframe title="reCAPTCHA" src="about:blank" width="300" height="80"></iframe></form>',
+    "blocked": '<div id="blockedip">Доступ с анонимных IP-адресов ограничен</div>',
+    "error": "<h1>Server Error</h1><p>500 - Internal server error.</p>",
+}
+
+
+class StandInServer():
+    def __init__(self, catalog: List[SyntheticJournal], latency=0.0, captcha_rate=0.0, blocked_rate=0.0,
+                 error_rate=0.0, seed=0, host="127.0.0.1", port=0, challenge_latency=0.0):
+        self.catalog = catalog
+        self.by_id = {journal.journal_id: journal for journal in catalog}
+        self.by_issn = {journal.issn: journal for journal in catalog}
+        self.latency = latency
+        # Запрос без cookie сессии проходит "проверку" с дополнительной задержкой, как антибот-защита
+        self.challenge_latency = challenge_latency
+        self.fault_rates = {"captcha": captcha_rate, "blocked": blocked_rate, "error": error_rate}
+        self.rnd = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counters = {"pages": 0, "captcha": 0, "blocked": 0, "error": 0, "not_found": 0, "challenges": 0}
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> str:
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self.base_url
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return dict(self.counters)
+
+    def _count(self, key: str):
+        with self.lock:
+            self.counters[key] += 1
+
+    def _pick_fault(self) -> Optional[str]:
+        with self.lock:
+            roll = self.rnd.random()
+        for kind, rate in self.fault_rates.items():
+            if roll < rate:
+                return kind
+            roll -= rate
+        return None
+
+    def render(self, path: str, query: Dict) -> Optional[str]:
+        if path == "/titles.asp":
+            return self.render_titles(query.get("titlename", [""])[0])
+        if path == "/title_items_rubrics.asp":
+            return self.render_rubrics(int(query.get("id", ["0"])[0]))
+        if path == "/title_items.asp":
+            rubrics = [r for r in query.get("rubrics", [""])[0].split(",") if r]
+            return self.render_journal(int(query.get("id", ["0"])[0]), rubrics, int(query.get("pagenum", ["1"])[0]))
+        if path == "/item.asp":
+            return self.render_item(int(query.get("id", ["0"])[0]))
+        return None
+
+    def render_titles(self, titlename: str) -> str:
+        body = [f'<input type="text" id="titlename" name="titlename" value="{escape(titlename)}">',
+                '<div onclick="title_search()" style="cursor:pointer">Поиск</div>']
+        if titlename:
+            journal = self.by_issn.get(titlename.strip())
+            if journal is None:
+                body.append('<table><tr><td class="redref">Не найдено журналов, '
+                            'соответствующих параметрам запроса</td></tr></table>')
+            else:
+                body.append(f'<table id="restab"><tr><td bgcolor="#dddddd">Найдено журналов: 1</td></tr>'
+                            f'<tr><td><a href="title_about_new.asp?id={journal.journal_id}"><b>{escape(journal.title.upper())}</b></a></td>'
+                            f'<td><a href="title_items.asp?id={journal.journal_id}" title="Список выпусков">Выпуски</a></td></tr></table>')
+        return PAGE.format(title="Каталог журналов", script=TITLES_SCRIPT, body="\n".join(body))
+
+    def rubric_rows(self, journal: SyntheticJournal) -> str:
+        return "\n".join(f'<tr id="rubric_{code}" onclick="select_option(\'rubric\', \'{code}\')">'
+                         f'<td><input type="checkbox"></td><td>Рубрика {code} ({len(ids)})</td></tr>'
+                         for code, ids in journal.rubrics.items())
+
+    def render_rubrics(self, journal_id: int) -> Optional[str]:
+        journal = self.by_id.get(journal_id)
+        if journal is None:
+            return None
+        body = f'<table id="rubrics_table"><tr><td colspan="2">Тематические рубрики</td></tr>\n{self.rubric_rows(journal)}</table>'
+        return PAGE.format(title="Рубрики", script="", body=body)
+
+    def render_journal(self, journal_id: int, rubrics: List[str], pagenum: int) -> Optional[str]:
+        journal = self.by_id.get(journal_id)
+        if journal is None:
+            return None
+        script = JOURNAL_SCRIPT.format(journal_id=journal_id, current=",".join(rubrics))
+        body = [f'<h2>{escape(journal.title)}</h2>',
+                '<div id="hdr_rubrics" onclick="toggle_rubrics()" style="cursor:pointer">Тематические рубрики</div>',
+                f'<table id="rubrics_table" style="display:none">\n{self.rubric_rows(journal)}</table>',
+                '<div onclick="pub_search()" style="cursor:pointer">Поиск</div>',
+                f'<table><tr><td id="rubricsheader">Тематические рубрики (выделено: {len(rubrics)})</td></tr></table>']
+
+        ids = journal.search(rubrics) if rubrics else sorted(journal.titles, reverse=True)
+        page_ids = ids[(pagenum - 1) * RESULTS_PER_PAGE:pagenum * RESULTS_PER_PAGE]
+        rows = [f'<tr><td colspan="3" bgcolor="#dddddd">Найдено {len(ids)} публикаций</td></tr>']
+        for n, article_id in enumerate(page_ids, start=(pagenum - 1) * RESULTS_PER_PAGE + 1):
+            rows.append(f'<tr id="arw{article_id}"><td>{n}.</td><td><a href="/item.asp?id={article_id}">'
+                        f'<b><span>{escape(journal.titles[article_id])}</span></b></a><br>'
+                        f'<font color="#00008f"><i>Иванов И.И.</i></font></td><td></td></tr>')
+        body.append(f'<table id="restab">{"".join(rows)}</table>')
+
+        if pagenum * RESULTS_PER_PAGE < len(ids):
+            body.append(f'<table><tr><td class="mouse-hovergr"><a href="javascript:goto_page({pagenum + 1})" '
+                        f'title="Следующая страница">&gt;</a></td></tr></table>')
+        return PAGE.format(title=escape(journal.title), script=script, body="\n".join(body))
+
+    def render_item(self, article_id: int) -> Optional[str]:
+        journal = self.by_id.get(article_id // 100000)
+        if journal is None or article_id not in journal.titles:
+            return None
+        # Детали статьи генерируются из ее id, чтобы повторные запросы давали ту же страницу
+        rnd = random.Random(article_id)
+        title = journal.titles[article_id]
+        authors = [f"{rnd.choice(SURNAMES)} {rnd.choice('АБВГДЕИКЛМНОПС')}.{rnd.choice('АБВГДЕИКЛМНОПС')}."
+                   for _ in range(rnd.randint(1, 4))]
+        year = 2024 - (journal.journal_id * 100000 + len(journal.titles) - article_id) * 10 // len(journal.titles)
+        doi = f"10.{journal.journal_id}/{article_id}" if rnd.random() < 0.7 else None
+        keywords = list(dict.fromkeys(rnd.choice(WORDS) for _ in range(rnd.randint(2, 6))))
+        abstract = " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(20, 60))).capitalize() + "."
+        # Коды ГРНТИ статьи начинаются с кодов рубрик журнала, в которые она входит
+        grnti = [f"{code[:2]}.{rnd.randint(1, 99):02d}.{rnd.randint(1, 99):02d}"
+                 for code, ids in journal.rubrics.items() if article_id in ids]
+
+        meta = [f'<meta name="citation_title" content="{escape(title)}">']
+        meta += [f'<meta name="citation_author" content="{escape(author)}">' for author in authors]
+        meta.append(f'<meta name="citation_publication_date" content="{year}">')
+        if doi is not None:
+            meta.append(f'<meta name="citation_doi" content="{doi}">')
+        body = [f'<p class="bigtext">{escape(title)}</p>',
+                "".join(f'<span style="white-space: nowrap"><b>{escape(author)}</b></span> ' for author in authors),
+                f'<table><tr><td>Журнал: <a href="title_about_new.asp?id={journal.journal_id}">{escape(journal.title)}</a></td></tr>'
+                f'<tr><td>Год: <font color="#00008f">{year}</font></td></tr>'
+                f'<tr><td>Код ГРНТИ: <font color="#00008f">{"; ".join(grnti)}</font></td></tr></table>']
+        if doi is not None:
+            body.append(f'<div>DOI: <a href="https://doi.org/{doi}">{doi}</a></div>')
+        body.append("<div>Ключевые слова: " + ", ".join(f'<a href="keyword_items.asp?id={WORDS.index(word)}">{word.upper()}</a>'
+                                                        for word in keywords) + "</div>")
+        body.append(f'<div id="abstract1"><p align="justify">{escape(abstract)}</p></div>')
+        page = PAGE.format(title=escape(title), script="", body="\n".join(body))
+        return page.replace('<meta charset="utf-8">', '<meta charset="utf-8">' + "".join(meta), 1)
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                if server.latency:
+                    time.sleep(server.latency)
+                new_session = server.challenge_latency and "elib_session=" not in self.headers.get("Cookie", "")
+                if new_session:
+                    server._count("challenges")
+                    time.sleep(server.challenge_latency)
+
+                html = server.render(url.path, parse_qs(url.query))
+                status = 200
+                if html is None:
+                    server._count("not_found")
+                    html, status = "<h1>Not Found</h1>", 404
+                else:
+                    fault = server._pick_fault()
+                    if fault is not None:
+                        server._count(fault)
+                        html = PAGE.format(title="elibrary", script="", body=FAULT_PAGES[fault])
+                        status = 500 if fault == "error" else 200
+                    else:
+                        server._count("pages")
+
+                data = html.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                if new_session:
+                    self.send_header("Set-Cookie", "elib_session=1; Path=/; Max-Age=86400")
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Local elibrary stand-in server")
+    arg_parser.add_argument("--port", type=int, default=8080)
+    arg_parser.add_argument("--journals", type=int, default=10)
+    arg_parser.add_argument("--articles", type=int, default=300)
+    arg_parser.add_argument("--latency", type=float, default=0.0)
+    arg_parser.add_argument("--captcha-rate", type=float, default=0.0)
+    arg_parser.add_argument("--blocked-rate", type=float, default=0.0)
+    arg_parser.add_argument("--error-rate", type=float, default=0.0)
+    arg_parser.add_argument("--challenge-latency", type=float, default=0.0,
+                            help="extra delay for requests without a session cookie")
+    arg_parser.add_argument("--write-inputs", default=None, help="directory for issn_codes.json and friends")
+    args = arg_parser.parse_args()
+
+    catalog = generate_catalog(journals=args.journals, articles_per_journal=args.articles)
+    if args.write_inputs:
+        write_inputs(Path(args.write_inputs), catalog)
+    server = StandInServer(catalog, latency=args.latency, captcha_rate=args.captcha_rate,
+                           blocked_rate=args.blocked_rate, error_rate=args.error_rate, port=args.port,
+                           challenge_latency=args.challenge_latency)
+    print(f"Serving {len(catalog)} journals at {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import logging
+import weakref
+
+from typing import Dict, Optional, Tuple
+
+from metrics import METRICS
+
+
+BLOCK_STATUS_CODES = {403, 429}
+ERROR_STATUS_CODES = {500, 502, 503, 504}
+BLOCK_REDIRECT_PATTERNS = ("blockedip", "captcha", "ip_restricted", "page_error.asp")
+
+# Порядок важен: страница капчи часто содержит и текст про ограничение доступа.
+# Капча определяется по форме страницы page_captcha.asp: виджет reCAPTCHA (g-recaptcha, iframe)
+# бывает и на обычных страницах с формами входа и обратной связи
+BODY_SIGNATURES = (
+    ("captcha", 'action="page_captcha.asp"'),
+    ("captcha", 'action="/page_captcha.asp"'),
+    ("block", 'id="blockedip"'),
+    ("block", "id=blockedip"),
+    ("error", "<h1>Server Error"),
+)
+
+# Вместо заблокированной страницы браузер получает заглушку с той же разметкой, что у оригинала:
+# ожидание селектора завершается сразу, картинки и скрипты исходной страницы не грузятся
+STUB_PAGES = {
+    "captcha": '<form action="page_captcha.asp"></form>',
+    "block": '<div id="blockedip">blocked</div>',
+    "error": "<h1>Server Error</h1>",
+}
+
+# Для переходов, которые не прошли через перехват, проверка в DOM выполняется одним вызовом
+PAGE_ERROR_JS = """
+() => {
+    if (document.querySelector("form[action*='page_captcha.asp']")) return "captcha";
+    if (document.querySelector("div#blockedip")) return "block";
+    const header = document.querySelector("h1");
+    if (header && header.textContent.includes("Server Error")) return "error";
+    return null;
+}
+"""
+
+
+def classify_response(status: int, location: Optional[str], body: str) -> Optional[Tuple[str, str]]:
+    if status in BLOCK_STATUS_CODES:
+        return "block", f"status {status}"
+    if 300 <= status < 400 and location:
+        for pattern in BLOCK_REDIRECT_PATTERNS:
+            if pattern in location.lower():
+                return "block", f"redirect to {location}"
+        return None
+    for kind, signature in BODY_SIGNATURES:
+        if signature in body:
+            return kind, f"signature {signature}"
+    if status in ERROR_STATUS_CODES:
+        return "error", f"status {status}"
+    return None
+
+
+class BlockDetector():
+    # Главный документ каждой навигации проверяется в перехватчике запросов до отрисовки,
+    # результат запоминается для страницы и проверяется парсером без обращения к DOM
+    def __init__(self, proxy_label=lambda: "direct"):
+        self.proxy_label = proxy_label
+        self.verdicts = weakref.WeakKeyDictionary()
+
+    def inspect(self, page, status: int, headers: Dict, body: str) -> Optional[Tuple[str, str]]:
+        verdict = classify_response(status, headers.get("location"), body)
+        if page is not None:
+            self.verdicts[page] = verdict
+        if verdict is not None:
+            kind, reason = verdict
+            METRICS.inc("responses_classified_total", kind=kind, proxy=self.proxy_label())
+            logging.info(f"Navigation classified as {kind}: {reason}")
+        return verdict
+
+    def check(self, page) -> Optional[str]:
+        if page in self.verdicts:
+            verdict = self.verdicts[page]
+            return verdict[0] if verdict is not None else None
+        return page.evaluate(PAGE_ERROR_JS)
+
+    async def check_async(self, page) -> Optional[str]:
+        if page in self.verdicts:
+            verdict = self.verdicts[page]
+            return verdict[0] if verdict is not None else None
+        return await page.evaluate(PAGE_ERROR_JS)
+
+    def handle(self, route, request) -> bool:
+        # True, если навигация обработана здесь (ответ отдан из перехватчика)
+        if request.frame.parent_frame is not None:
+            return False
+        try:
+            response = route.fetch(max_redirects=0)
+            body = response.text() if not 300 <= response.status < 400 else ""
+        except Exception as e:
+            # Сетевая ошибка прокси: навигация сразу завершается ошибкой, а не ждет таймаута
+            logging.error(f"Navigation fetch failed: {e}")
+            route.abort()
+            return True
+        verdict = self.inspect(request.frame.page, response.status, response.headers, body)
+        if verdict is None:
+            route.fulfill(response=response)
+        else:
+            route.fulfill(status=200, content_type="text/html; charset=utf-8",
+                          body=f"<html><body>{STUB_PAGES[verdict[0]]}</body></html>")
+        return True
+
+    async def handle_async(self, route, request) -> bool:
+        if request.frame.parent_frame is not None:
+            return False
+        try:
+            response = await route.fetch(max_redirects=0)
+            body = await response.text() if not 300 <= response.status < 400 else ""
+        except Exception as e:
+            logging.error(f"Navigation fetch failed: {e}")
+            await route.abort()
+            return True
+        verdict = self.inspect(request.frame.page, response.status, response.headers, body)
+        if verdict is None:
+            await route.fulfill(response=response)
+        else:
+            await route.fulfill(status=200, content_type="text/html; charset=utf-8",
+                                body=f"<html><body>{STUB_PAGES[verdict[0]]}</body></html>")
+        return True
@@ -0,0 +1,212 @@
+import os
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import logging
+import argparse
+import threading
+
+from tqdm import tqdm
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+from typing import Dict, Iterator, Optional, Tuple
+
+from elib_http import parse_result_rows_html, parse_rubrics_html, parse_journal_links_html
+from state_store import CrawlStateStore
+
+
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS blobs_last_access ON blobs (last_access);
+CREATE TABLE IF NOT EXISTS captures (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    page_type TEXT NOT NULL,
+    meta TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    captured_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS captures_digest ON captures (digest);
+"""
+
+
+def capture_key(url: str, query: str = "", page_num: int = 0) -> str:
+    # Страницы выдачи листаются формой, поэтому кроме URL в ключ входят параметры поиска и номер страницы
+    return f"{url}|{query}|{page_num}"
+
+
+class CaptureCache():
+    # HTML загруженных страниц хранится сжатым и адресуется по хэшу содержимого: одинаковые
+    # страницы лежат на диске один раз. Индекс ключ -> хэш в SQLite, при превышении
+    # max_bytes удаляются давно не использованные страницы
+    def __init__(self, path="./data/capture", max_bytes=2 * 1024 ** 3, level=6):
+        self.path = Path(path)
+        self.objects_path = self.path / "objects"
+        self.objects_path.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.level = level
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.path / "index.sqlite"), isolation_level=None, timeout=30,
+                                    check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(INDEX_SCHEMA)
+        # Размер кэша считается один раз при открытии и дальше ведется при записи и вытеснении
+        self._total_bytes = self.total_bytes()
+
+    def blob_path(self, digest: str) -> Path:
+        return self.objects_path / digest[:2] / f"{digest}.html.z"
+
+    def put(self, key: str, url: str, page_type: str, html: str, meta: Optional[Dict] = None) -> str:
+        data = html.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.blob_path(digest)
+        now = time.time()
+        with self._lock:
+            if not path.exists():
+                path.parent.mkdir(exist_ok=True)
+                tmp_path = path.with_suffix(".tmp")
+                tmp_path.write_bytes(zlib.compress(data, self.level))
+                tmp_path.replace(path)
+            size = path.stat().st_size
+            self.conn.execute("BEGIN IMMEDIATE")
+            before = self.conn.total_changes
+            self.conn.execute("INSERT OR IGNORE INTO blobs (digest, size, last_access) VALUES (?, ?, ?)",
+                              (digest, size, now))
+            if self.conn.total_changes != before:
+                self._total_bytes += size
+            else:
+                self.conn.execute("UPDATE blobs SET last_access = ? WHERE digest = ?", (now, digest))
+            self.conn.execute("INSERT OR REPLACE INTO captures (key, url, page_type, meta, digest, captured_at) "
+                              "VALUES (?, ?, ?, ?, ?, ?)",
+                              (key, url, page_type, json.dumps(meta or {}, ensure_ascii=False), digest, now))
+            self.conn.execute("COMMIT")
+            self._evict()
+        return digest
+
+    def get(self, key: str) -> Optional[str]:
+        row = self.conn.execute("SELECT digest FROM captures WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        html = self.read_blob(row[0])
+        if html is not None:
+            with self._lock:
+                self.conn.execute("UPDATE blobs SET last_access = ? WHERE digest = ?", (time.time(), row[0]))
+        return html
+
+    def read_blob(self, digest: str) -> Optional[str]:
+        try:
+            return zlib.decompress(self.blob_path(digest).read_bytes()).decode("utf-8")
+        except FileNotFoundError:
+            return None
+
+    def iter_captures(self, page_type: Optional[str] = None) -> Iterator[Tuple[str, str, str, Dict, str]]:
+        query = "SELECT key, url, page_type, meta, digest FROM captures"
+        params = ()
+        if page_type is not None:
+            query += " WHERE page_type = ?"
+            params = (page_type,)
+        for key, url, page_type, meta, digest in self.conn.execute(query + " ORDER BY captured_at", params).fetchall():
+            yield key, url, page_type, json.loads(meta), digest
+
+    def total_bytes(self) -> int:
+        return self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+
+    def _evict(self):
+        if self._total_bytes <= self.max_bytes:
+            return
+        total = self.total_bytes()
+        # Освобождается место с запасом, чтобы не вытеснять по одной странице на каждую запись
+        target = self.max_bytes * 0.9
+        evicted = 0
+        for digest, size in self.conn.execute("SELECT digest, size FROM blobs ORDER BY last_access").fetchall():
+            if total <= target:
+                break
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.execute("DELETE FROM captures WHERE digest = ?", (digest,))
+            self.conn.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+            self.conn.execute("COMMIT")
+            self.blob_path(digest).unlink(missing_ok=True)
+            total -= size
+            evicted += 1
+        self._total_bytes = total
+        logging.info(f"Capture cache: evicted {evicted} pages, {total / 1024 / 1024:.1f} MB left")
+
+    def stats(self) -> Dict:
+        by_type = dict(self.conn.execute("SELECT page_type, COUNT(*) FROM captures GROUP BY page_type").fetchall())
+        blobs = self.conn.execute("SELECT COUNT(*) FROM blobs").fetchone()[0]
+        return {"captures": by_type, "blobs": blobs, "mb": round(self._total_bytes / 1024 / 1024, 1)}
+
+    def close(self):
+        self.conn.close()
+
+
+def reparse_capture(args: Tuple[str, str, Dict, str]) -> Dict:
+    # Выполняется в отдельном процессе: те же извлечения, что в парсере, но по сохраненному HTML
+    page_type, path, meta, key = args
+    try:
+        html = zlib.decompress(Path(path).read_bytes()).decode("utf-8")
+    except FileNotFoundError:
+        return {"key": key, "page_type": page_type, "meta": meta, "error": "evicted"}
+    if page_type in ("results", "union"):
+        data = parse_result_rows_html(html)
+    elif page_type == "rubrics":
+        data = parse_rubrics_html(html)
+    else:
+        data = parse_journal_links_html(html)
+    return {"key": key, "page_type": page_type, "meta": meta, "data": data}
+
+
+def reparse(cache: CaptureCache, output_path: str, page_type: Optional[str] = None,
+            workers: Optional[int] = None, state: Optional[CrawlStateStore] = None) -> int:
+    tasks = [(page_type, str(cache.blob_path(digest)), meta, key)
+             for key, _, page_type, meta, digest in cache.iter_captures(page_type)]
+    written = 0
+    touched = set()
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, 'w', encoding="utf-8") as fp, ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        for record in tqdm(executor.map(reparse_capture, tasks, chunksize=64), total=len(tasks)):
+            fp.write(json.dumps(record, ensure_ascii=False) + "\n")
+            written += 1
+            if state is not None and record["page_type"] == "results" and "data" in record:
+                meta = record["meta"]
+                state.add_articles(meta["issn"], meta["rubric"], record["data"])
+                touched.add(meta["issn"])
+    Path(tmp_path).replace(output_path)
+    for issn in touched:
+        state.update_journal(issn)
+    return written
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Captured HTML cache: stats and offline re-parse")
+    arg_parser.add_argument("command", choices=["reparse", "stats"])
+    arg_parser.add_argument("--cache", default="./data/capture")
+    arg_parser.add_argument("--page-type", choices=["results", "union", "rubrics", "titles"], default=None)
+    arg_parser.add_argument("--output", default="./data/reparsed.jsonl")
+    arg_parser.add_argument("--workers", type=int, default=None)
+    arg_parser.add_argument("--apply-state", default=None, metavar="DB",
+                            help="add re-parsed result rows to this crawl state database")
+    args = arg_parser.parse_args()
+
+    cache = CaptureCache(args.cache)
+    try:
+        if args.command == "reparse":
+            state = CrawlStateStore(args.apply_state) if args.apply_state else None
+            print(f"Re-parsed {reparse(cache, args.output, args.page_type, args.workers, state)} pages")
+            if state is not None:
+                state.close()
+        print(json.dumps(cache.stats(), ensure_ascii=False))
+    finally:
+        cache.close()
+
+
+if __name__ == "__main__":
+    main()
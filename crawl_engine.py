@@ -0,0 +1,385 @@
+import time
+import asyncio
+import logging
+import argparse
+
+from pathlib import Path
+from playwright.async_api import async_playwright
+from playwright.async_api._generated import Page, BrowserContext
+
+from typing import List, Dict, Optional
+
+from elib_http import USER_AGENT
+from journals_parser import make_stealth_config, read_json, failure_kind, record_failure, raise_for_kind
+from block_detector import BlockDetector
+from session_store import SessionStore
+from proxy_pool import ProxyPool
+from state_store import CrawlStateStore, RESULTS_PER_PAGE
+from resource_filter import ResourceFilter, wait_selector, page_type
+from metrics import METRICS
+from scheduler import Scheduler
+from extractors import RESULT_ROWS_JS, result_rows_to_links
+
+
+class CrawlJob():
+    def __init__(self, issn: str, url: str, rubric: str, amount: int,
+                 first_page: Optional[int] = None, last_page: Optional[int] = None):
+        self.issn = issn
+        self.url = url
+        self.rubric = rubric
+        self.amount = amount
+        # Диапазон страниц большой рубрики; None - рубрика целиком
+        self.first_page = first_page
+        self.last_page = last_page
+        self.attempts = 0
+
+    def __repr__(self):
+        pages = f", pages={self.first_page}-{self.last_page or ''}" if self.first_page is not None else ""
+        return f"CrawlJob({self.issn}, rubric={self.rubric}{pages}, attempts={self.attempts})"
+
+
+async def check_server_err(page: Page, detector: BlockDetector):
+    raise_for_kind(await detector.check_async(page))
+
+
+async def select_category(page: Page, category: str, detector: BlockDetector) -> bool:
+    await page.wait_for_selector("#hdr_rubrics", state="attached")
+    await page.locator("#hdr_rubrics").click()
+    await check_server_err(page, detector)
+
+    await page.wait_for_selector("#rubrics_table", state="attached")
+    rubric_row = page.locator("#rubrics_table").locator(f"#rubric_{category}")
+    if not await rubric_row.is_visible():
+        return False
+
+    await page.evaluate('deselect_options("rubric");')
+    await rubric_row.click()
+    async with page.expect_navigation(wait_until="domcontentloaded"):
+        await page.locator("[onclick='pub_search()']").click()
+    await check_server_err(page, detector)
+    return True
+
+
+async def parse_links_from_table(page: Page, state: CrawlStateStore, issn: str, rubric: str,
+                                 scheduler: Scheduler, detector: BlockDetector, proxy: Optional[Dict] = None,
+                                 first_page: Optional[int] = None, last_page: Optional[int] = None):
+    await page.locator("table#restab").wait_for(state="visible")
+    if first_page is None:
+        page_num = state.last_page(issn, rubric) + 1
+    else:
+        # Диапазон продолжается со своей отметки, остальные диапазоны рубрики ее не двигают
+        page_num = state.range_next_page(issn, rubric, first_page)
+        if last_page is not None and page_num > last_page:
+            state.finish_range(issn, rubric, first_page)
+            return
+
+    if page_num != 1:
+        await scheduler.wait_async(proxy)
+        async with page.expect_navigation(wait_until="domcontentloaded"):
+            await page.evaluate(f'goto_page({page_num});')
+
+    while True:
+        await check_server_err(page, detector)
+        table = page.locator("table#restab")
+        await table.wait_for(state="visible")
+
+        if not await page.locator("#rubricsheader:has-text('(выделено: 1)')").is_visible():
+            raise RuntimeError("Categoty selection dropped")
+
+        start = time.monotonic()
+        rows = result_rows_to_links(await table.evaluate(RESULT_ROWS_JS))
+        METRICS.observe("extract_seconds", time.monotonic() - start, table="results")
+        inserted = state.complete_page(issn, rubric, page_num, rows, first_page)
+        METRICS.inc("pages_total", page_type="results")
+        METRICS.inc("rows_total", inserted)
+        METRICS.inc("rows_seen_total", len(rows))
+
+        next_page_button = page.locator("td.mouse-hovergr a[title='Следующая страница']")
+        if last_page is not None and page_num >= last_page:
+            break
+        if await next_page_button.is_visible():
+            await scheduler.wait_async(proxy)
+            start = time.monotonic()
+            async with page.expect_navigation(wait_until="domcontentloaded"):
+                await next_page_button.click()
+            scheduler.on_success(proxy, time.monotonic() - start)
+            page_num += 1
+        else:
+            break
+    if first_page is not None:
+        state.finish_range(issn, rubric, first_page)
+
+
+class CrawlWorker():
+    def __init__(self, engine: "AsyncCrawlEngine", worker_id: int):
+        self.engine = engine
+        self.worker_id = worker_id
+        self.context: Optional[BrowserContext] = None
+        self.proxy = None
+        self.failures = 0
+        self.navigations = 0
+        self.block_detector = BlockDetector(proxy_label=lambda: self.proxy["server"] if self.proxy else "direct")
+
+    async def restart_context(self, kind: Optional[str] = None, keep_proxy=False):
+        await self.close_context(kind)
+        if not keep_proxy:
+            # Старый прокси возвращается в пул внутри swap_proxy: если нового не будет, освобождать нечего
+            released, self.proxy = self.proxy, None
+            self.proxy = await self.engine.swap_proxy(released, kind)
+        with METRICS.timer("context_start_seconds"):
+            self.context = await self.engine.browser.new_context(proxy=self.proxy,
+                                                                 storage_state=self.engine.sessions.load(self.proxy),
+                                                                 ignore_https_errors=True,
+                                                                 user_agent=USER_AGENT)
+            for script in make_stealth_config().enabled_scripts:
+                await self.context.add_init_script(script)
+            await self.engine.resource_filter.install_async(self.context, self.block_detector)
+        METRICS.inc("context_starts_total")
+        self.navigations = 0
+
+    async def close_context(self, kind: Optional[str] = None):
+        if self.context is None:
+            return
+        if kind in ("block", "captcha"):
+            self.engine.sessions.discard(self.proxy)
+        else:
+            await self.engine.sessions.save_async(self.context, self.proxy)
+        try:
+            await self.context.close()
+        except Exception as e:
+            logging.error(f"Worker {self.worker_id}: error while closing context: {e}")
+        self.context = None
+
+    async def open_url(self, url: str) -> Page:
+        if self.navigations >= self.engine.max_navigations:
+            # Контекст пересоздается с тем же прокси, чтобы не копить память вкладок
+            logging.info(f"Worker {self.worker_id}: recycle context after {self.navigations} navigations")
+            await self.restart_context(keep_proxy=True)
+        self.navigations += 1
+        page = await self.context.new_page()
+        try:
+            await self.engine.scheduler.wait_async(self.proxy)
+            start = self.engine.resource_filter.navigation_started()
+            await page.goto(url, wait_until="domcontentloaded")
+            selector = wait_selector(url)
+            if selector is not None:
+                await page.wait_for_selector(selector, state="attached", timeout=20000)
+            await check_server_err(page, self.block_detector)
+            self.engine.resource_filter.navigation_finished(url, start)
+            METRICS.observe("navigation_seconds", time.monotonic() - start, page_type=page_type(url))
+            METRICS.inc("pages_total", page_type=page_type(url))
+            latency = time.monotonic() - start
+            self.engine.scheduler.on_success(self.proxy, latency)
+            if self.engine.proxy_pool is not None:
+                self.engine.proxy_pool.report_success(self.proxy, latency)
+        except Exception:
+            await page.close()
+            raise
+        return page
+
+    async def crawl(self, job: CrawlJob):
+        page = await self.open_url(job.url)
+        try:
+            start = time.monotonic()
+            selected = await select_category(page, job.rubric, self.block_detector)
+            METRICS.observe("select_category_seconds", time.monotonic() - start)
+            if not selected:
+                logging.info(f"Worker {self.worker_id}: rubric {job.rubric} not found in {job.issn}, skip")
+                return
+
+            await parse_links_from_table(page, self.engine.state, job.issn, job.rubric,
+                                         self.engine.scheduler, self.block_detector, self.proxy,
+                                         job.first_page, job.last_page)
+        finally:
+            await page.close()
+
+    async def run(self, queue: asyncio.Queue):
+        try:
+            await self.restart_context()
+        except Exception as e:
+            logging.error(f"Worker {self.worker_id} cant start context: {e}")
+        try:
+            while True:
+                try:
+                    job = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+
+                try:
+                    if self.context is None:
+                        # Контекст не создать (например, прокси закончились): задача без попытки
+                        # возвращается в очередь другим воркерам, этот воркер останавливается
+                        queue.put_nowait(job)
+                        break
+                    await self.crawl(job)
+                    self.failures = 0
+                    self.engine.job_finished(job)
+                except Exception as e:
+                    # Ошибка изолирована внутри воркера: задача возвращается в очередь,
+                    # а воркер пересоздает свой контекст со следующим прокси
+                    job.attempts += 1
+                    self.failures += 1
+                    self.engine.retries += 1
+                    record_failure("crawl_job", e, self.proxy)
+                    self.engine.scheduler.on_failure(self.proxy, failure_kind(e))
+                    logging.error(f"Worker {self.worker_id} failed on {job} with proxy {self.proxy}: {e}")
+                    if job.attempts < self.engine.max_job_attempts:
+                        queue.put_nowait(job)
+                    else:
+                        logging.error(f"Max attempts reached for {job}, give up")
+                        self.engine.job_finished(job)
+                    delay = self.engine.scheduler.backoff(self.failures - 1)
+                    METRICS.inc("sleep_seconds_total", delay, reason="retry_backoff")
+                    await asyncio.sleep(delay)
+                    try:
+                        await self.restart_context(failure_kind(e))
+                    except Exception as e:
+                        logging.error(f"Worker {self.worker_id} cant restart context, stopping: {e}")
+                        break
+                finally:
+                    queue.task_done()
+        finally:
+            await self.close_context()
+            if self.engine.proxy_pool is not None and self.proxy is not None:
+                self.engine.proxy_pool.release(self.proxy)
+                self.proxy = None
+
+
+class AsyncCrawlEngine():
+    def __init__(self, proxy_pool: Optional[ProxyPool] = None, concurrency=4, headless_mode=True,
+                 max_job_attempts=10, rate=0.5, backoff=5.0, max_navigations=300,
+                 state_path="./data/crawl_state.sqlite", split_pages=40, range_pages=20):
+        self.proxy_pool = proxy_pool
+        self.concurrency = concurrency
+        self.headless_mode = headless_mode
+        self.max_job_attempts = max_job_attempts
+        # Темп общий для всех воркеров и отдельный для каждого прокси, подстраивается по ответам
+        self.scheduler = Scheduler(proxy_rate=rate, global_rate=rate * concurrency,
+                                   base_backoff=backoff, max_backoff=60.0)
+        self.max_navigations = max_navigations
+        # Рубрики от split_pages страниц обходятся параллельно диапазонами по range_pages страниц
+        self.split_pages = split_pages
+        self.range_pages = range_pages
+        self.resource_filter = ResourceFilter()
+        self.sessions = SessionStore()
+        self.browser = None
+        self.base_url = 'https://www.elibrary.ru'
+        self.issn_links_path = "./data/issn_links.json"
+        self.journals_path = Path("data/journals")
+        self.state = CrawlStateStore(state_path)
+        self.proxy_stats_path = "./data/proxy_stats.json"
+        self._pending = {}
+        self.retries = 0
+
+    async def swap_proxy(self, proxy: Optional[Dict], kind: Optional[str]) -> Optional[Dict]:
+        if self.proxy_pool is None:
+            return None
+        if proxy is not None:
+            if kind is not None:
+                METRICS.inc("proxy_changes_total", reason=kind)
+                self.proxy_pool.report_failure(proxy, kind)
+            self.proxy_pool.release(proxy)
+            self.proxy_pool.save(self.proxy_stats_path)
+
+        while True:
+            new_proxy = self.proxy_pool.acquire(exclude=proxy)
+            if new_proxy is not None:
+                return new_proxy
+            wait = self.proxy_pool.next_available_in()
+            if wait is None:
+                raise RuntimeError("No more proxies")
+            # Все прокси на карантине: ждет только этот воркер, остальные продолжают работу
+            await asyncio.sleep(max(wait, 1.0))
+
+    def collect_jobs(self) -> List[CrawlJob]:
+        jobs = []
+        issn_links = read_json(self.issn_links_path)
+        for issn, link in issn_links.items():
+            if link == "":
+                logging.info(f"Empty info {issn}. Skip")
+                continue
+
+            info = self.state.journal_info(issn)
+            if info is None or self.state.is_done(issn):
+                logging.info(f"Issn {issn} already parsed or not prepared, skip")
+                continue
+
+            for rubric, counters in info.items():
+                amount = int(counters["amount"])
+                if counters["parsed"] >= amount:
+                    continue
+                url = f"{self.base_url}/{link}"
+                total_pages = -(-amount // RESULTS_PER_PAGE)
+                remaining = total_pages - self.state.last_page(issn, rubric)
+                if remaining < self.split_pages and not self.state.has_pending_ranges(issn, rubric):
+                    jobs.append(CrawlJob(issn, url, rubric, amount))
+                    continue
+                for first_page, last_page in self.state.plan_ranges(issn, rubric, total_pages, self.range_pages):
+                    jobs.append(CrawlJob(issn, url, rubric, amount, first_page, last_page))
+        return jobs
+
+    def job_finished(self, job: CrawlJob):
+        self._pending[job.issn] -= 1
+        if self._pending[job.issn] == 0:
+            self.state.update_journal(job.issn)
+            self.state.export_journal(job.issn, self.journals_path)
+            logging.info(f"Journal {job.issn} processed")
+
+    async def run(self):
+        jobs = self.collect_jobs()
+        if len(jobs) == 0:
+            logging.info("Nothing to crawl")
+            return
+
+        queue = asyncio.Queue()
+        self._pending = {}
+        for job in jobs:
+            self._pending[job.issn] = self._pending.get(job.issn, 0) + 1
+            queue.put_nowait(job)
+
+        async with async_playwright() as playwright:
+            # Для прокси на уровне контекста браузер запускается с заглушкой глобального прокси
+            launch_proxy = {"server": "http://per-context"} if self.proxy_pool is not None else None
+            self.browser = await playwright.chromium.launch(headless=self.headless_mode,
+                                                            proxy=launch_proxy,
+                                                            args=["--disable-web-security"])
+            try:
+                workers = [CrawlWorker(self, i) for i in range(min(self.concurrency, len(jobs)))]
+                results = await asyncio.gather(*(w.run(queue) for w in workers), return_exceptions=True)
+                for worker, result in zip(workers, results):
+                    if isinstance(result, Exception):
+                        logging.error(f"Worker {worker.worker_id} stopped: {result}")
+                if not queue.empty():
+                    logging.error(f"{queue.qsize()} jobs left for the next run: no worker could open a context")
+            finally:
+                await self.browser.close()
+                if self.proxy_pool is not None:
+                    self.proxy_pool.save(self.proxy_stats_path)
+                self.resource_filter.log_summary()
+
+
+def main():
+    # Тот же запуск, что journals_parser.py crawl --engine async
+    arg_parser = argparse.ArgumentParser(description="Async crawl engine with page range fan-out")
+    arg_parser.add_argument("--proxies", default="./data/proxies.json")
+    arg_parser.add_argument("--concurrency", type=int, default=8)
+    arg_parser.add_argument("--db", default="./data/crawl_state.sqlite")
+    arg_parser.add_argument("--split-pages", type=int, default=40)
+    arg_parser.add_argument("--range-pages", type=int, default=20)
+    arg_parser.add_argument("--metrics", default="./data/metrics.json")
+    args = arg_parser.parse_args()
+
+    proxy_pool = ProxyPool.from_json(args.proxies)
+    proxy_pool.load("./data/proxy_stats.json")
+
+    engine = AsyncCrawlEngine(proxy_pool=proxy_pool, concurrency=args.concurrency, state_path=args.db,
+                              split_pages=args.split_pages, range_pages=args.range_pages)
+    METRICS.start_snapshot_writer(args.metrics)
+    try:
+        asyncio.run(engine.run())
+    finally:
+        METRICS.write_snapshot(args.metrics)
+
+
+if __name__ == "__main__":
+    main()
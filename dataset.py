@@ -0,0 +1,198 @@
+import csv
+import time
+import shutil
+import sqlite3
+import hashlib
+import logging
+import argparse
+
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+ARTICLE_SCHEMA = pa.schema([
+    ("elib_id", pa.int64()),
+    ("title", pa.string()),
+    ("link", pa.string()),
+    ("rubrics", pa.list_(pa.string())),
+])
+
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS partitions (
+    issn TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    rows INTEGER NOT NULL,
+    compacted_at REAL
+);
+CREATE TABLE IF NOT EXISTS elib_index (
+    elib_id INTEGER PRIMARY KEY,
+    issn TEXT NOT NULL,
+    row_group INTEGER NOT NULL,
+    row_offset INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS elib_index_issn ON elib_index (issn);
+"""
+
+# lookup читает одну группу строк, а не весь файл журнала
+ROW_GROUP_ROWS = 10000
+
+
+def journal_fingerprint(journal_path: Path) -> str:
+    # Журнал пересобирается, только если изменился состав, размер или время изменения его csv
+    digest = hashlib.sha1()
+    for csv_file in sorted(journal_path.glob("*.csv")):
+        stat = csv_file.stat()
+        digest.update(f"{csv_file.name}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()
+
+
+def read_journal(journal_path: Path) -> Dict[int, List]:
+    # Одна строка на статью, рубрики, в которых она встретилась, собираются в список
+    articles = {}
+    for csv_file in sorted(journal_path.glob("*.csv")):
+        rubric = csv_file.stem
+        with open(csv_file, newline="", encoding="utf-8") as f:
+            for row in csv.reader(f):
+                if len(row) != 3 or not row[0].isdigit():
+                    continue
+                elib_id = int(row[0])
+                if elib_id not in articles:
+                    articles[elib_id] = [row[1], row[2], []]
+                if rubric not in articles[elib_id][2]:
+                    articles[elib_id][2].append(rubric)
+    return articles
+
+
+class DatasetCompactor():
+    def __init__(self, dataset_path="data/dataset", journals_path="data/journals"):
+        self.dataset_path = Path(dataset_path)
+        self.journals_path = Path(journals_path)
+        self.dataset_path.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.dataset_path / "_index.sqlite"), isolation_level=None, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        columns = [column[1] for column in self.conn.execute("PRAGMA table_info(elib_index)")]
+        if "row" in columns:
+            # Индекс старого формата (номер строки без группы): журналы пересобираются при следующем compact
+            self.conn.executescript("DROP TABLE elib_index; DELETE FROM partitions;")
+        self.conn.executescript(INDEX_SCHEMA)
+
+    def partition_path(self, issn: str) -> Path:
+        return self.dataset_path / f"issn={issn}" / "part-0.parquet"
+
+    def compact(self, force=False) -> Dict:
+        stats = {"rewritten": 0, "skipped": 0, "removed": 0, "rows": 0, "duplicates": 0}
+        known = dict(self.conn.execute("SELECT issn, fingerprint FROM partitions").fetchall())
+        present = set()
+        for journal_path in sorted(self.journals_path.iterdir()):
+            if not journal_path.is_dir():
+                continue
+            issn = journal_path.name
+            present.add(issn)
+            fingerprint = journal_fingerprint(journal_path)
+            if not force and known.get(issn) == fingerprint:
+                stats["skipped"] += 1
+                continue
+            rows, duplicates = self.compact_journal(issn, journal_path, fingerprint)
+            stats["rewritten"] += 1
+            stats["rows"] += rows
+            stats["duplicates"] += duplicates
+
+        for issn in set(known) - present:
+            self.remove_journal(issn)
+            stats["removed"] += 1
+        logging.info(f"Dataset compaction: {stats}")
+        return stats
+
+    def compact_journal(self, issn: str, journal_path: Path, fingerprint: str):
+        articles = read_journal(journal_path)
+        table = pa.table({
+            "elib_id": list(articles.keys()),
+            "title": [values[0] for values in articles.values()],
+            "link": [values[1] for values in articles.values()],
+            "rubrics": [values[2] for values in articles.values()],
+        }, schema=ARTICLE_SCHEMA)
+
+        path = self.partition_path(issn)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".parquet.tmp")
+        pq.write_table(table, tmp_path, compression="zstd", row_group_size=ROW_GROUP_ROWS)
+        metadata = pq.read_metadata(tmp_path)
+        tmp_path.replace(path)
+        locations = []
+        for row_group in range(metadata.num_row_groups):
+            locations += [(row_group, row_offset) for row_offset in range(metadata.row_group(row_group).num_rows)]
+
+        # Файл уже заменен: если процесс упадет до фиксации индекса, журнал просто пересоберется
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.execute("DELETE FROM elib_index WHERE issn = ?", (issn,))
+            before = self.conn.total_changes
+            self.conn.executemany("INSERT OR IGNORE INTO elib_index (elib_id, issn, row_group, row_offset) "
+                                  "VALUES (?, ?, ?, ?)",
+                                  ((elib_id, issn) + location for elib_id, location in zip(articles.keys(), locations)))
+            duplicates = len(articles) - (self.conn.total_changes - before)
+            self.conn.execute("INSERT OR REPLACE INTO partitions (issn, fingerprint, rows, compacted_at) "
+                              "VALUES (?, ?, ?, ?)", (issn, fingerprint, len(articles), time.time()))
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+        if duplicates != 0:
+            logging.info(f"{duplicates} articles of {issn} are already indexed in another journal")
+        return len(articles), duplicates
+
+    def remove_journal(self, issn: str):
+        shutil.rmtree(self.partition_path(issn).parent, ignore_errors=True)
+        with self.conn:
+            self.conn.execute("DELETE FROM elib_index WHERE issn = ?", (issn,))
+            self.conn.execute("DELETE FROM partitions WHERE issn = ?", (issn,))
+
+    def contains(self, elib_id: int) -> bool:
+        return self.conn.execute("SELECT 1 FROM elib_index WHERE elib_id = ?", (elib_id,)).fetchone() is not None
+
+    def lookup(self, elib_id: int) -> Optional[Dict]:
+        found = self.conn.execute("SELECT issn, row_group, row_offset FROM elib_index WHERE elib_id = ?",
+                                  (elib_id,)).fetchone()
+        if found is None:
+            return None
+        issn, row_group, row_offset = found
+        row_group_table = pq.ParquetFile(self.partition_path(issn)).read_row_group(row_group)
+        record = row_group_table.slice(row_offset, 1).to_pylist()[0]
+        record["issn"] = issn
+        return record
+
+    def stats(self) -> Dict:
+        journals, rows = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(rows), 0) FROM partitions").fetchone()
+        indexed = self.conn.execute("SELECT COUNT(*) FROM elib_index").fetchone()[0]
+        return {"journals": journals, "rows": rows, "indexed_elib_ids": indexed}
+
+    def close(self):
+        self.conn.close()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Compact per-rubric csv files into a partitioned Parquet dataset")
+    arg_parser.add_argument("command", choices=["compact", "lookup", "stats"])
+    arg_parser.add_argument("elib_id", nargs="?", type=int)
+    arg_parser.add_argument("--dataset", default="data/dataset")
+    arg_parser.add_argument("--journals", default="data/journals")
+    arg_parser.add_argument("--force", action="store_true", help="rewrite all journals")
+    args = arg_parser.parse_args()
+
+    compactor = DatasetCompactor(args.dataset, args.journals)
+    try:
+        if args.command == "compact":
+            print(compactor.compact(force=args.force))
+        elif args.command == "lookup":
+            print(compactor.lookup(args.elib_id))
+        else:
+            print(compactor.stats())
+    finally:
+        compactor.close()
+
+
+if __name__ == "__main__":
+    main()
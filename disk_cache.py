@@ -0,0 +1,60 @@
+import json
+import time
+import sqlite3
+import threading
+
+from pathlib import Path
+from typing import Any, Optional
+
+
+MISSING = object()
+
+
+class TTLCache():
+    # Постоянный кэш ключ-значение поверх SQLite: каждая запись коммитится отдельно,
+    # поэтому падение процесса не теряет уже полученные ответы
+    def __init__(self, path, ttl: Optional[float] = None):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS cache ("
+                           "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)")
+
+    def get(self, key: str, default: Any = MISSING) -> Any:
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return default
+        value, expires_at = row
+        if expires_at is not None and expires_at < time.time():
+            return default
+        return json.loads(value)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                               (key, json.dumps(value, ensure_ascii=False), expires_at))
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not MISSING
+
+    def is_empty(self) -> bool:
+        # Учитываются и просроченные записи
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM cache LIMIT 1").fetchone() is None
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at < ?",
+                                        (time.time(),))
+        return cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,241 @@
+import re
+import logging
+import requests
+
+from tqdm import tqdm
+from bs4 import BeautifulSoup, SoupStrainer
+from urllib.parse import quote_plus
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from typing import Dict, List, Optional, Tuple
+
+from extractors import rubric_rows_to_info, result_rows_to_links
+from block_detector import classify_response
+from metrics import METRICS
+
+
+BASE_URL = 'https://www.elibrary.ru'
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.5735.199 Safari/537.36"
+
+# Разбираются только строки рубрик, остальной документ парсер пропускает
+RUBRIC_ROWS = SoupStrainer("tr", id=re.compile(r"^rubric_\d+"))
+
+RESULTS_TABLE = SoupStrainer("table", id="restab")
+NOT_FOUND_JOURNALS = "Не найдено журналов"
+
+DOI_RE = re.compile(r"\b10\.\d{4,9}/[^\s\"'<>]+")
+YEAR_RE = re.compile(r"Год(?: издания)?:\s*(\d{4})")
+ITEM_MARKERS = ('name="citation_title"', 'class="bigtext"')
+GRNTI_RE = re.compile(r"ГРНТИ:?\s*((?:\d{2}(?:\.\d{2}){0,2}[;,\s]*)+)")
+GRNTI_CODE_RE = re.compile(r"\d{2}(?:\.\d{2}){0,2}")
+
+
+class BlockedResponse(Exception):
+    # kind - вердикт block_detector.classify_response (block, captcha, error), его вызывающий код
+    # передает в ProxyPool.report_failure
+    def __init__(self, url, reason, kind="block"):
+        self.url = url
+        self.reason = reason
+        self.kind = kind
+
+    def __str__(self):
+        return f"BlockedResponse, {self.kind}: {self.reason} for {self.url}"
+
+
+def requests_proxies(proxy: Optional[Dict]) -> Optional[Dict]:
+    # Прокси в формате playwright -> формат requests
+    if not proxy or not proxy.get("server"):
+        return None
+    server = proxy["server"]
+    if "://" not in server:
+        server = f"http://{server}"
+    scheme, address = server.split("://", 1)
+    if proxy.get("username"):
+        address = f"{proxy['username']}:{proxy.get('password', '')}@{address}"
+    url = f"{scheme}://{address}"
+    return {"http": url, "https": url}
+
+
+def pubs_info_url(suburl: str, base_url=BASE_URL) -> str:
+    id = re.search(r"title_items.asp\?id=(\d+)", suburl).group(1)
+    return f"{base_url}/title_items_rubrics.asp?id={id}&order=0&selids=&show_multi=0&hide_doubles=0"
+
+
+def parse_rubrics_html(html: str) -> Dict:
+    soup = BeautifulSoup(html, "html.parser", parse_only=RUBRIC_ROWS)
+    rows = []
+    for row in soup.find_all("tr"):
+        cells = row.find_all("td", recursive=False)
+        rows.append((row["id"], cells[1].get_text() if len(cells) > 1 else ""))
+    return rubric_rows_to_info(rows)
+
+
+def titles_search_url(issn: str, base_url=BASE_URL) -> str:
+    # Тот же поиск, что выполняет title_search() на странице каталога, одним GET-запросом
+    return f"{base_url}/titles.asp?titlename={quote_plus(issn)}"
+
+
+def parse_journal_links_html(html: str) -> List[str]:
+    soup = BeautifulSoup(html, "html.parser", parse_only=RESULTS_TABLE)
+    return [link["href"] for link in soup.select("a[href^='title_items.asp?id='][title]")]
+
+
+def parse_result_rows_html(html: str) -> List[List]:
+    # Тот же разбор, что RESULT_ROWS_JS в браузере, для сохраненных страниц выдачи
+    soup = BeautifulSoup(html, "html.parser", parse_only=RESULTS_TABLE)
+    rows = []
+    for row in soup.select("tr[id^='arw']"):
+        link = row.select_one("a[href^='/item.asp?id=']")
+        title = row.select_one("b span")
+        rows.append({
+            "row_id": row.get("id"),
+            "href": link.get("href") if link is not None else None,
+            "title": title.get_text().strip() if title is not None else "",
+        })
+    return result_rows_to_links(rows)
+
+
+def item_url(link: str, base_url=BASE_URL) -> str:
+    return f"{base_url}/{link.lstrip('/')}"
+
+
+def _meta(soup: BeautifulSoup, name: str) -> List[str]:
+    return [tag["content"].strip() for tag in soup.find_all("meta", attrs={"name": name}) if tag.get("content")]
+
+
+def _unique(values) -> List[str]:
+    return list(dict.fromkeys(value for value in values if value))
+
+
+def parse_item_html(html: str) -> Dict:
+    # Сначала берутся мета-теги citation_*, при их отсутствии - разметка страницы статьи
+    soup = BeautifulSoup(html, "html.parser")
+    title = next(iter(_meta(soup, "citation_title")), None)
+    if title is None:
+        tag = soup.find(class_="bigtext")
+        title = tag.get_text(" ", strip=True) if tag is not None else ""
+
+    authors = _meta(soup, "citation_author") or \
+        [link.get_text(" ", strip=True) for link in soup.select("a[href*='author_profile.asp']")]
+
+    date = next(iter(_meta(soup, "citation_publication_date") + _meta(soup, "citation_date")), "")
+    year = re.search(r"\d{4}", date) or YEAR_RE.search(soup.get_text(" "))
+
+    doi = next(iter(_meta(soup, "citation_doi")), None)
+    if doi is None:
+        found = DOI_RE.search(html)
+        doi = found.group(0).rstrip(".,;") if found is not None else None
+
+    abstract = soup.find(id="abstract1") or soup.find(id="abstract2")
+    abstract = abstract.get_text(" ", strip=True) if abstract is not None else \
+        next(iter(_meta(soup, "citation_abstract")), None)
+
+    keywords = [link.get_text(" ", strip=True) for link in soup.select("a[href*='keyword_items.asp']")]
+    if len(keywords) == 0:
+        keywords = [word.strip() for value in _meta(soup, "citation_keywords") for word in value.split(";")]
+
+    grnti = [code for found in GRNTI_RE.findall(soup.get_text(" ")) for code in GRNTI_CODE_RE.findall(found)]
+
+    return {
+        "title": title,
+        "authors": _unique(authors),
+        "year": int(year.group(year.lastindex or 0)) if year else None,
+        "doi": doi,
+        "abstract": abstract or None,
+        "keywords": _unique(keywords),
+        "grnti": _unique(grnti),
+    }
+
+
+def rubric_matches(rubric: str, code: str) -> bool:
+    # Рубрика журнала 760000 соответствует кодам ГРНТИ 76.xx.xx, 762900 - кодам 76.29.xx
+    if len(rubric) != 6 or not rubric.isdigit():
+        return False
+    levels = code.split(".")
+    for n, level in enumerate((rubric[0:2], rubric[2:4], rubric[4:6])):
+        if level == "00":
+            continue
+        if n >= len(levels) or levels[n] != level:
+            return False
+    return True
+
+
+class ElibraryHttpClient():
+    def __init__(self, proxy=None, pool_size=32, timeout=20, base_url=BASE_URL):
+        self.timeout = timeout
+        self.base_url = base_url
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=2)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({
+            "User-Agent": USER_AGENT,
+            "Accept-Language": "ru-RU,ru;q=0.9,en-US;q=0.8",
+            "Connection": "keep-alive",
+        })
+        self.session.proxies = requests_proxies(proxy) or {}
+        self.proxy_label = proxy["server"] if proxy else "direct"
+        self.session.verify = False
+
+    def fetch(self, url: str) -> str:
+        response = self.session.get(url, timeout=self.timeout)
+        if response.encoding is None or response.encoding.lower() == "iso-8859-1":
+            response.encoding = response.apparent_encoding
+        html = response.text
+        # Те же правила, что у перехвата навигаций в браузере: редирект на страницу блокировки
+        # проверяется по первому ответу, код и сигнатуры - по итоговому
+        verdict = None
+        if len(response.history) != 0:
+            first = response.history[0]
+            verdict = classify_response(first.status_code, first.headers.get("location"), "")
+        if verdict is None:
+            verdict = classify_response(response.status_code, None, html)
+        if verdict is not None:
+            kind, reason = verdict
+            METRICS.inc("responses_classified_total", kind=kind, proxy=self.proxy_label)
+            raise BlockedResponse(url, reason, kind)
+        response.raise_for_status()
+        return html
+
+    def get_journal_pubs_info(self, suburl: str) -> Dict:
+        url = pubs_info_url(suburl, self.base_url)
+        html = self.fetch(url)
+        if 'id="rubrics_table"' not in html and "id=rubrics_table" not in html:
+            raise BlockedResponse(url, "rubrics table is missing")
+        return parse_rubrics_html(html)
+
+    def get_journal_link(self, issn: str) -> str:
+        url = titles_search_url(issn, self.base_url)
+        html = self.fetch(url)
+        if NOT_FOUND_JOURNALS in html:
+            return ""
+        if 'id="restab"' not in html and "id=restab" not in html:
+            raise BlockedResponse(url, "journal search results are missing")
+        links = parse_journal_links_html(html)
+        return links[0] if len(links) != 0 else ""
+
+    def get_item(self, link: str) -> Dict:
+        url = item_url(link, self.base_url)
+        html = self.fetch(url)
+        if not any(marker in html for marker in ITEM_MARKERS):
+            raise BlockedResponse(url, "article page markup is missing")
+        return parse_item_html(html)
+
+    def get_journals_pubs_info(self, links: Dict[str, str], workers=16) -> Tuple[Dict, Dict]:
+        # Возвращает разобранные журналы и журналы, которые нужно догрузить через браузер
+        results = {}
+        failed = {}
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(self.get_journal_pubs_info, link): issn for issn, link in links.items()}
+            for future in tqdm(as_completed(futures), total=len(futures)):
+                issn = futures[future]
+                try:
+                    results[issn] = future.result()
+                except Exception as e:
+                    logging.error(f"HTTP fetch failed for {issn}: {e}")
+                    failed[issn] = links[issn]
+        return results, failed
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,62 @@
+import re
+import logging
+
+from typing import List, Dict, Iterable, Tuple
+
+
+# Каждый скрипт выполняется в странице за один вызов evaluate и возвращает
+# готовый список строк вместо отдельного IPC-запроса на каждую ячейку
+
+RESULT_ROWS_JS = """
+table => Array.from(table.querySelectorAll("tr[id^='arw']")).map(row => {
+    const link = row.querySelector("a[href^='/item.asp?id=']");
+    const title = row.querySelector("b span");
+    return {
+        row_id: row.id,
+        href: link ? link.getAttribute("href") : null,
+        title: title ? title.textContent.trim() : "",
+    };
+})
+"""
+
+JOURNAL_LINKS_JS = """
+table => Array.from(table.querySelectorAll("tr"))
+    .map(row => row.querySelector("a[href^='title_items.asp?id='][title]"))
+    .filter(link => link !== null && link.getAttribute("href"))
+    .map(link => link.getAttribute("href"))
+"""
+
+RUBRIC_ROWS_JS = """
+table => Array.from(table.querySelectorAll("tr[id^='rubric_']")).map(row => {
+    const cell = row.querySelector("td:nth-child(2)");
+    return {row_id: row.id, text: cell ? cell.textContent : ""};
+})
+"""
+
+
+def result_rows_to_links(rows: Iterable[Dict]) -> List[List]:
+    pub_links = []
+    for row in rows:
+        href = row["href"]
+        id_value = href.split("=")[1] if href else None
+        pub_links.append([id_value, row["title"].lower(), href])  # headers = ['elib_id', 'title', 'link']
+    return pub_links
+
+
+def rubric_rows_to_info(rows: Iterable[Tuple[str, str]]) -> Dict:
+    data = {}
+    for row_id, row_text in rows:
+        cat_id = re.search(r"rubric_(\d+)", row_id or "")
+        if cat_id is None:
+            logging.error(f"Cant find rubric id from {row_id}. Skip")
+            continue
+
+        number_in_brackets = re.search(r"\((\d+)\)", row_text)
+        if number_in_brackets is None:
+            logging.error(f"Cant find count id from {row_text}. Skip")
+            continue
+
+        data[cat_id.group(1)] = {}
+        data[cat_id.group(1)]["amount"] = int(number_in_brackets.group(1))
+        data[cat_id.group(1)]["parsed"] = 0
+    return data
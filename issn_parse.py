@@ -1,18 +1,30 @@
+import os
 import time
 import json
+import asyncio
+import logging
 import requests
 from bs4 import BeautifulSoup
-from typing import List
+from requests.adapters import HTTPAdapter
+from typing import List, Dict, Optional
 
+from disk_cache import TTLCache, MISSING
+from journal_catalog import JournalCatalog
 
-def get_issn(jrnl_name: str) -> List:
-    jrnl_name = jrnl_name.strip().lower()
-    jrnl_name_replaced = jrnl_name.replace(" ", "+")
-    result = requests.get(url=f"https://journalrank.rcsi.science/ru/record-sources/?s={jrnl_name_replaced}&adv=true")    
-    result.raise_for_status()  # Проверка на ошибки
+
+SEARCH_URL = "https://journalrank.rcsi.science/ru/record-sources/?s={}&adv=true"
+DAY = 24 * 60 * 60
+
+
+def normalize_name(jrnl_name: str) -> str:
+    return jrnl_name.strip().lower()
+
+
+def parse_issn_html(html: str, jrnl_name: str) -> List:
+    jrnl_name = normalize_name(jrnl_name)
 
     # Создаем объект BeautifulSoup
-    soup = BeautifulSoup(result.text, 'html.parser')
+    soup = BeautifulSoup(html, 'html.parser')
 
     # Находим все элементы с классом "list-group-item"
     items = soup.find_all("div", class_="list-group-item")
@@ -32,20 +44,130 @@ def get_issn(jrnl_name: str) -> List:
     return numbers
 
 
+def get_issn(jrnl_name: str, session=requests) -> List:
+    jrnl_name_replaced = normalize_name(jrnl_name).replace(" ", "+")
+    result = session.get(url=SEARCH_URL.format(jrnl_name_replaced), timeout=30)
+    result.raise_for_status()  # Проверка на ошибки
+    return parse_issn_html(result.text, jrnl_name)
+
+
+class TokenBucket():
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class IssnResolver():
+    def __init__(self, concurrency=8, rate=2.0, burst=4, cache_path="./data/issn_cache.sqlite",
+                 ttl=90 * DAY, negative_ttl=14 * DAY, catalog: Optional[JournalCatalog] = None):
+        self.concurrency = concurrency
+        self.catalog = catalog
+        self.negative_ttl = negative_ttl
+        self.cache = TTLCache(cache_path, ttl=ttl)
+        self.bucket = TokenBucket(rate, burst)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency, max_retries=2)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.fetched = 0
+        self.cached = 0
+        self.local = 0
+
+    async def resolve(self, jrnl_name: str, semaphore: asyncio.Semaphore) -> List:
+        if self.catalog is not None:
+            # Локальный каталог: точное и нечеткое совпадение названия без запроса к сайту
+            issn_codes = self.catalog.lookup(jrnl_name)
+            if issn_codes is not None:
+                self.local += 1
+                return issn_codes
+
+        key = normalize_name(jrnl_name)
+        issn_codes = self.cache.get(key)
+        if issn_codes is not MISSING:
+            self.cached += 1
+            return issn_codes
+
+        async with semaphore:
+            await self.bucket.acquire()
+            issn_codes = await asyncio.to_thread(get_issn, jrnl_name, self.session)
+        self.fetched += 1
+        # Пустой ответ тоже кэшируется, но на меньший срок
+        self.cache.set(key, issn_codes, None if len(issn_codes) != 0 else self.negative_ttl)
+        if self.catalog is not None:
+            self.catalog.learn(jrnl_name, issn_codes)
+        return issn_codes
+
+    async def resolve_all(self, jrnl_list: List[str], output_path: str, checkpoint_every=20) -> Dict:
+        result_data = {}
+        if os.path.exists(output_path):
+            with open(output_path, encoding="utf-8") as f:
+                result_data = json.load(f)
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def resolve_named(jrnl):
+            return jrnl, await self.resolve(jrnl, semaphore)
+
+        tasks = [asyncio.create_task(resolve_named(jrnl)) for jrnl in jrnl_list if jrnl not in result_data]
+        done = 0
+        try:
+            for task in asyncio.as_completed(tasks):
+                try:
+                    jrnl, issn_codes = await task
+                except Exception as e:
+                    logging.error(f"ISSN lookup failed: {e}")
+                    continue
+                if len(issn_codes) != 0:
+                    result_data[jrnl] = issn_codes
+                done += 1
+                if done % checkpoint_every == 0:
+                    self.dump(result_data, output_path)
+        finally:
+            for task in tasks:
+                task.cancel()
+            self.dump(result_data, output_path)
+        logging.info(f"ISSN lookup finished: {self.local} from catalog, {self.fetched} fetched, {self.cached} from cache")
+        return result_data
+
+    def dump(self, result_data: Dict, output_path: str):
+        # Запись через временный файл, чтобы не оставить поврежденный json при падении
+        tmp_path = f"{output_path}.tmp"
+        with open(tmp_path, 'w', encoding="utf-8") as fp:
+            json.dump(result_data, fp, ensure_ascii=False)
+        os.replace(tmp_path, output_path)
+
+    def close(self):
+        self.session.close()
+        self.cache.close()
+        if self.catalog is not None:
+            self.catalog.close()
+
+
 def main():
-    with open("journals.txt", "r", encoding="utf-8") as file:
+    with open("./data/journals.txt", "r", encoding="utf-8") as file:
         # Читаем строки и записываем в список
-        jrnl_list = [line.strip() for line in file]
-
-    result_data = {}
-    for jrnl in jrnl_list:
-        issn_codes = get_issn(jrnl)
-        if len(issn_codes) != 0:
-            result_data[jrnl] = issn_codes
-        time.sleep(0.5)
+        jrnl_list = [line.strip() for line in file if line.strip()]
 
-    with open('issn_codes.json', 'w') as fp:
-        json.dump(result_data, fp, ensure_ascii=False)
+    catalog = JournalCatalog() if os.path.exists("./data/journal_catalog.sqlite") else None
+    resolver = IssnResolver(catalog=catalog)
+    try:
+        asyncio.run(resolver.resolve_all(jrnl_list, './data/issn_codes.json'))
+    finally:
+        resolver.close()
 
 
 if __name__ == "__main__":
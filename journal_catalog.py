@@ -0,0 +1,218 @@
+import re
+import json
+import sqlite3
+import logging
+import argparse
+import requests
+
+from tqdm import tqdm
+from pathlib import Path
+from bs4 import BeautifulSoup
+
+from typing import List, Dict, Optional, Set, Tuple
+
+
+LISTING_URL = "https://journalrank.rcsi.science/ru/record-sources/?page={}"
+ISSN_RE = re.compile(r"^\d{4}-\d{3}[\dXx]$")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS journals (
+    journal_id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL,
+    issns TEXT NOT NULL,
+    issn_key TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS titles (
+    title_id INTEGER PRIMARY KEY,
+    journal_id INTEGER NOT NULL,
+    norm TEXT NOT NULL,
+    grams INTEGER NOT NULL,
+    UNIQUE (journal_id, norm)
+);
+CREATE INDEX IF NOT EXISTS titles_norm ON titles (norm);
+CREATE TABLE IF NOT EXISTS trigrams (
+    gram TEXT NOT NULL,
+    title_id INTEGER NOT NULL,
+    PRIMARY KEY (gram, title_id)
+) WITHOUT ROWID;
+"""
+
+
+def normalize_title(title: str) -> str:
+    # Регистр, ё/е, кавычки и пунктуация не различаются
+    title = title.lower().replace("ё", "е")
+    title = re.sub(r"[^\w\s]", " ", title)
+    return " ".join(title.split())
+
+
+def trigrams(norm: str) -> Set[str]:
+    padded = f"  {norm} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def parse_listing_html(html: str) -> List[Tuple[str, List[str], List[str]]]:
+    # Каждая карточка источника: основное название, прочие названия и ISSN
+    soup = BeautifulSoup(html, "html.parser")
+    records = []
+    for item in soup.find_all("div", class_="list-group-item"):
+        names = [link.get_text(" ", strip=True) for link in item.find_all("a", class_="tx-uppercase")]
+        container = item.find("div", class_="collapsible-container")
+        issns = [link.get_text(strip=True) for link in container.find_all("a")] if container is not None else []
+        issns = [issn.upper() for issn in issns if ISSN_RE.match(issn)]
+        if len(names) != 0 and len(issns) != 0:
+            records.append((names[0], names[1:], issns))
+    return records
+
+
+class JournalCatalog():
+    def __init__(self, path="./data/journal_catalog.sqlite", min_similarity=0.8):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.min_similarity = min_similarity
+        self.conn = sqlite3.connect(str(path), isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def add(self, title: str, issns: List[str], alternates: Optional[List[str]] = None) -> int:
+        issn_key = ",".join(sorted(issns))
+        row = self.conn.execute("SELECT journal_id FROM journals WHERE issn_key = ?", (issn_key,)).fetchone()
+        if row is None:
+            journal_id = self.conn.execute("INSERT INTO journals (title, issns, issn_key) VALUES (?, ?, ?)",
+                                           (title, json.dumps(issns), issn_key)).lastrowid
+        else:
+            journal_id = row[0]
+        for name in [title] + (alternates or []):
+            self.add_title(journal_id, name)
+        return journal_id
+
+    def add_title(self, journal_id: int, title: str):
+        norm = normalize_title(title)
+        if not norm:
+            return
+        grams = trigrams(norm)
+        cursor = self.conn.execute("INSERT OR IGNORE INTO titles (journal_id, norm, grams) VALUES (?, ?, ?)",
+                                   (journal_id, norm, len(grams)))
+        if cursor.rowcount == 0:
+            return
+        title_id = cursor.lastrowid
+        self.conn.executemany("INSERT OR IGNORE INTO trigrams (gram, title_id) VALUES (?, ?)",
+                              [(gram, title_id) for gram in grams])
+
+    def ingest_html(self, html: str) -> int:
+        records = parse_listing_html(html)
+        self.conn.execute("BEGIN")
+        try:
+            for title, alternates, issns in records:
+                self.add(title, issns, alternates)
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+        return len(records)
+
+    def ingest_dir(self, pages_path: str) -> int:
+        ingested = 0
+        for html_file in tqdm(sorted(Path(pages_path).glob("*.html"))):
+            ingested += self.ingest_html(html_file.read_text(encoding="utf-8"))
+        logging.info(f"Catalog ingest: {ingested} records from {pages_path}")
+        return ingested
+
+    def exact(self, name: str) -> Optional[List[str]]:
+        row = self.conn.execute("SELECT j.issns FROM titles t JOIN journals j USING (journal_id) "
+                                "WHERE t.norm = ? LIMIT 1", (normalize_title(name),)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def fuzzy(self, name: str, limit=5) -> List[Tuple[float, str, List[str]]]:
+        # Кандидаты отбираются по общим триграммам, затем ранжируются по коэффициенту Дайса
+        grams = trigrams(normalize_title(name))
+        if len(grams) == 0:
+            return []
+        placeholders = ",".join("?" * len(grams))
+        rows = self.conn.execute(
+            f"SELECT t.title_id, t.norm, t.grams, j.issns, COUNT(*) AS common FROM trigrams g "
+            f"JOIN titles t USING (title_id) JOIN journals j USING (journal_id) "
+            f"WHERE g.gram IN ({placeholders}) GROUP BY t.title_id ORDER BY common DESC LIMIT 50",
+            list(grams)).fetchall()
+        total = len(grams)
+        matches = [(2 * common / (total + title_grams), norm, json.loads(issns))
+                   for _, norm, title_grams, issns, common in rows]
+        matches.sort(key=lambda match: match[0], reverse=True)
+        return matches[:limit]
+
+    def lookup(self, name: str) -> Optional[List[str]]:
+        issns = self.exact(name)
+        if issns is not None:
+            return issns
+        matches = self.fuzzy(name, limit=2)
+        if len(matches) == 0 or matches[0][0] < self.min_similarity:
+            return None
+        # Два почти одинаково похожих журнала с разными ISSN - неоднозначно, лучше спросить сеть
+        if len(matches) > 1 and matches[1][2] != matches[0][2] and matches[0][0] - matches[1][0] < 0.1:
+            return None
+        return matches[0][2]
+
+    def learn(self, name: str, issns: List[str]):
+        # Ответ сети сохраняется, запрос под тем же названием больше в сеть не пойдет
+        if len(issns) == 0:
+            return
+        self.conn.execute("BEGIN")
+        self.add(name, issns)
+        self.conn.execute("COMMIT")
+
+    def stats(self) -> Dict:
+        return {
+            "journals": self.conn.execute("SELECT COUNT(*) FROM journals").fetchone()[0],
+            "titles": self.conn.execute("SELECT COUNT(*) FROM titles").fetchone()[0],
+        }
+
+    def close(self):
+        self.conn.close()
+
+
+def download_pages(pages_path: str, first_page: int, last_page: int, url_template=LISTING_URL):
+    # Страницы сохраняются на диск, уже скачанные повторно не запрашиваются
+    Path(pages_path).mkdir(parents=True, exist_ok=True)
+    session = requests.Session()
+    try:
+        for page in tqdm(range(first_page, last_page + 1)):
+            html_file = Path(pages_path) / f"page_{page:05d}.html"
+            if html_file.exists():
+                continue
+            response = session.get(url_template.format(page), timeout=30)
+            response.raise_for_status()
+            html_file.write_text(response.text, encoding="utf-8")
+    finally:
+        session.close()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Local journal catalog for name -> ISSN resolution")
+    arg_parser.add_argument("command", choices=["ingest", "lookup", "stats"])
+    arg_parser.add_argument("name", nargs="?")
+    arg_parser.add_argument("--db", default="./data/journal_catalog.sqlite")
+    arg_parser.add_argument("--pages-dir", default="./data/journalrank_pages")
+    arg_parser.add_argument("--download", default=None, metavar="FIRST-LAST",
+                            help="download listing pages before ingest, e.g. 1-800")
+    args = arg_parser.parse_args()
+
+    catalog = JournalCatalog(args.db)
+    try:
+        if args.command == "ingest":
+            if args.download:
+                first_page, last_page = (int(page) for page in args.download.split("-"))
+                download_pages(args.pages_dir, first_page, last_page)
+            catalog.ingest_dir(args.pages_dir)
+            print(catalog.stats())
+        elif args.command == "lookup":
+            print(catalog.exact(args.name))
+            for similarity, norm, issns in catalog.fuzzy(args.name):
+                print(f"{similarity:.3f}  {norm}  {issns}")
+        else:
+            print(catalog.stats())
+    finally:
+        catalog.close()
+
+
+if __name__ == "__main__":
+    main()
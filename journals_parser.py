@@ -1,19 +1,32 @@
 import os
 import re
-import csv
 import json
 import time
 import copy
-import random
 import logging
+import argparse
 
-from tqdm import tqdm
 from pathlib import Path
-from playwright.sync_api import sync_playwright, TimeoutError
-from playwright.sync_api._generated import Page
-from playwright_stealth import stealth_sync, StealthConfig
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from typing import List, Dict, Union
+from typing import TYPE_CHECKING, List, Dict, Tuple, Union, Optional
+
+from proxy_pool import ProxyPool
+from state_store import CrawlStateStore
+from page_pool import PagePool, apply_stealth
+from resource_filter import ResourceFilter, wait_selector, page_type
+from metrics import METRICS
+from block_detector import BlockDetector
+from session_store import SessionStore
+from scheduler import Scheduler, RetryQueue
+from extractors import (RESULT_ROWS_JS, JOURNAL_LINKS_JS, RUBRIC_ROWS_JS,
+                        result_rows_to_links, rubric_rows_to_info)
+
+# playwright, requests и bs4 импортируются там, где они нужны: служебные команды CLI
+# (update-status, prepare по сохраненным счетчикам) запускаются без них
+if TYPE_CHECKING:
+    from playwright.sync_api._generated import Page
+    from playwright_stealth import StealthConfig
 
 
 logging.basicConfig(
@@ -38,27 +51,112 @@ class CaptchaException(Exception):
             return 'Error: Captcha detected'
 
 
+def failure_kind(e: Exception) -> str:
+    # Ответы HTTP-клиента уже классифицированы (elib_http.BlockedResponse.kind)
+    if getattr(e, "kind", None) is not None:
+        return e.kind
+    if isinstance(e, CaptchaException):
+        return "captcha"
+    if "blocked" in str(e):
+        return "block"
+    return "error"
+
+
+def raise_for_kind(kind: Optional[str]):
+    if kind == "error":
+        raise RuntimeError("Server error catch")
+    if kind == "block":
+        raise RuntimeError("Anonymous ip blocked!")
+    if kind == "captcha":
+        raise CaptchaException("CAPTCHA CHECK DETECTED!")
+
+
+def record_failure(stage: str, e: Exception, proxy: Optional[Dict]):
+    kind = failure_kind(e)
+    METRICS.inc("retries_total", stage=stage, reason=kind)
+    if kind == "captcha":
+        METRICS.inc("captchas_total", proxy=proxy["server"] if proxy else "direct")
+    elif kind == "block":
+        METRICS.inc("blocks_total", proxy=proxy["server"] if proxy else "direct")
+
+
+def make_stealth_config() -> "StealthConfig":
+    from playwright_stealth import StealthConfig
+    return StealthConfig(webdriver=True,
+                         webgl_vendor=True,
+                         chrome_app=True,
+                         chrome_csi=True,
+                         chrome_load_times=True,
+                         chrome_runtime=True,
+                         iframe_content_window=True,
+                         media_codecs=True,
+                         navigator_hardware_concurrency=4,
+                         navigator_languages=True,
+                         navigator_permissions=True,
+                         navigator_platform=True,
+                         navigator_plugins=True,
+                         navigator_user_agent=False,
+                         navigator_vendor=True,
+                         outerdimensions=True,
+                         hairline=True)
+
+
+# Поиск по каталогу перезагружает страницу: метка окна пропадает, и ждать остается
+# только таблицу результатов, сообщение "не найдено" или страницу ошибки
+SEARCH_DONE_JS = """() => !window.__elibSearchPending && document.readyState !== "loading" &&
+    document.querySelector("#restab, td.redref, div#blockedip, form[action*='page_captcha.asp'], h1") !== null"""
+
+
+def read_json(path):
+    with open(path) as f:
+        json_dict = json.load(f)
+    return json_dict
+
+
 class ElibraryParser():
-    def __init__(self, headless_mode=False, proxy=None):
-        self.playwright = sync_playwright().start()
+    def __init__(self, headless_mode=False, proxy=None, proxy_pool: Optional[ProxyPool] = None,
+                 state_path="./data/crawl_state.sqlite", capture_path: Optional[str] = None,
+                 item_details_path="./data/item_details.sqlite"):
+        # Браузер запускается при первой навигации (ensure_browser), шаги без браузера его не ждут
+        self.playwright = None
         self.headless_mode = headless_mode
         self.browser = None
         self.context = None
         self.jrnls_issn_dict = {}
         self.issn_links_dict = {}
-        self.proxy_cntr = 0
-        self.proxy_pool = []
+        self.proxy_pool = proxy_pool
+        self.proxy_stats_path = "./data/proxy_stats.json"
+        if proxy is None and proxy_pool is not None:
+            proxy = proxy_pool.acquire()
         self.proxy = proxy
-        self.start_browser(headless_mode)
+        self.http_client = None
+        self.scheduler = Scheduler()
+        self.resource_filter = ResourceFilter()
+        self.block_detector = BlockDetector(proxy_label=lambda: self.proxy["server"] if self.proxy else "direct")
+        self.sessions = SessionStore()
+        # Необязательное сохранение HTML страниц для повторного разбора без обхода (capture_cache.py)
+        self.capture = None
+        if capture_path:
+            from capture_cache import CaptureCache
+            self.capture = CaptureCache(capture_path)
+        self.page_pool = PagePool(max_tabs=2, max_navigations=300, max_rss_mb=2048.0,
+                                  on_recycle=lambda: self.start_browser(self.headless_mode))
         self.last_opened_url = ""
         self.interest_cats = []
         self.max_retries = 50
         self.base_url = 'https://www.elibrary.ru'
         self.issn_codes_path = "./data/issn_codes.json"
         self.issn_links_path = "./data/issn_links.json"
+        self.journals_path = Path("data/journals")
+        self.state = CrawlStateStore(state_path)
+        # Страницы статей, загруженные при разборе объединения, сохраняются в базу article_details.py
+        self.item_details_path = item_details_path
+        if not self.state.has_journals() and self.journals_path.exists():
+            # Первый запуск со старой структурой data/journals: переносим прогресс в базу
+            self.state.import_tree(self.journals_path, self.issn_links_path)
 
     @classmethod
-    def run_with_constant_proxy(cls, proxy_port=2000):
+    def run_with_constant_proxy(cls, proxy_port=2000, **kwargs):
         proxy_ip = ""
         proxy_login = ""
         proxy_pass = ""
@@ -68,85 +166,138 @@ class ElibraryParser():
              "username": proxy_login,
              "password": proxy_pass
         }
-        return cls(proxy=proxy)
+        # Порты ротационного прокси, на которые переключается парсер при ошибках
+        proxy_pool = ProxyPool.from_port_range(proxy_ip, proxy_login, proxy_pass, 2001, 2445)
+        return cls(proxy=proxy, proxy_pool=proxy_pool, **kwargs)
 
     @classmethod
-    def run_with_proxy_pool(cls):
-        proxy_pool = [
-            {"server": "67.43.236.18:1853"}
-        ]
-        parser = cls(proxy=proxy_pool[0])
-        parser.proxy_pool = proxy_pool
-        return parser
+    def run_with_proxy_pool(cls, proxies_path="./data/proxies.json", prevalidate=False, **kwargs):
+        proxy_pool = ProxyPool.from_json(proxies_path)
+        proxy_pool.load("./data/proxy_stats.json")
+        if prevalidate:
+            proxy_pool.prevalidate()
+        return cls(proxy_pool=proxy_pool, **kwargs)
+
+    def ensure_http_client(self, pool_size: int):
+        if self.http_client is None:
+            from elib_http import ElibraryHttpClient
+            self.http_client = ElibraryHttpClient(proxy=self.proxy, pool_size=pool_size, base_url=self.base_url)
+
+    def ensure_browser(self):
+        if self.browser is not None:
+            return
+        if self.playwright is None:
+            from playwright.sync_api import sync_playwright
+            with METRICS.timer("playwright_start_seconds"):
+                self.playwright = sync_playwright().start()
+        self.start_browser(self.headless_mode)
 
     def start_browser(self, headless_mode=True):
-        if self.context is not None:
-            self.context.close()
+        # Полный перезапуск процесса нужен только при старте и при превышении лимитов PagePool,
+        # смена прокси пересоздает лишь контекст (см. change_proxy)
+        self.close_context()
+        if self.browser is not None:
             self.browser.close()
-        self.browser = self.playwright.chromium.launch(headless=headless_mode,
-                                                       proxy=self.proxy,
-                                                       args=["--disable-web-security"],
-                                                       )
-        self.context = self.browser.new_context(ignore_https_errors=True,
-                                                user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.5735.199 Safari/537.36")
-
-    def change_proxy(self):
-        self.proxy_cntr += 1
-        proxy_ip = ""
-        proxy_port = 2001 + self.proxy_cntr
-        proxy_login = ""
-        proxy_pass = ""
+        # Для прокси на уровне контекста браузер запускается с заглушкой глобального прокси
+        launch_proxy = {"server": "http://per-context"} if self.proxy is not None or self.proxy_pool is not None else None
+        with METRICS.timer("browser_start_seconds"):
+            self.browser = self.playwright.chromium.launch(headless=headless_mode,
+                                                           proxy=launch_proxy,
+                                                           args=["--disable-web-security"],
+                                                           )
+        METRICS.inc("browser_starts_total")
+        self.open_context()
+
+    def open_context(self):
+        from elib_http import USER_AGENT
+        # Cookies и localStorage прошлых запусков с этим же прокси восстанавливаются
+        with METRICS.timer("context_start_seconds"):
+            self.context = self.browser.new_context(proxy=self.proxy,
+                                                    storage_state=self.sessions.load(self.proxy),
+                                                    ignore_https_errors=True,
+                                                    user_agent=USER_AGENT)
+            apply_stealth(self.context, make_stealth_config())
+            self.resource_filter.install(self.context, self.block_detector)
+        METRICS.inc("context_starts_total")
+        self.page_pool.attach(self.context)
+
+    def close_context(self, failure_kind: Optional[str] = None):
+        if self.context is None:
+            return
+        if failure_kind in ("block", "captcha"):
+            self.sessions.discard(self.proxy)
+        else:
+            self.sessions.save(self.context, self.proxy)
+        try:
+            self.context.close()
+        except Exception as e:
+            logging.error(f"Error while closing context: {e}")
+        self.context = None
 
-        self.proxy = {
-             "server": f"http://{proxy_ip}:{proxy_port}",
-             "username": proxy_login,
-             "password": proxy_pass
-        }
-        if self.proxy_cntr >= 445:
+    def change_proxy(self, failure_kind="error"):
+        if self.proxy_pool is None:
             logging.error("No more proxies")
             return False
-        self.start_browser(self.headless_mode)
+
+        METRICS.inc("proxy_changes_total", reason=failure_kind)
+        # Время смены включает ожидание свободного прокси и создание нового контекста
+        with METRICS.timer("proxy_change_seconds", reason=failure_kind):
+            self.proxy_pool.report_failure(self.proxy, failure_kind)
+            self.proxy_pool.release(self.proxy)
+            self.close_context(failure_kind)
+            proxy = self.proxy_pool.acquire_wait(exclude=self.proxy)
+            self.proxy_pool.save(self.proxy_stats_path)
+            if proxy is None:
+                logging.error("No more proxies")
+                return False
+
+            self.proxy = proxy
+            if self.http_client is not None:
+                # HTTP-клиент привязан к прокси сессии, следующий запрос создаст новый
+                self.http_client.close()
+                self.http_client = None
+            if self.browser is not None:
+                # Если браузер еще не запущен, новый прокси подхватит первый же open_url
+                self.open_context()
         return True
 
-    def open_url(self, url, num_attempts=25) -> Page:
+    def open_url(self, url, num_attempts=25) -> "Page":
         cntr = 0
         status = True
         while True:
-            page = self.context.new_page()
-            config = StealthConfig(webdriver=True,
-                                   webgl_vendor=True,
-                                   chrome_app=True,
-                                   chrome_csi=True,
-                                   chrome_load_times=True,
-                                   chrome_runtime=True,
-                                   iframe_content_window=True,
-                                   media_codecs=True,
-                                   navigator_hardware_concurrency=4,
-                                   navigator_languages=True,
-                                   navigator_permissions=True,
-                                   navigator_platform=True,
-                                   navigator_plugins=True,
-                                   navigator_user_agent=False,
-                                   navigator_vendor=True,
-                                   outerdimensions=True,
-                                   hairline=True)
-            stealth_sync(page, config=config)
+            self.ensure_browser()
+            page = self.page_pool.acquire()
 
             try:
+                self.scheduler.wait(self.proxy)
                 # page.on("request", lambda request: print(f"Запрос: {request.url}"))
                 # page.on("response", lambda response: print(f"Ответ: {response.url}, статус: {response.status}"))
-                page.goto(url)
-                page.wait_for_load_state('networkidle')
-                self._check_server_err(page)
+                start = self.resource_filter.navigation_started()
+                with METRICS.timer("navigation_seconds", page_type=page_type(url)):
+                    page.goto(url, wait_until="domcontentloaded")
+                    # Ждем только элемент, нужный следующему шагу (или страницу ошибки)
+                    selector = wait_selector(url)
+                    if selector is not None:
+                        page.wait_for_selector(selector, state="attached", timeout=20000)
+                    self._check_server_err(page)
+                self.resource_filter.navigation_finished(url, start)
+                METRICS.inc("pages_total", page_type=page_type(url))
+                latency = time.monotonic() - start
+                self.scheduler.on_success(self.proxy, latency)
+                if self.proxy_pool is not None:
+                    self.proxy_pool.report_success(self.proxy, latency)
                 break
             except Exception as e:
                 cntr += 1
                 logging.error(f"Exception found while opening URL:\n {e}")
+                record_failure("open_url", e, self.proxy)
+                self.scheduler.on_failure(self.proxy, failure_kind(e))
+                self.page_pool.discard(page)
                 if cntr < num_attempts:
                     logging.debug("Sleep and restart for trying again")
                     # time.sleep(30)
                     # self.start_browser(False)
-                    if not self.change_proxy():
+                    if not self.change_proxy(failure_kind(e)):
                         status = False
                         break
                 else:
@@ -161,90 +312,106 @@ class ElibraryParser():
         return page
 
     def read_issn_json(self, path):
-        with open(path) as f:
-            json_dict = json.load(f)
-        return json_dict
+        return read_json(path)
 
-    def get_issn_links(self, url: str):
+    def get_issn_links(self, url: str, http_mode=False, http_workers=8):
+        from tqdm import tqdm
+        from link_resolver import JournalLinkResolver
         self.jrnls_issn_dict = self.read_issn_json(self.issn_codes_path)
-        self.issn_links_dict = self.read_issn_json(self.issn_links_path)
-
-        page = self.open_url(url)
-
-        for issn_sublist in tqdm(self.jrnls_issn_dict.values()):
-            for issn in issn_sublist:
-                if issn in self.issn_links_dict:  # skip if already exist
-                    logging.info(f"{issn} already exist, skip")
-                    break
-
-                err_cntr = 0
-                while True:
-                    try:
-                        link = self.get_journal_link(page, issn)
-                        break
-                    except Exception as e:
-                        logging.error(f"Exception found: {e}")
-                        if err_cntr < self.max_retries:
-                            logging.debug("Trying to sleep and restart")
-                            # time.sleep(30)
-                            if not self.change_proxy():
-                                break
-                            page = self.open_url(url)
-                            err_cntr += 1
-                        else:
+        # Найденные ссылки сразу пишутся в постоянный кэш, повторный запуск запрашивает только новые ISSN
+        resolver = JournalLinkResolver(proxy_pool=self.proxy_pool, proxy=self.proxy, workers=http_workers,
+                                       base_url=self.base_url, scheduler=self.scheduler)
+        try:
+            resolver.import_json(self.issn_links_path)
+            if http_mode:
+                pending = resolver.resolve_all(self.jrnls_issn_dict)
+            else:
+                pending = resolver.unresolved(self.jrnls_issn_dict)
+
+            if len(pending) != 0:
+                # Браузер нужен только для журналов, которые не удалось найти по HTTP
+                page = self.open_url(url)
+                for issn_sublist in tqdm(pending.values()):
+                    for issn in issn_sublist:
+                        link = resolver.cached(issn)
+                        if link is None:
+                            page, link = self._get_journal_link_with_retries(page, url, issn)
+                            resolver.store(issn, link)
+                        if len(link) != 0:
                             break
+                self.page_pool.release(page)
+        finally:
+            self.issn_links_dict = resolver.export(self.jrnls_issn_dict, self.issn_links_path)
+            resolver.close()
 
-                if err_cntr > self.max_retries:
-                    raise RuntimeError("Cant working normally, stopping")
-
-                self.issn_links_dict[issn] = link
-                time.sleep(random.uniform(1, 5))
-                if len(link) != 0:
-                    break
-
-            with open(self.issn_links_path, 'w') as fp:
-                json.dump(self.issn_links_dict, fp, ensure_ascii=False)
+    def _get_journal_link_with_retries(self, page: "Page", url: str, issn: str):
+        err_cntr = 0
+        while True:
+            try:
+                self.scheduler.wait(self.proxy)
+                start = time.monotonic()
+                link = self.get_journal_link(page, issn)
+                METRICS.observe("journal_link_seconds", time.monotonic() - start)
+                self.scheduler.on_success(self.proxy, time.monotonic() - start)
+                break
+            except Exception as e:
+                logging.error(f"Exception found: {e}")
+                record_failure("get_journal_link", e, self.proxy)
+                self.scheduler.on_failure(self.proxy, failure_kind(e))
+                if err_cntr < self.max_retries:
+                    logging.debug("Trying to sleep and restart")
+                    # time.sleep(30)
+                    if not self.change_proxy(failure_kind(e)):
+                        raise RuntimeError(f"No proxy left for {issn}, stopping: {e}") from e
+                    page = self.open_url(url)
+                    err_cntr += 1
+                else:
+                    raise RuntimeError(f"Cant working normally, stopping: {e}") from e
+        return page, link
+
+    def _capture(self, page: "Page", page_type: str, query="", page_num=0, **meta):
+        if self.capture is None:
+            return
+        from capture_cache import capture_key
+        self.capture.put(capture_key(page.url, query, page_num), page.url, page_type, page.content(), meta)
+
+    def close(self):
+        if self.capture is not None:
+            self.capture.close()
+            self.capture = None
+        self.close_context()
+        if self.browser is not None:
+            self.browser.close()
+            self.browser = None
+        if self.playwright is not None:
+            self.playwright.stop()
+            self.playwright = None
 
     def __del__(self):
-        if self.context is not None:
-            self.context.close()
+        if self.browser is not None:
             self.browser.close()
 
     def _check_server_err(self, page):
-        if page.locator("h1:has-text('Server Error')").is_visible():
-            raise RuntimeError("Server error catch")
-
-        if page.locator("div#blockedip").is_visible():
-            raise RuntimeError("Anonymous ip blocked!")
-
-        if page.locator("iframe[title='reCAPTCHA']").is_visible():
-            raise CaptchaException("CAPTCHA CHECK DETECTED!")
-
-    def get_journal_link(self, page: Page, issn_code: str) -> str:
-        links = []
+        # Ответ уже классифицирован при перехвате навигации, DOM проверяется только для непросмотренных страниц
+        raise_for_kind(self.block_detector.check(page))
 
+    def get_journal_link(self, page: "Page", issn_code: str) -> str:
         page.locator("#titlename").fill(issn_code)
         button = page.locator("[onclick='title_search()']")
+        # Вместо фиксированной паузы ждем загрузки новой страницы поиска с результатом
+        page.evaluate("window.__elibSearchPending = true")
         button.click()
-        time.sleep(1.5)
+        page.wait_for_function(SEARCH_DONE_JS, timeout=20000)
 
         if page.locator('td.redref:has-text("Не найдено журналов, соответствующих параметрам запроса")').count() > 0:
             logging.info(f"ISSN {issn_code} журналов не найдено.")
-            return links
+            return ""
 
         self._check_server_err(page)
         page.wait_for_selector("#restab", state="attached", timeout=10000)
 
-        result_table = page.locator("#restab")
-        rows = result_table.locator("tr")
-
-        for i in range(rows.count()):
-            row = rows.nth(i)
-            link = row.locator("a[href^='title_items.asp?id='][title]")
-            if link.count() > 0:
-                href = link.first.get_attribute("href")
-                if href:
-                    links.append(href)
+        links = page.locator("#restab").evaluate(JOURNAL_LINKS_JS)
+        self._capture(page, "titles", query=issn_code, issn=issn_code)
 
         if len(links) == 0:
             return ""
@@ -257,132 +424,345 @@ class ElibraryParser():
         page = self.open_url(url)
 
         page.wait_for_selector("#rubrics_table", state="attached", timeout=10000)
-        rubrics_table = page.locator("#rubrics_table")
-        rows = rubrics_table.locator("tr[id^='rubric_']")
-
-        data = {}
-
-        for i in range(rows.count()):  # Проходим по каждой строке
-            row = rows.nth(i)
-
-            # Получаем значение атрибута id
-            row_id = row.get_attribute("id")
-            try:
-                cat_id = re.search(r"rubric_(\d+)", row_id).group(1)
-            except:
-                logging.error(f"Cant find rubric id from {row_id}. Skip")
-                continue
+        rows = page.locator("#rubrics_table").evaluate(RUBRIC_ROWS_JS)
+        data = rubric_rows_to_info((row["row_id"], row["text"]) for row in rows)
+        self._capture(page, "rubrics", link=suburl)
+        self.page_pool.release(page)
+        return data
 
-            # Получаем текст внутри строки
-            row_text = row.locator("td:nth-child(2)").text_content()
-            # try:
-                # cat_id = re.search(r"rubric_(\d+)", row_text).group(1)
-            # except:
-                # print(f"Cant find cat_id from {row_text}. Skip")
-                # continue
+    def _get_journal_pubs_info_with_retries(self, issn: str, link: str) -> Dict:
+        err_cntr = 0
+        while True:
             try:
-                number_in_brackets = re.search(r"\((\d+)\)", row_text).group(1)
-            except:
-                logging.error(f"Cant find count id from {row_text}. Skip")
-                continue
-
-            data[cat_id] = {}
-            data[cat_id]["amount"] = int(number_in_brackets)
-            data[cat_id]["parsed"] = 0
-        page.close()
-        return data
+                logging.info(f"Rubrics info for {issn}")
+                issn_info = self.get_journal_pubs_info(link)
+                break
+            except Exception as e:
+                logging.error(f"Exception found: {e}")
+                record_failure("get_journal_pubs_info", e, self.proxy)
+                if err_cntr < self.max_retries:
+                    logging.debug("Trying to sleep and restart")
+                    # time.sleep(30)
+                    # self.start_browser(False)
+                    if not self.change_proxy(failure_kind(e)):
+                        raise RuntimeError(f"No proxy left for {issn}, stopping: {e}") from e
+                    err_cntr += 1
+                else:
+                    raise RuntimeError(f"Cant working normally, stopping: {e}") from e
+        return issn_info
 
-    def prepare_journals_info(self, categories):
+    def prepare_journals_info(self, categories, http_mode=False, http_workers=16):
         issn_links = self.read_issn_json(self.issn_links_path)
+        pending = {}
         for issn, link in issn_links.items():
             if link == "":
                 logging.info(f"Empty info {issn}. Skip")
                 continue
-            journal_path = Path(f"data/journals/{issn}")
-            journal_path.mkdir(parents=True, exist_ok=True)
-            info_file = journal_path / "info.json"
-            if info_file.exists():
-                issn_info = self.read_issn_json(info_file)
+            issn_info = self.state.journal_info(issn)
+            if issn_info is not None:
+                self._save_journal_info(issn, link, issn_info, categories)
             else:
-                err_cntr = 0
-                while True:
-                    try:
-                        print(issn)
-                        issn_info = self.get_journal_pubs_info(link)
-                        break
-                    except Exception as e:
-                        logging.error(f"Exception found: {e}")
-                        if err_cntr <= self.max_retries:
-                            logging.debug("Trying to sleep and restart")
-                            # time.sleep(30)
-                            # self.start_browser(False)
-                            if not self.change_proxy():
-                                break
-                            err_cntr += 1
-                        else:
-                            break
-
-                if err_cntr >= self.max_retries:
-                    raise RuntimeError("Cant working normally, stopping")
+                pending[issn] = link
+
+        fetched = {}
+        if http_mode and len(pending) != 0:
+            # Быстрый режим: страницы рубрик загружаются без браузера,
+            # заблокированные ответы догружаются через playwright
+            self.ensure_http_client(http_workers)
+            fetched, failed = self.http_client.get_journals_pubs_info(pending, workers=http_workers)
+            logging.info(f"HTTP mode: {len(fetched)} journals fetched, {len(failed)} fall back to browser")
+
+        for issn, link in pending.items():
+            if issn in fetched:
+                issn_info = fetched[issn]
+            else:
+                issn_info = self._get_journal_pubs_info_with_retries(issn, link)
+            self._save_journal_info(issn, link, issn_info, categories)
 
-            cleared_info = copy.deepcopy(issn_info)
-            for category in issn_info.keys():
-                if category not in categories:
-                    del cleared_info[category]
+    def _save_journal_info(self, issn: str, link: str, issn_info: Dict, categories):
+        cleared_info = copy.deepcopy(issn_info)
+        for category in issn_info.keys():
+            if category not in categories:
+                del cleared_info[category]
 
-            with open(info_file, 'w') as fp:
-                json.dump(cleared_info, fp, ensure_ascii=False)
+        self.state.set_journal_info(issn, cleared_info, link)
 
-    def parse_journals(self):
+    def journals_to_parse(self) -> List[Tuple[str, str]]:
+        journals = []
         issn_links = self.read_issn_json(self.issn_links_path)
         for issn, link in issn_links.items():
             if link == "":
                 logging.info(f"Empty info {issn}. Skip")
                 continue
 
-            journal_path = Path(f"data/journals/{issn}")
-            info_file = self.read_issn_json(journal_path / "info.json")
+            info = self.state.journal_info(issn)
+            if info is None:
+                logging.info(f"ISSN {issn} has no rubrics info, run prepare_journals_info first. Skip")
+                continue
 
-            if (journal_path/"done.txt").exists():
+            if self.state.is_done(issn):
                 logging.info(f"Issn {issn} already parsed, skip")
                 continue
 
-            if len(list(info_file.keys())) == 0:
+            if len(list(info.keys())) == 0:
                 logging.info(f"ISSN {issn} dont have useful categories, skip")
                 continue
+            journals.append((issn, link))
+        return journals
+
+    def parse_one_journal(self, issn: str, link: str, single_pass=False) -> bool:
+        logging.info(f"start parse {issn}")
+        cats_info = self.state.journal_info(issn)
+        pending = [rubric for rubric, counters in cats_info.items() if counters["parsed"] < counters["amount"]]
+        if single_pass and len(pending) > 1:
+            self.parse_journal_single_pass(f"{self.base_url}/{link}", issn, pending)
+            cats_info = self.state.journal_info(issn)
+        # После прохода по объединению обычный обход догружает только рубрики, где счетчики не сошлись
+        self.parse_journal(f"{self.base_url}/{link}", cats_info, issn)
+        self.update_info(issn)
+        return self.state.is_done(issn)
+
+    def parse_journals(self, single_pass=False):
+        for issn, link in self.journals_to_parse():
+            self.parse_one_journal(issn, link, single_pass)
+        self.resource_filter.log_summary()
+
+    def parse_journal_single_pass(self, url: str, issn: str, rubrics: List[str]):
+        # Все интересующие рубрики выбираются одним поиском: статья из нескольких рубрик
+        # загружается один раз, принадлежность к рубрикам восстанавливается по страницам статей
+        rubrics = self.state.begin_union_scan(issn, rubrics)
+        err_cntr = 0
+        while True:
+            try:
+                page = self.open_url(url)
+                with METRICS.timer("select_category_seconds"):
+                    page, selected = self.select_categories(page, rubrics)
+                if len(selected) != 0:
+                    self.parse_union_from_table(page, issn, len(selected))
+                self.state.finish_union_scan(issn)
+                break
+            except Exception as e:
+                err_cntr += 1
+                logging.error(f"Error founded = {e}")
+                record_failure("parse_union_from_table", e, self.proxy)
+                self.scheduler.on_failure(self.proxy, failure_kind(e))
+                if err_cntr > self.max_retries or not self.change_proxy(failure_kind(e)):
+                    logging.error(f"Single pass over {issn} failed, fall back to rubric by rubric")
+                    return
+        self.attribute_union(issn, rubrics)
+
+    def select_categories(self, page: "Page", categories: List[str]) -> Tuple["Page", List[str]]:
+        page.wait_for_selector("#hdr_rubrics", state="attached")
+        page.locator("#hdr_rubrics").click()
+        self._check_server_err(page)
 
-            logging.info(f"start parse {issn}")
-            self.parse_journal(f"{self.base_url}/{link}", info_file, journal_path)
-            self.update_info(journal_path)
-
-    def update_info(self, journal_path: Path):
-        info_dict = self.read_issn_json(journal_path / "info.json")
-        rubrics_in_journal = len(list(info_dict.keys()))
-        done_rubrics = 0
-        for rubric, counter in info_dict.items():
-            csv_file = journal_path / f"{rubric}.csv"
-            if not csv_file.exists():
-                continue
+        page.wait_for_selector("#rubrics_table", state="attached")
+        rubrics_table = page.locator("#rubrics_table")
+        page.evaluate('deselect_options("rubric");')
+        selected = []
+        for category in categories:
+            rubric_row = rubrics_table.locator(f"#rubric_{category}")
+            if rubric_row.is_visible():
+                rubric_row.click()
+                selected.append(category)
+        if len(selected) == 0:
+            return page, selected
+
+        with page.expect_navigation(wait_until="domcontentloaded"):
+            page.locator("[onclick='pub_search()']").click()
+        self._check_server_err(page)
+        return page, selected
 
-            with open(csv_file) as f:
-                parsed_cntr = len(f.readlines())
+    def parse_union_from_table(self, page, issn: str, selected: int):
+        page.locator("table#restab").wait_for(state="visible")
+        last_page = self.state.union_last_page(issn)
+        if last_page != 0:
+            self.scheduler.wait(self.proxy)
+            with page.expect_navigation(wait_until="domcontentloaded"):
+                page.evaluate(f'goto_page({last_page+1});')
+        page_num = last_page + 1
 
-            info_dict[rubric]["amount"] = int(counter["amount"])
+        while True:
+            self._check_server_err(page)
+            table = page.locator("table#restab")
+            table.wait_for(state="visible")
+            if not page.locator(f"#rubricsheader:has-text('(выделено: {selected})')").is_visible():
+                raise RuntimeError("Categoty selection dropped")
 
-            if parsed_cntr != counter["parsed"]:
-                info_dict[rubric]["parsed"] = parsed_cntr
+            with METRICS.timer("extract_seconds", table="results"):
+                rows = self.extract_result_rows(page)
+            self._capture(page, "union", "union", page_num, issn=issn)
+            inserted = self.state.complete_union_page(issn, page_num, rows)
+            METRICS.inc("pages_total", page_type="union")
+            METRICS.inc("rows_total", inserted)
+            METRICS.inc("rows_seen_total", len(rows))
 
-            if parsed_cntr >= counter["amount"]:
-                done_rubrics += 1
+            next_page_button = page.locator("td.mouse-hovergr a[title='Следующая страница']")
+            if not next_page_button.is_visible():
+                break
+            self.scheduler.wait(self.proxy)
+            start = time.monotonic()
+            with page.expect_navigation(wait_until="domcontentloaded"):
+                next_page_button.click()
+            self.scheduler.on_success(self.proxy, time.monotonic() - start)
+            page_num += 1
+
+    def attribute_union(self, issn: str, rubrics: List[str]):
+        # Сначала сверка по счетчикам: если рубрике не хватает ровно столько статей, сколько в объединении
+        # еще не записано в нее, то все они ее. Страницы статей (коды ГРНТИ) загружаются только для рубрик,
+        # где счетчики не сходятся, с тем же темпом и сменой прокси, что и остальные запросы
+        from elib_http import rubric_matches
+        from article_details import ItemDetailsStore
+        rows = self.state.unattributed(issn)
+        if len(rows) == 0:
+            return
+        info = self.state.journal_info(issn)
+        by_counts = {}
+        unresolved = {}
+        for rubric in rubrics:
+            if rubric not in info:
+                continue
+            candidates = self.state.union_candidates(issn, rubric)
+            missing = info[rubric]["amount"] - info[rubric]["parsed"]
+            if missing <= 0:
+                by_counts[rubric] = set()
+            elif missing == len(candidates):
+                by_counts[rubric] = set(candidates)
+            else:
+                unresolved[rubric] = set(candidates)
+        logging.info(f"Union {issn}: {len(by_counts)} rubrics attributed by counts, {len(unresolved)} need item pages")
+
+        details = {}
+        if len(unresolved) != 0:
+            to_fetch = set().union(*unresolved.values())
+            details = self._get_items_with_retries([(elib_id, link) for elib_id, _, link, _ in rows
+                                                    if elib_id in to_fetch])
+            item_store = ItemDetailsStore(self.item_details_path)
+            item_store.enqueue((elib_id, link) for elib_id, _, link, _ in rows if elib_id in to_fetch)
+            item_store.save_batch([(elib_id, "done", item) for elib_id, item in details.items()])
+            item_store.close()
+
+        memberships = {}
+        for elib_id, _, _, _ in rows:
+            if any(elib_id in candidates for candidates in unresolved.values()) and elib_id not in details:
+                # Страница не загрузилась: статья остается в объединении до следующей попытки
+                continue
+            memberships[elib_id] = [rubric for rubric, members in by_counts.items() if elib_id in members]
+            memberships[elib_id] += [rubric for rubric, candidates in unresolved.items() if elib_id in candidates
+                                     and any(rubric_matches(rubric, code) for code in details[elib_id]["grnti"])]
+        added = self.state.attribute(issn, memberships)
+        METRICS.inc("union_articles_attributed_total", len(memberships))
+
+        # Сверка со счетчиками рубрик: несошедшиеся рубрики догрузит обычный обход
+        info = self.state.journal_info(issn)
+        for rubric in rubrics:
+            counters = info.get(rubric)
+            if counters is not None and counters["parsed"] < counters["amount"]:
+                logging.info(f"Rubric {issn}/{rubric}: {counters['parsed']} of {counters['amount']} attributed "
+                             f"(+{added.get(rubric, 0)}), will be crawled separately")
+
+    def _get_items_with_retries(self, items: List[Tuple[str, str]], max_attempts=3) -> Dict[str, Dict]:
+        from tqdm import tqdm
+        details = {}
+        for elib_id, link in tqdm(items):
+            for _ in range(max_attempts):
+                self.ensure_http_client(2)
+                self.scheduler.wait(self.proxy)
+                start = time.monotonic()
+                try:
+                    details[elib_id] = self.http_client.get_item(link)
+                except Exception as e:
+                    kind = failure_kind(e)
+                    logging.error(f"Item {elib_id} failed: {e}")
+                    record_failure("attribute_union", e, self.proxy)
+                    self.scheduler.on_failure(self.proxy, kind)
+                    if not self.change_proxy(kind):
+                        # Прокси закончились: оставшиеся рубрики догрузит обычный обход
+                        return details
+                    continue
+                latency = time.monotonic() - start
+                self.scheduler.on_success(self.proxy, latency)
+                if self.proxy_pool is not None:
+                    self.proxy_pool.report_success(self.proxy, latency)
+                METRICS.observe("item_fetch_seconds", latency)
+                break
+        return details
+
+    def parse_journals_until_done(self, max_attempts=20, single_pass=False):
+        # Повторно обходятся только журналы, которые не удалось дообработать,
+        # каждый через свою экспоненциальную паузу вместо общего 10-минутного сна
+        queue = RetryQueue()
+        for issn, link in self.journals_to_parse():
+            queue.push((issn, link))
+
+        while len(queue) != 0:
+            (issn, link), attempt = queue.pop_wait()
+            if self.parse_one_journal(issn, link, single_pass):
+                continue
+            if attempt + 1 >= max_attempts:
+                logging.error(f"ISSN {issn} not finished after {max_attempts} attempts, give up")
+                continue
+            delay = self.scheduler.backoff(attempt)
+            METRICS.inc("retries_total", stage="journal", reason="incomplete")
+            logging.info(f"ISSN {issn} not finished, retry in {delay:.0f}s")
+            queue.push((issn, link), delay=delay, attempt=attempt + 1)
+        logging.info(f"Pacing rates at finish: {self.scheduler.rates()}")
+        self.resource_filter.log_summary()
+
+    def refresh_journals(self, categories, http_mode=False, http_workers=16):
+        # Обновление уже собранных журналов: счетчики рубрик перечитываются и сравниваются с сохраненными,
+        # обходятся только рубрики, где статей стало больше, и только до первой ранее известной статьи
+        issn_links = self.read_issn_json(self.issn_links_path)
+        known = {issn: link for issn, link in issn_links.items()
+                 if link != "" and self.state.journal_info(issn) is not None}
+
+        fetched = {}
+        if http_mode and len(known) != 0:
+            self.ensure_http_client(http_workers)
+            fetched, failed = self.http_client.get_journals_pubs_info(known, workers=http_workers)
+            logging.info(f"HTTP mode: {len(fetched)} journals fetched, {len(failed)} fall back to browser")
+
+        refreshed = 0
+        for issn, link in known.items():
+            stored = self.state.journal_info(issn)
+            issn_info = fetched[issn] if issn in fetched else self._get_journal_pubs_info_with_retries(issn, link)
+            for rubric, counters in issn_info.items():
+                if rubric not in categories:
+                    continue
+                if rubric not in stored or int(counters["amount"]) > stored[rubric]["amount"]:
+                    self.state.begin_refresh(issn, rubric)
+            self._save_journal_info(issn, link, issn_info, categories)
 
-        if rubrics_in_journal == done_rubrics:
-            with open(journal_path / "done.txt", 'w') as fp:
-                fp.write("1")
+            # Незавершенные обновления прошлого запуска продолжаются, хотя счетчики уже сохранены
+            rubrics = self.state.pending_refreshes(issn)
+            if len(rubrics) == 0:
+                continue
+            logging.info(f"Refresh {issn}: rubrics {rubrics}")
+            self.refresh_journal(f"{self.base_url}/{link}", issn, rubrics)
+            self.update_info(issn)
+            refreshed += 1
+        logging.info(f"Refresh finished: {refreshed} of {len(known)} journals had new articles")
+        self.resource_filter.log_summary()
+
+    def refresh_journal(self, url: str, issn: str, rubrics: List[str]):
+        page = self.open_url(url)
+        try:
+            for category in rubrics:
+                with METRICS.timer("select_category_seconds"):
+                    page, status = self.select_category(page, category)
+                if not status:
+                    self.state.finish_refresh(issn, category)
+                    continue
+                self.get_links_from_selected_category(page, category, issn, refresh=True)
+        except Exception as e:
+            logging.error(f"Exception found {e}")
 
-        with open(journal_path / "info.json", 'w') as fp:
-            json.dump(info_dict, fp, ensure_ascii=False)
+    def update_info(self, issn: str):
+        self.state.update_journal(issn)
+        # csv и info.json остаются выходным форматом, источник прогресса - база
+        self.state.export_journal(issn, self.journals_path)
 
-    def select_category(self, page: Page, category: str) -> Union[Page, bool]:
+    def select_category(self, page: "Page", category: str) -> Union["Page", bool]:
         page.wait_for_selector("#hdr_rubrics", state="attached")
         element = page.locator("#hdr_rubrics")
         element.click()
@@ -398,12 +778,12 @@ class ElibraryParser():
         page.evaluate('deselect_options("rubric");')
         rubric_row.click()
         button = page.locator("[onclick='pub_search()']")
-        button.click()
-        page.wait_for_load_state('domcontentloaded')
+        with page.expect_navigation(wait_until="domcontentloaded"):
+            button.click()
         self._check_server_err(page)
         return page, True
 
-    def parse_journal(self, url: str, cats_info: Dict, journal_path: Path) -> Dict:
+    def parse_journal(self, url: str, cats_info: Dict, issn: str) -> Dict:
 
         page = self.open_url(url)
         try:
@@ -412,48 +792,42 @@ class ElibraryParser():
                 if counters["amount"] == counters["parsed"]:
                     continue
 
-                csv_file = journal_path / f"{category}.csv"
-                if csv_file.exists():
-                    with open(csv_file) as f:
-                        parsed_cntr = len(f.readlines())
-                else:
-                    parsed_cntr = 0
+                parsed_cntr = self.state.parsed_count(issn, category)
 
                 if parsed_cntr >= int(counters["amount"]):
                     logging.info(f"Parsed links {parsed_cntr} more or equal to {counters['amount']}, skip")
                     continue
 
-                page, status = self.select_category(page, category)
+                with METRICS.timer("select_category_seconds"):
+                    page, status = self.select_category(page, category)
                 if not status:
                     continue
-                self.get_links_from_selected_category(page, category, journal_path)
+                self.get_links_from_selected_category(page, category, issn)
 
         except Exception as e:
             logging.error(f"Exception found {e}")
         finally:
             return cats_info
 
-    def get_links_from_selected_category(self, page, category: str, journal_path: Path) -> int:
+    def get_links_from_selected_category(self, page, category: str, issn: str, refresh=False) -> int:
         # headers = ['elib_id', 'title', 'link']
-        filename = journal_path / f"{category}.csv"
-        parsed_cntr = 0
         err_cntr = 0
         while True:
             try:
-                if filename.exists():
-                    with open(filename) as f:
-                        parsed_cntr = len(f.readlines())
-                # Открываем файл для добавления данных (append mode)
-                with open(filename, mode="a", newline="", encoding="utf-8") as file:
-                    writer = csv.writer(file)
-                    self.parse_links_from_table(page, parsed_cntr, writer)
+                if refresh:
+                    self.refresh_links_from_table(page, issn, category)
+                else:
+                    # Продолжает с последней сохраненной страницы рубрики
+                    self.parse_links_from_table(page, issn, category)
                 break
             except Exception as e:
                 err_cntr += 1
                 logging.error(f"Error founded = {e}")
+                record_failure("parse_links_from_table", e, self.proxy)
+                self.scheduler.on_failure(self.proxy, failure_kind(e))
                 if err_cntr <= self.max_retries:
                     # print("sleep and try again")
-                    if not self.change_proxy():
+                    if not self.change_proxy(failure_kind(e)):
                         break
                     page = self.open_url(self.last_opened_url)
                     page, status = self.select_category(page, category)
@@ -464,17 +838,20 @@ class ElibraryParser():
                     logging.error("max retries exceeded")
                     break
 
-    def parse_links_from_table(self, page, already_parsed: int, writer):
-        curr_cntr = 0
+    def extract_result_rows(self, page: "Page") -> List[List]:
+        rows = page.locator("table#restab").evaluate(RESULT_ROWS_JS)
+        return result_rows_to_links(rows)
 
+    def parse_links_from_table(self, page, issn: str, category: str):
         table = page.locator("table#restab")
         table.wait_for(state="visible")
-        list_parsed = already_parsed//20
+        last_page = self.state.last_page(issn, category)
 
-        if list_parsed != 0:
-            page.evaluate(f'goto_page({list_parsed+1});')
-            page.wait_for_load_state('domcontentloaded')
-            curr_cntr = list_parsed*20
+        if last_page != 0:
+            self.scheduler.wait(self.proxy)
+            with page.expect_navigation(wait_until="domcontentloaded"):
+                page.evaluate(f'goto_page({last_page+1});')
+        page_num = last_page + 1
 
         while True:
             self._check_server_err(page)
@@ -485,47 +862,204 @@ class ElibraryParser():
             if not selection_locator.is_visible():
                 raise RuntimeError("Categoty selection dropped")
 
-            # Получаем все строки с публикациями
-            rows = table.locator("tr[id^='arw']")
-            for i in range(rows.count()):
-                curr_cntr += 1
-                if curr_cntr <= already_parsed:
-                    continue
-                row = rows.nth(i)
-                link = row.locator("a[href^='/item.asp?id=']").first
+            # Получаем все строки с публикациями за один вызов
+            with METRICS.timer("extract_seconds", table="results"):
+                rows = self.extract_result_rows(page)
+            self._capture(page, "results", f"rubric={category}", page_num, issn=issn, rubric=category)
+            inserted = self.state.complete_page(issn, category, page_num, rows)
+            METRICS.inc("pages_total", page_type="results")
+            METRICS.inc("rows_total", inserted)
+            METRICS.inc("rows_seen_total", len(rows))
+
+            next_page_button = page.locator("td.mouse-hovergr a[title='Следующая страница']")
+            if next_page_button.is_visible():
+                self.scheduler.wait(self.proxy)
+                start = time.monotonic()
+                with page.expect_navigation(wait_until="domcontentloaded"):
+                    next_page_button.click()
+                self.scheduler.on_success(self.proxy, time.monotonic() - start)
+                page_num += 1
+            else:
+                break
 
-                href = link.get_attribute("href") if link else None
-                id_value = href.split("=")[1] if href else None
+    def refresh_links_from_table(self, page, issn: str, category: str):
+        # Выдача идет от новых статей к старым: обход останавливается на странице,
+        # где встретилась статья, известная до начала обновления
+        watermark = self.state.refresh_watermark(issn, category)
+        amount = self.state.journal_info(issn)[category]["amount"]
+        page_num = 1
+        while True:
+            self._check_server_err(page)
+            table = page.locator("table#restab")
+            table.wait_for(state="visible")
 
-                title_element = row.locator("b span")
-                title_text = title_element.text_content().strip() if title_element else None
+            selection_locator = page.locator("#rubricsheader:has-text('(выделено: 1)')")
+            if not selection_locator.is_visible():
+                raise RuntimeError("Categoty selection dropped")
 
-                pub_link = [id_value, title_text.lower(), href]  # headers = ['elib_id', 'title', 'link']
-                writer.writerow(pub_link)
+            with METRICS.timer("extract_seconds", table="results"):
+                rows = self.extract_result_rows(page)
+            self._capture(page, "results", f"rubric={category}", page_num, issn=issn, rubric=category)
+            known = self.state.known_before(issn, category, [row[0] for row in rows], watermark)
+            inserted = self.state.add_articles(issn, category, rows)
+            METRICS.inc("pages_total", page_type="refresh")
+            METRICS.inc("rows_total", inserted)
+            METRICS.inc("rows_seen_total", len(rows))
 
             next_page_button = page.locator("td.mouse-hovergr a[title='Следующая страница']")
-            if next_page_button.is_visible():
-                time.sleep(1)
-                next_page_button.click()
-            else:
+            if known != 0 or self.state.parsed_count(issn, category) >= amount or not next_page_button.is_visible():
+                logging.info(f"Refresh {issn}/{category} stopped at page {page_num}")
                 break
+            self.scheduler.wait(self.proxy)
+            start = time.monotonic()
+            with page.expect_navigation(wait_until="domcontentloaded"):
+                next_page_button.click()
+            self.scheduler.on_success(self.proxy, time.monotonic() - start)
+            page_num += 1
+        self.state.finish_refresh(issn, category)
+
+
+def make_parser(args) -> ElibraryParser:
+    kwargs = {"headless_mode": args.headless, "state_path": args.db, "capture_path": args.capture,
+              "item_details_path": args.item_details}
+    if args.proxies:
+        parser = ElibraryParser.run_with_proxy_pool(args.proxies, prevalidate=args.prevalidate, **kwargs)
+    elif args.proxy_port is not None:
+        parser = ElibraryParser.run_with_constant_proxy(args.proxy_port, **kwargs)
+    else:
+        parser = ElibraryParser(**kwargs)
+    if args.base_url:
+        parser.base_url = args.base_url.rstrip("/")
+    return parser
+
+
+def crawl_async(args):
+    # Асинхронный движок: несколько контекстов браузера, большие рубрики делятся на диапазоны страниц
+    import asyncio
+    from crawl_engine import AsyncCrawlEngine
+
+    proxy_pool = None
+    if args.proxies:
+        proxy_pool = ProxyPool.from_json(args.proxies)
+        proxy_pool.load("./data/proxy_stats.json")
+        if args.prevalidate:
+            proxy_pool.prevalidate()
+    engine = AsyncCrawlEngine(proxy_pool=proxy_pool, concurrency=args.concurrency, headless_mode=args.headless,
+                              max_job_attempts=args.max_attempts, state_path=args.db,
+                              split_pages=args.split_pages, range_pages=args.range_pages)
+    if args.base_url:
+        engine.base_url = args.base_url.rstrip("/")
+    try:
+        asyncio.run(engine.run())
+    finally:
+        engine.state.close()
+
+
+def resolve_issn(args):
+    import asyncio
+    from issn_parse import IssnResolver
+    from journal_catalog import JournalCatalog
+
+    with open(args.names, "r", encoding="utf-8") as file:
+        jrnl_list = [line.strip() for line in file if line.strip()]
+    catalog = JournalCatalog(args.catalog) if os.path.exists(args.catalog) else None
+    resolver = IssnResolver(catalog=catalog)
+    try:
+        asyncio.run(resolver.resolve_all(jrnl_list, args.output))
+    finally:
+        resolver.close()
+
+
+def update_status(args):
+    # Только база состояния: пересчет done и выгрузка csv/info.json без браузера и сети
+    state = CrawlStateStore(args.db)
+    try:
+        issns = args.issn or state.journals()
+        done = 0
+        for issn in issns:
+            state.update_journal(issn)
+            state.export_journal(issn, args.journals)
+            done += state.is_done(issn)
+        print(json.dumps({"journals": len(issns), "done": done}))
+    finally:
+        state.close()
 
 
 def main():
-    BASE_URL = 'https://www.elibrary.ru'
-    parser = ElibraryParser.run_with_constant_proxy()
-    # parser.get_issn_links(f'{BASE_URL}/titles.asp')
-
-    # page = parser.open_url('https://elibrary.ru/title_items.asp?id=27941', 2)
-    # parser.open_url('https://www.google.com', 2)
-
-    # parser = ElibraryParser()
-    # interrst_cats = parser.read_issn_json("data/interrest_cats.json")
-    # parser.prepare_journals_info(interrst_cats)
-    for i in range(20):
-        parser.parse_journals()
-        logging.info("Sleep 10min")
-        time.sleep(600)
+    arg_parser = argparse.ArgumentParser(description="Elibrary journals parser pipeline")
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+
+    issn_cmd = commands.add_parser("resolve-issn", help="journal names -> issn_codes.json (step 2)")
+    issn_cmd.add_argument("--names", default="./data/journals.txt")
+    issn_cmd.add_argument("--output", default="./data/issn_codes.json")
+    issn_cmd.add_argument("--catalog", default="./data/journal_catalog.sqlite")
+
+    crawl_args = argparse.ArgumentParser(add_help=False)
+    crawl_args.add_argument("--db", default="./data/crawl_state.sqlite")
+    crawl_args.add_argument("--item-details", default="./data/item_details.sqlite",
+                            help="article_details.py database for item pages fetched by the union step")
+    crawl_args.add_argument("--proxies", default=None, help="proxy list (json) for ProxyPool")
+    crawl_args.add_argument("--prevalidate", action="store_true", help="check proxies before start")
+    crawl_args.add_argument("--proxy-port", type=int, default=None, help="first port of the rotating proxy")
+    crawl_args.add_argument("--headless", action="store_true")
+    crawl_args.add_argument("--base-url", default=None)
+    crawl_args.add_argument("--capture", default=None, metavar="DIR", help="save fetched HTML to this capture cache")
+    crawl_args.add_argument("--metrics", default="./data/metrics.json")
+    crawl_args.add_argument("--http", action="store_true", help="fetch over HTTP, browser only for blocked answers")
+    crawl_args.add_argument("--http-workers", type=int, default=16)
+
+    commands.add_parser("resolve-links", parents=[crawl_args], help="issn_codes.json -> issn_links.json (step 3)")
+    prepare_cmd = commands.add_parser("prepare", parents=[crawl_args], help="rubric counters for each journal (step 4)")
+    prepare_cmd.add_argument("--categories", default="data/interrest_cats.json")
+    crawl_cmd = commands.add_parser("crawl", parents=[crawl_args], help="collect article links (step 5)")
+    crawl_cmd.add_argument("--categories", default="data/interrest_cats.json")
+    crawl_cmd.add_argument("--max-attempts", type=int, default=20)
+    crawl_cmd.add_argument("--single-pass", action="store_true")
+    crawl_cmd.add_argument("--refresh", action="store_true", help="only new articles of already crawled journals")
+    crawl_cmd.add_argument("--engine", choices=["sync", "async"], default="sync",
+                           help="async: crawl_engine.py with parallel contexts and page range fan-out")
+    crawl_cmd.add_argument("--concurrency", type=int, default=8, help="browser contexts of the async engine")
+    crawl_cmd.add_argument("--split-pages", type=int, default=40, help="async: split rubrics from this many pages")
+    crawl_cmd.add_argument("--range-pages", type=int, default=20, help="async: pages per range")
+
+    status_cmd = commands.add_parser("update-status", help="recount done flags and export csv/info.json")
+    status_cmd.add_argument("--db", default="./data/crawl_state.sqlite")
+    status_cmd.add_argument("--journals", default="data/journals")
+    status_cmd.add_argument("--issn", nargs="*", default=None)
+    args = arg_parser.parse_args()
+
+    if args.command == "resolve-issn":
+        resolve_issn(args)
+        return
+    if args.command == "update-status":
+        update_status(args)
+        return
+    if args.command == "crawl" and args.engine == "async":
+        if args.single_pass or args.refresh or args.proxy_port is not None or args.capture:
+            arg_parser.error("--engine async supports only --proxies, without --single-pass, --refresh, "
+                             "--proxy-port and --capture")
+        METRICS.start_snapshot_writer(args.metrics)
+        try:
+            crawl_async(args)
+        finally:
+            METRICS.write_snapshot(args.metrics)
+        return
+
+    METRICS.start_snapshot_writer(args.metrics)
+    parser = make_parser(args)
+    try:
+        if args.command == "resolve-links":
+            parser.get_issn_links(f"{parser.base_url}/titles.asp", http_mode=args.http, http_workers=args.http_workers)
+        elif args.command == "prepare":
+            parser.prepare_journals_info(read_json(args.categories), http_mode=args.http, http_workers=args.http_workers)
+        elif args.refresh:
+            parser.refresh_journals(read_json(args.categories), http_mode=args.http, http_workers=args.http_workers)
+        else:
+            parser.parse_journals_until_done(max_attempts=args.max_attempts, single_pass=args.single_pass)
+    finally:
+        parser.close()
+        # Фоновый писатель сохраняет снимок раз в 30 секунд, итоговое состояние пишется при выходе
+        METRICS.write_snapshot(args.metrics)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,174 @@
+import os
+import time
+import socket
+import sqlite3
+import logging
+import threading
+
+from pathlib import Path
+from contextlib import contextmanager
+from typing import List, Dict, Optional, Iterable, Tuple
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS leases (
+    unit TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    worker TEXT,
+    expires_at REAL NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'pending'
+);
+CREATE INDEX IF NOT EXISTS leases_claim ON leases (kind, status, expires_at);
+"""
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class WorkUnit():
+    def __init__(self, unit: str, kind: str, payload: str, attempts: int):
+        self.unit = unit
+        self.kind = kind
+        self.payload = payload
+        self.attempts = attempts
+
+    def __repr__(self):
+        return f"WorkUnit({self.unit}, attempts={self.attempts})"
+
+
+class LeaseStore():
+    # Распределение работы без координатора: узлы забирают единицы работы через аренду
+    # с истекающим сроком в общей базе. Если узел умер, его аренда истекает и единицу забирает другой
+    def __init__(self, path="./data/crawl_state.sqlite", worker_id: Optional[str] = None, lease_ttl=300.0,
+                 max_attempts=10):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.worker_id = worker_id or default_worker_id()
+        self.lease_ttl = lease_ttl
+        self.max_attempts = max_attempts
+        self.conn = self._connect()
+        self.conn.executescript(SCHEMA)
+        self._heartbeat = None
+        self._stopped = threading.Event()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.path), isolation_level=None, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        return conn
+
+    @contextmanager
+    def transaction(self, conn: Optional[sqlite3.Connection] = None):
+        conn = conn or self.conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+
+    def seed(self, kind: str, units: Iterable[Tuple[str, str]]) -> int:
+        # Все узлы могут засевать одну и ту же работу: уже известные единицы не трогаются
+        with self.transaction() as conn:
+            before = conn.total_changes
+            conn.executemany("INSERT OR IGNORE INTO leases (unit, kind, payload) VALUES (?, ?, ?)",
+                             [(f"{kind}:{key}", kind, payload) for key, payload in units])
+            return conn.total_changes - before
+
+    def claim(self, kind: str) -> Optional[WorkUnit]:
+        now = time.time()
+        with self.transaction() as conn:
+            row = conn.execute("SELECT unit, kind, payload, attempts, worker FROM leases "
+                               "WHERE kind = ? AND status = 'pending' AND expires_at < ? AND attempts < ? "
+                               "ORDER BY attempts, rowid LIMIT 1",
+                               (kind, now, self.max_attempts)).fetchone()
+            if row is None:
+                return None
+            unit, kind, payload, attempts, previous = row
+            conn.execute("UPDATE leases SET worker = ?, expires_at = ?, attempts = attempts + 1 WHERE unit = ?",
+                         (self.worker_id, now + self.lease_ttl, unit))
+        if previous is not None and previous != self.worker_id:
+            logging.info(f"Lease {unit} reclaimed from {previous}")
+        return WorkUnit(unit, kind, payload, attempts + 1)
+
+    def renew(self, conn: Optional[sqlite3.Connection] = None) -> int:
+        conn = conn or self.conn
+        cursor = conn.execute("UPDATE leases SET expires_at = ? WHERE worker = ? AND status = 'pending' "
+                              "AND expires_at >= ?", (time.time() + self.lease_ttl, self.worker_id, time.time()))
+        return cursor.rowcount
+
+    def complete(self, unit: WorkUnit):
+        # Результаты уже слиты идемпотентно, поэтому единица закрывается, даже если аренду успел забрать другой узел
+        cursor = self.conn.execute("UPDATE leases SET status = 'done', expires_at = 0 WHERE unit = ? AND worker = ?",
+                                   (unit.unit, self.worker_id))
+        if cursor.rowcount == 0:
+            logging.error(f"Lease {unit.unit} was lost before completion")
+            self.conn.execute("UPDATE leases SET status = 'done' WHERE unit = ?", (unit.unit,))
+
+    def release(self, unit: WorkUnit):
+        # Неудачная попытка: единица сразу становится доступна другим узлам
+        status = "failed" if unit.attempts >= self.max_attempts else "pending"
+        self.conn.execute("UPDATE leases SET worker = NULL, expires_at = 0, status = ? WHERE unit = ? AND worker = ?",
+                          (status, unit.unit, self.worker_id))
+        if status == "failed":
+            logging.error(f"Unit {unit.unit} failed after {unit.attempts} attempts, give up")
+
+    def has_pending(self, kind: str) -> bool:
+        # Незавершенные единицы: доступные для захвата или еще удерживаемые живым узлом
+        return self.conn.execute("SELECT 1 FROM leases WHERE kind = ? AND status = 'pending' "
+                                 "AND (attempts < ? OR expires_at >= ?) LIMIT 1",
+                                 (kind, self.max_attempts, time.time())).fetchone() is not None
+
+    def next_expiry_in(self, kind: str) -> Optional[float]:
+        row = self.conn.execute("SELECT MIN(expires_at) FROM leases WHERE kind = ? AND status = 'pending' "
+                                "AND attempts < ?", (kind, self.max_attempts)).fetchone()
+        if row[0] is None:
+            return None
+        return max(row[0] - time.time(), 0.0)
+
+    def stats(self, kind: Optional[str] = None) -> Dict:
+        query = "SELECT status, COUNT(*) FROM leases"
+        params = ()
+        if kind is not None:
+            query += " WHERE kind = ?"
+            params = (kind,)
+        stats = dict(self.conn.execute(query + " GROUP BY status", params).fetchall())
+        stats["leased"] = self.conn.execute("SELECT COUNT(*) FROM leases WHERE status = 'pending' AND expires_at >= ?"
+                                            + (" AND kind = ?" if kind else ""),
+                                            (time.time(), *params)).fetchone()[0]
+        return stats
+
+    def workers(self) -> List[str]:
+        rows = self.conn.execute("SELECT DISTINCT worker FROM leases WHERE status = 'pending' AND expires_at >= ?",
+                                 (time.time(),)).fetchall()
+        return [worker for (worker,) in rows]
+
+    def start_heartbeat(self, interval: Optional[float] = None) -> threading.Thread:
+        # Аренды продлеваются из отдельного потока со своим соединением, пока процесс жив
+        interval = interval or self.lease_ttl / 3
+
+        def loop():
+            conn = self._connect()
+            try:
+                while not self._stopped.wait(interval):
+                    try:
+                        self.renew(conn)
+                    except sqlite3.Error as e:
+                        logging.error(f"Cant renew leases: {e}")
+            finally:
+                conn.close()
+
+        self._heartbeat = threading.Thread(target=loop, daemon=True)
+        self._heartbeat.start()
+        return self._heartbeat
+
+    def close(self):
+        self._stopped.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+        self.conn.close()
@@ -0,0 +1,159 @@
+import json
+import time
+import logging
+import threading
+
+from tqdm import tqdm
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from typing import Dict, List, Optional
+
+from disk_cache import TTLCache, MISSING
+from elib_http import ElibraryHttpClient, BlockedResponse, BASE_URL
+from proxy_pool import ProxyPool
+from scheduler import Scheduler
+
+
+DAY = 24 * 60 * 60
+
+
+class JournalLinkResolver():
+    # Ссылки на журналы по ISSN: запросы к поиску каталога идут напрямую по HTTP в несколько потоков,
+    # каждый ответ сразу фиксируется в кэше, "Не найдено журналов" кэшируется на меньший срок
+    def __init__(self, proxy_pool: Optional[ProxyPool] = None, proxy: Optional[Dict] = None, workers=8,
+                 base_url=BASE_URL, cache_path="./data/issn_links_cache.sqlite", ttl=90 * DAY,
+                 negative_ttl=14 * DAY, scheduler: Optional[Scheduler] = None):
+        self.proxy_pool = proxy_pool
+        self.proxy = proxy
+        self.workers = workers
+        self.base_url = base_url
+        self.negative_ttl = negative_ttl
+        self.cache = TTLCache(cache_path, ttl=ttl)
+        self.scheduler = scheduler or Scheduler()
+        self._local = threading.local()
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def cached(self, issn: str) -> Optional[str]:
+        link = self.cache.get(issn)
+        return None if link is MISSING else link
+
+    def store(self, issn: str, link: str):
+        self.cache.set(issn, link, ttl=self.negative_ttl if link == "" else None)
+
+    def import_json(self, path: str) -> int:
+        # Однократный перенос issn_links.json, собранного до появления кэша. issn_links.json сам
+        # выгружается из кэша, поэтому повторный импорт продлевал бы просроченные записи без конца
+        if not Path(path).exists() or not self.cache.is_empty():
+            return 0
+        with open(path) as f:
+            links = json.load(f)
+        for issn, link in links.items():
+            self.store(issn, link if isinstance(link, str) else "")
+        return len(links)
+
+    def unresolved(self, jrnls_issn_dict: Dict[str, List[str]]) -> Dict[str, List[str]]:
+        pending = {}
+        for name, issns in jrnls_issn_dict.items():
+            links = [self.cached(issn) for issn in issns]
+            if any(link for link in links) or all(link is not None for link in links):
+                continue
+            pending[name] = issns
+        return pending
+
+    def _client(self):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            proxy = self.proxy
+            if self.proxy_pool is not None:
+                proxy = self.proxy_pool.acquire_wait()
+                if proxy is None:
+                    raise RuntimeError("No more proxies")
+            client = ElibraryHttpClient(proxy=proxy, pool_size=2, base_url=self.base_url)
+            self._local.client = client
+            self._local.proxy = proxy
+            with self._lock:
+                self._clients[id(client)] = (client, proxy)
+        return client, self._local.proxy
+
+    def _drop_client(self, kind: str):
+        # Заблокированный прокси потока возвращается в пул, следующий запрос возьмет другой
+        proxy = self._local.proxy
+        if self.proxy_pool is not None:
+            with self._lock:
+                self._clients.pop(id(self._local.client))
+            self._local.client.close()
+            self._local.client = None
+            self.proxy_pool.report_failure(proxy, kind)
+            self.proxy_pool.release(proxy)
+
+    def fetch(self, issn: str) -> str:
+        client, proxy = self._client()
+        self.scheduler.wait(proxy)
+        start = time.monotonic()
+        try:
+            link = client.get_journal_link(issn)
+        except BlockedResponse as e:
+            self.scheduler.on_failure(proxy, e.kind)
+            self._drop_client(e.kind)
+            raise
+        except Exception:
+            self.scheduler.on_failure(proxy, "error")
+            raise
+        latency = time.monotonic() - start
+        self.scheduler.on_success(proxy, latency)
+        if self.proxy_pool is not None:
+            self.proxy_pool.report_success(proxy, latency)
+        return link
+
+    def resolve_journal(self, issns: List[str]) -> str:
+        for issn in issns:
+            link = self.cached(issn)
+            if link is None:
+                link = self.fetch(issn)
+                self.store(issn, link)
+            if link != "":
+                return link
+        return ""
+
+    def resolve_all(self, jrnls_issn_dict: Dict[str, List[str]]) -> Dict[str, List[str]]:
+        # Возвращает журналы, которые не удалось разрешить по HTTP, их догружает браузер
+        pending = self.unresolved(jrnls_issn_dict)
+        failed = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(self.resolve_journal, issns): name for name, issns in pending.items()}
+            for future in tqdm(as_completed(futures), total=len(futures)):
+                name = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    logging.error(f"HTTP link lookup failed for {name}: {e}")
+                    failed[name] = pending[name]
+        logging.info(f"HTTP link lookup: {len(pending) - len(failed)} journals resolved, {len(failed)} failed")
+        return failed
+
+    def export(self, jrnls_issn_dict: Dict[str, List[str]], output_path: str) -> Dict[str, str]:
+        # issn_links.json остается выходным форматом: собирается из кэша и заменяется атомарно
+        issn_links = {}
+        for issns in jrnls_issn_dict.values():
+            for issn in issns:
+                link = self.cached(issn)
+                if link is None:
+                    break
+                issn_links[issn] = link
+                if link != "":
+                    break
+        tmp_path = f"{output_path}.tmp"
+        with open(tmp_path, 'w') as fp:
+            json.dump(issn_links, fp, ensure_ascii=False)
+        Path(tmp_path).replace(output_path)
+        return issn_links
+
+    def close(self):
+        for client, proxy in self._clients.values():
+            client.close()
+            if self.proxy_pool is not None:
+                self.proxy_pool.release(proxy)
+        self._clients = {}
+        self.cache.close()
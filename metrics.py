@@ -0,0 +1,172 @@
+import json
+import time
+import logging
+import threading
+
+from pathlib import Path
+from contextlib import contextmanager
+
+from typing import Dict, Tuple, Optional
+
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram():
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def to_dict(self) -> Dict:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 4),
+            "avg": round(self.sum / self.count, 4) if self.count else None,
+            "buckets": {str(bound): count for bound, count in zip(self.buckets, self.counts)},
+        }
+
+
+def _labels_key(labels: Dict) -> Tuple:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(key: Tuple, extra: Optional[Tuple] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if len(pairs) == 0:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+class Metrics():
+    def __init__(self, prefix="elib"):
+        self.prefix = prefix
+        self.started_at = time.time()
+        self.counters: Dict[str, Dict[Tuple, float]] = {}
+        self.histograms: Dict[str, Dict[Tuple, Histogram]] = {}
+        self._lock = threading.Lock()
+        self._http = None
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = _labels_key(labels)
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = _labels_key(labels)
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(name, time.monotonic() - start, **labels)
+
+    def sleep(self, seconds: float, reason: str):
+        # Все паузы парсера учитываются отдельно, чтобы было видно, сколько времени уходит на ожидание
+        self.inc("sleep_seconds_total", seconds, reason=reason)
+        time.sleep(seconds)
+
+    def total(self, name: str) -> float:
+        with self._lock:
+            return sum(self.counters.get(name, {}).values())
+
+    def snapshot(self) -> Dict:
+        uptime = time.time() - self.started_at
+        with self._lock:
+            counters = {name: {_format_labels(key) or "total": value for key, value in series.items()}
+                        for name, series in self.counters.items()}
+            histograms = {name: {_format_labels(key) or "total": hist.to_dict() for key, hist in series.items()}
+                          for name, series in self.histograms.items()}
+        rates = {}
+        for name in ("pages_total", "rows_total", "retries_total"):
+            rates[name.replace("_total", "_per_s")] = round(self.total(name) / uptime, 3) if uptime else 0.0
+        return {"timestamp": time.time(), "uptime_s": round(uptime, 1), "rates": rates,
+                "counters": counters, "histograms": histograms}
+
+    def to_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            for name, series in sorted(self.counters.items()):
+                metric = f"{self.prefix}_{name}"
+                lines.append(f"# TYPE {metric} counter")
+                for key, value in series.items():
+                    lines.append(f"{metric}{_format_labels(key)} {value}")
+            for name, series in sorted(self.histograms.items()):
+                metric = f"{self.prefix}_{name}"
+                lines.append(f"# TYPE {metric} histogram")
+                for key, hist in series.items():
+                    for bound, count in zip(hist.buckets, hist.counts):
+                        lines.append(f"{metric}_bucket{_format_labels(key, ('le', str(bound)))} {count}")
+                    lines.append(f"{metric}_bucket{_format_labels(key, ('le', '+Inf'))} {hist.count}")
+                    lines.append(f"{metric}_sum{_format_labels(key)} {hist.sum}")
+                    lines.append(f"{metric}_count{_format_labels(key)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_snapshot(self, path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as fp:
+            json.dump(self.snapshot(), fp, ensure_ascii=False, indent=2)
+        Path(tmp_path).replace(path)
+
+    def start_snapshot_writer(self, path="./data/metrics.json", interval=30.0) -> threading.Thread:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.write_snapshot(path)
+                except Exception as e:
+                    logging.error(f"Cant write metrics snapshot: {e}")
+
+        thread = threading.Thread(target=loop, daemon=True)
+        thread.start()
+        return thread
+
+    def start_http_server(self, port=9108, host="127.0.0.1"):
+        from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.startswith("/metrics.json"):
+                    body, content_type = json.dumps(metrics.snapshot(), ensure_ascii=False), "application/json"
+                elif self.path.startswith("/metrics"):
+                    body, content_type = metrics.to_prometheus(), "text/plain; version=0.0.4"
+                else:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                data = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._http = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._http.serve_forever, daemon=True).start()
+        logging.info(f"Metrics endpoint at http://{host}:{port}/metrics")
+        return self._http
+
+
+METRICS = Metrics()
@@ -0,0 +1,139 @@
+import os
+import logging
+
+from typing import TYPE_CHECKING, List, Dict, Optional, Callable
+
+# psutil импортируется при первой проверке памяти, а не при импорте модуля (см. journals_parser.py CLI).
+# None - еще не проверяли, False - пакета нет
+_psutil = None
+
+if TYPE_CHECKING:
+    from playwright.sync_api._generated import Page, BrowserContext
+    from playwright_stealth import StealthConfig
+
+
+def apply_stealth(context: "BrowserContext", config: "StealthConfig"):
+    # Скрипты stealth добавляются один раз на контекст и применяются ко всем его вкладкам
+    for script in config.enabled_scripts:
+        context.add_init_script(script)
+
+
+def browser_rss_mb() -> Optional[float]:
+    global _psutil
+    if _psutil is None:
+        try:
+            import psutil as _psutil
+        except ImportError:
+            # Без psutil браузер перезапускается только по числу переходов
+            _psutil = False
+    if _psutil is False:
+        return None
+    # Память процесса драйвера playwright и всех процессов chromium
+    rss = 0
+    for child in _psutil.Process(os.getpid()).children(recursive=True):
+        try:
+            rss += child.memory_info().rss
+        except (_psutil.NoSuchProcess, _psutil.AccessDenied):
+            continue
+    return rss / 1024 / 1024
+
+
+class PagePool():
+    def __init__(self, max_tabs=2, max_navigations=300, max_rss_mb=2048.0, rss_check_every=20,
+                 on_recycle: Optional[Callable[[], None]] = None):
+        self.max_tabs = max_tabs
+        self.max_navigations = max_navigations
+        self.max_rss_mb = max_rss_mb
+        self.rss_check_every = rss_check_every
+        self.rss_checked_at = 0
+        self.on_recycle = on_recycle
+        self.context: Optional["BrowserContext"] = None
+        self.idle: List["Page"] = []
+        self.leased: List["Page"] = []
+        self.navigations = 0
+        self.navigations_since_recycle = 0
+        self.pages_created = 0
+        self.pages_closed = 0
+        self.recycles = 0
+        self.last_rss_mb = 0.0
+
+    def attach(self, context: "BrowserContext"):
+        # Новый контекст: старые вкладки закрыты вместе с прежним контекстом
+        self.context = context
+        self.idle = []
+        self.leased = []
+        self.navigations_since_recycle = 0
+        self.rss_checked_at = 0
+
+    def needs_recycle(self) -> Optional[str]:
+        if self.navigations_since_recycle >= self.max_navigations:
+            return f"{self.navigations_since_recycle} navigations"
+        # Обход дерева процессов браузера дорогой, память проверяется раз в rss_check_every переходов
+        if self.navigations_since_recycle - self.rss_checked_at < self.rss_check_every:
+            return None
+        self.rss_checked_at = self.navigations_since_recycle
+        rss_mb = browser_rss_mb()
+        if rss_mb is None:
+            return None
+        self.last_rss_mb = rss_mb
+        if self.last_rss_mb >= self.max_rss_mb:
+            return f"RSS {self.last_rss_mb:.0f} MB"
+        return None
+
+    def acquire(self) -> "Page":
+        reason = self.needs_recycle() if self.on_recycle is not None else None
+        if reason is not None:
+            self.recycles += 1
+            logging.info(f"Recycle browser after {reason}: {self.stats()}")
+            self.on_recycle()
+
+        if len(self.idle) != 0:
+            page = self.idle.pop()
+        else:
+            # Лимит вкладок: закрываем самые старые выданные страницы
+            while len(self.leased) >= self.max_tabs:
+                self._close(self.leased.pop(0))
+            page = self.context.new_page()
+            page.on("framenavigated", lambda frame, page=page: self._on_navigated(page, frame))
+            self.pages_created += 1
+        self.leased.append(page)
+        return page
+
+    def release(self, page: "Page"):
+        if page in self.leased:
+            self.leased.remove(page)
+        if page.is_closed():
+            return
+        if len(self.idle) + len(self.leased) < self.max_tabs:
+            self.idle.append(page)
+        else:
+            self._close(page)
+
+    def discard(self, page: "Page"):
+        if page in self.leased:
+            self.leased.remove(page)
+        self._close(page)
+
+    def stats(self) -> Dict:
+        return {
+            "open_pages": len(self.idle) + len(self.leased),
+            "navigations": self.navigations,
+            "navigations_since_recycle": self.navigations_since_recycle,
+            "pages_created": self.pages_created,
+            "pages_closed": self.pages_closed,
+            "recycles": self.recycles,
+            "rss_mb": round(self.last_rss_mb, 1),
+        }
+
+    def _on_navigated(self, page: "Page", frame):
+        if frame == page.main_frame:
+            self.navigations += 1
+            self.navigations_since_recycle += 1
+
+    def _close(self, page: "Page"):
+        if not page.is_closed():
+            try:
+                page.close()
+            except Exception as e:
+                logging.error(f"Error while closing page: {e}")
+        self.pages_closed += 1
@@ -1,29 +1,72 @@
-import requests
+import time
 import json
+import argparse
+import requests
 from tqdm import tqdm
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from typing import List, Dict, Tuple, Optional
+
+from elib_http import requests_proxies
 
 
 proxy_ip = ""
-proxy_port = 2000
 proxy_login = ""
 proxy_pass = ""
 
-proxies = {
-    "http": f"http://{proxy_login}:{proxy_pass}@{proxy_ip}:{proxy_port}",
-    "https": f"http://{proxy_login}:{proxy_pass}@{proxy_ip}:{proxy_port}"
-}
-
 # Pretend to be Firefox
 headers = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:87.0) Gecko/20100101 Firefox/87.0',
     'Accept-Language': 'en-US,en;q=0.5'
 }
 
+CHECK_URL = "https://checkip.amazonaws.com"
+
+
+def check_proxy(proxy: Dict, url: Optional[str] = None, timeout=20) -> Tuple[Dict, bool, Optional[float], str]:
+    start = time.monotonic()
+    try:
+        r = requests.get(url or CHECK_URL, proxies=requests_proxies(proxy), headers=headers, timeout=timeout)
+        r.raise_for_status()
+        return proxy, True, time.monotonic() - start, r.text.strip()
+    except Exception as e:
+        return proxy, False, None, str(e)
+
+
+def check_proxies(proxies: List[Dict], workers=32, url=None, timeout=20) -> List[Tuple[Dict, bool, Optional[float], str]]:
+    results = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(check_proxy, proxy, url, timeout) for proxy in proxies]
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            results.append(future.result())
+    return results
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Bulk proxy checker")
+    arg_parser.add_argument("--first-port", type=int, default=2000)
+    arg_parser.add_argument("--last-port", type=int, default=2445)
+    arg_parser.add_argument("--workers", type=int, default=32)
+    arg_parser.add_argument("--url", default=CHECK_URL)
+    arg_parser.add_argument("--output", default="data/proxies.json")
+    args = arg_parser.parse_args()
+
+    proxies = [{
+        "server": f"http://{proxy_ip}:{port}",
+        "username": proxy_login,
+        "password": proxy_pass
+    } for port in range(args.first_port, args.last_port + 1)]
+
+    results = check_proxies(proxies, workers=args.workers, url=args.url)
+    alive = sorted((r for r in results if r[1]), key=lambda r: r[2])
+    for proxy, _, latency, text in alive:
+        print(f"{proxy['server']}\t{latency:.2f}s\t{text}")
+    print(f"Alive: {len(alive)} of {len(results)}")
+
+    # Рабочие прокси в порядке задержки, для ProxyPool.from_json
+    with open(args.output, 'w') as fp:
+        json.dump([r[0] for r in alive], fp, ensure_ascii=False)
+
 
-# # Change the URL to your target website
-url = "https://checkip.amazonaws.com"
-try:
-    r = requests.get(url, proxies=proxies, headers=headers, timeout=20)
-    print(r.text)
-except Exception as e:
-    print(e)
+if __name__ == "__main__":
+    main()
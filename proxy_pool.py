@@ -0,0 +1,238 @@
+import json
+import time
+import logging
+import threading
+
+from pathlib import Path
+from typing import List, Dict, Optional
+
+
+class ProxyStats():
+    def __init__(self, proxy: Dict):
+        self.proxy = proxy
+        self.requests = 0
+        self.successes = 0
+        self.failures = 0
+        self.captchas = 0
+        self.blocks = 0
+        self.latency = None
+        self.consecutive_failures = 0
+        self.quarantined_until = 0.0
+        self.retired = False
+        self.in_use = 0
+
+    @property
+    def key(self) -> str:
+        return proxy_key(self.proxy)
+
+    def state(self, now: float) -> str:
+        # Автомат размыкателя: closed - обычная работа, open - карантин,
+        # half_open - карантин истек, прокси получает один пробный запрос
+        if self.quarantined_until == 0:
+            return "closed"
+        if self.quarantined_until > now:
+            return "open"
+        return "half_open"
+
+    def is_available(self, now: float) -> bool:
+        if self.retired:
+            return False
+        state = self.state(now)
+        return state == "closed" or (state == "half_open" and self.in_use == 0)
+
+    def score(self) -> float:
+        # Сглаженная доля успешных запросов со штрафом за капчи и блокировки,
+        # деленная на задержку: быстрые и чистые прокси выдаются первыми
+        success_rate = (self.successes + 1) / (self.requests + 2)
+        penalty = (2 * self.captchas + 3 * self.blocks) / (self.requests + 2)
+        latency = self.latency if self.latency is not None else 5.0
+        return (success_rate - penalty) / (1 + latency / 10)
+
+    def to_dict(self) -> Dict:
+        return {
+            "proxy": self.proxy,
+            "requests": self.requests,
+            "successes": self.successes,
+            "failures": self.failures,
+            "captchas": self.captchas,
+            "blocks": self.blocks,
+            "latency": self.latency,
+            "consecutive_failures": self.consecutive_failures,
+            "quarantined_until": self.quarantined_until,
+            "retired": self.retired,
+            "state": self.state(time.time()),
+            "score": round(self.score(), 4),
+        }
+
+
+def proxy_key(proxy: Dict) -> str:
+    return proxy["server"]
+
+
+class ProxyPool():
+    def __init__(self, proxies: List[Dict], base_cooldown=30.0, max_cooldown=3600.0,
+                 max_consecutive_failures=12, latency_alpha=0.3, error_threshold=3):
+        self.base_cooldown = base_cooldown
+        self.error_threshold = error_threshold
+        self.max_cooldown = max_cooldown
+        self.max_consecutive_failures = max_consecutive_failures
+        self.latency_alpha = latency_alpha
+        self.stats: Dict[str, ProxyStats] = {}
+        self._lock = threading.Lock()
+        for proxy in proxies:
+            self.stats[proxy_key(proxy)] = ProxyStats(proxy)
+
+    @classmethod
+    def from_port_range(cls, proxy_ip: str, proxy_login: str, proxy_pass: str, first_port: int, last_port: int, **kwargs):
+        proxies = [{
+            "server": f"http://{proxy_ip}:{port}",
+            "username": proxy_login,
+            "password": proxy_pass
+        } for port in range(first_port, last_port + 1)]
+        return cls(proxies, **kwargs)
+
+    @classmethod
+    def from_json(cls, path, **kwargs):
+        with open(path) as f:
+            proxies = json.load(f)
+        return cls(proxies, **kwargs)
+
+    def __len__(self):
+        return len(self.stats)
+
+    def acquire(self, exclude: Optional[Dict] = None) -> Optional[Dict]:
+        now = time.time()
+        with self._lock:
+            candidates = [s for s in self.stats.values()
+                          if s.is_available(now) and (exclude is None or s.key != proxy_key(exclude))]
+            if len(candidates) == 0:
+                return None
+            # Сначала свободные прокси, среди них - с лучшим рейтингом
+            best = max(candidates, key=lambda s: (-s.in_use, s.score()))
+            best.in_use += 1
+            return best.proxy
+
+    def release(self, proxy: Optional[Dict]):
+        if proxy is None:
+            return
+        with self._lock:
+            stats = self.stats.get(proxy_key(proxy))
+            if stats is not None and stats.in_use > 0:
+                stats.in_use -= 1
+
+    def next_available_in(self) -> Optional[float]:
+        now = time.time()
+        with self._lock:
+            # Пробный запрос уже выдан: прокси освободится по его результату, а не по времени
+            waits = [self.base_cooldown if s.state(now) == "half_open" and s.in_use > 0
+                     else max(0.0, s.quarantined_until - now) for s in self.stats.values() if not s.retired]
+        if len(waits) == 0:
+            return None
+        return min(waits)
+
+    def acquire_wait(self, exclude: Optional[Dict] = None, max_wait=600.0) -> Optional[Dict]:
+        proxy = self.acquire(exclude)
+        if proxy is not None:
+            return proxy
+        wait = self.next_available_in()
+        if wait is None or wait > max_wait:
+            return None
+        logging.info(f"All proxies quarantined, sleep {wait:.0f}s")
+        time.sleep(wait)
+        return self.acquire()
+
+    def report_success(self, proxy: Optional[Dict], latency: Optional[float] = None):
+        stats = self._get(proxy)
+        if stats is None:
+            return
+        with self._lock:
+            stats.requests += 1
+            stats.successes += 1
+            stats.consecutive_failures = 0
+            if stats.quarantined_until != 0:
+                stats.quarantined_until = 0.0
+                logging.info(f"Proxy {stats.key} recovered after trial request")
+            if latency is not None:
+                if stats.latency is None:
+                    stats.latency = latency
+                else:
+                    stats.latency = self.latency_alpha * latency + (1 - self.latency_alpha) * stats.latency
+
+    def report_failure(self, proxy: Optional[Dict], kind="error"):
+        stats = self._get(proxy)
+        if stats is None:
+            return
+        with self._lock:
+            stats.requests += 1
+            stats.failures += 1
+            if kind == "captcha":
+                stats.captchas += 1
+            elif kind == "block":
+                stats.blocks += 1
+            stats.consecutive_failures += 1
+
+            if stats.consecutive_failures >= self.max_consecutive_failures:
+                stats.retired = True
+                logging.error(f"Proxy {stats.key} retired after {stats.consecutive_failures} failures")
+                return
+
+            # Блокировка и капча размыкают сразу, случайные ошибки - только серией;
+            # неудача пробного запроса снова размыкает с удвоенным карантином
+            half_open = stats.quarantined_until != 0
+            if kind == "error" and not half_open and stats.consecutive_failures < self.error_threshold:
+                return
+
+            cooldown = min(self.base_cooldown * 2 ** (stats.consecutive_failures - 1), self.max_cooldown)
+            stats.quarantined_until = time.time() + cooldown
+            logging.info(f"Proxy {stats.key} quarantined for {cooldown:.0f}s ({kind})")
+
+    def snapshot(self) -> List[Dict]:
+        with self._lock:
+            return sorted((s.to_dict() for s in self.stats.values()), key=lambda s: -s["score"])
+
+    def save(self, path):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as fp:
+            json.dump(self.snapshot(), fp, ensure_ascii=False)
+        Path(tmp_path).replace(path)
+
+    def load(self, path):
+        # Статистика прошлых запусков, чтобы пул помнил рабочие прокси
+        if not Path(path).exists():
+            return
+        try:
+            with open(path) as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.error(f"Cant read proxy stats {path}, start from scratch: {e}")
+            return
+        now = time.time()
+        with self._lock:
+            for item in saved:
+                stats = self.stats.get(proxy_key(item["proxy"]))
+                if stats is None:
+                    continue
+                for field in ("requests", "successes", "failures", "captchas", "blocks", "latency",
+                              "consecutive_failures", "quarantined_until"):
+                    setattr(stats, field, item[field])
+                if item.get("retired"):
+                    # Списание действует только в пределах запуска: в следующем прокси получает
+                    # пробный запрос после максимального карантина, новая неудача спишет его снова
+                    stats.quarantined_until = max(stats.quarantined_until, now + self.max_cooldown)
+
+    def prevalidate(self, workers=32, url=None, timeout=20):
+        # proxy_check тянет requests, пул без проверки обходится без него
+        from proxy_check import check_proxies
+        results = check_proxies([s.proxy for s in self.stats.values()], workers=workers, url=url, timeout=timeout)
+        for proxy, ok, latency, _ in results:
+            if ok:
+                self.report_success(proxy, latency)
+            else:
+                self.report_failure(proxy, "error")
+        return results
+
+    def _get(self, proxy: Optional[Dict]) -> Optional[ProxyStats]:
+        if proxy is None:
+            return None
+        return self.stats.get(proxy_key(proxy))
@@ -0,0 +1,138 @@
+import time
+import logging
+
+from urllib.parse import urlparse
+from typing import Dict, Optional
+
+
+BLOCKED_TYPES = {"image", "stylesheet", "font", "media", "texttrack", "manifest", "other"}
+
+# Собственные скрипты elibrary (goto_page, pub_search, title_search) и reCAPTCHA нужны
+# для работы и для распознавания капчи, остальные сторонние домены отбрасываются
+ALLOWED_DOMAINS = ("elibrary.ru", "www.google.com", "www.gstatic.com", "www.recaptcha.net")
+
+PAGE_TYPE_RULES = {
+    "titles": {"block_types": BLOCKED_TYPES, "wait_selector": "#titlename"},
+    "rubrics": {"block_types": BLOCKED_TYPES | {"script"}, "wait_selector": "#rubrics_table"},
+    "journal": {"block_types": BLOCKED_TYPES, "wait_selector": "#hdr_rubrics"},
+    "item": {"block_types": BLOCKED_TYPES, "wait_selector": None},
+    "other": {"block_types": {"image", "media", "font"}, "wait_selector": None},
+}
+
+# Средний размер отброшенных ресурсов, по нему оценивается сэкономленный трафик
+ESTIMATED_SIZES = {
+    "image": 20_000,
+    "stylesheet": 25_000,
+    "font": 60_000,
+    "media": 200_000,
+    "script": 40_000,
+    "xhr": 5_000,
+    "fetch": 5_000,
+}
+
+# Страница ошибки, блокировки или капчи тоже завершает ожидание, дальше ее разбирает _check_server_err
+ERROR_SELECTORS = "h1:has-text('Server Error'), div#blockedip, form[action*='page_captcha.asp']"
+
+
+def page_type(url: str) -> str:
+    path = urlparse(url).path.lower()
+    if path.endswith("/titles.asp"):
+        return "titles"
+    if path.endswith("/title_items_rubrics.asp"):
+        return "rubrics"
+    if path.endswith("/title_items.asp"):
+        return "journal"
+    if path.endswith("/item.asp"):
+        return "item"
+    return "other"
+
+
+def wait_selector(url: str) -> Optional[str]:
+    selector = PAGE_TYPE_RULES[page_type(url)]["wait_selector"]
+    if selector is None:
+        return None
+    return f"{selector}, {ERROR_SELECTORS}"
+
+
+class ResourceFilter():
+    def __init__(self, rules: Optional[Dict] = None, allowed_domains=ALLOWED_DOMAINS, estimated_sizes=None):
+        self.rules = rules or PAGE_TYPE_RULES
+        self.allowed_domains = allowed_domains
+        self.estimated_sizes = estimated_sizes or ESTIMATED_SIZES
+        self.report = {}
+
+    def _page_stats(self, ptype: str) -> Dict:
+        if ptype not in self.report:
+            self.report[ptype] = {"navigations": 0, "latency_total": 0.0, "blocked_requests": 0,
+                                  "bytes_saved_estimate": 0, "allowed_requests": 0, "bytes_loaded": 0}
+        return self.report[ptype]
+
+    def should_block(self, request) -> bool:
+        if request.is_navigation_request():
+            return False
+        ptype = page_type(request.frame.url)
+        resource_type = request.resource_type
+        host = urlparse(request.url).hostname or ""
+        first_party = host == urlparse(request.frame.url).hostname or \
+            any(host == domain or host.endswith(f".{domain}") for domain in self.allowed_domains)
+        block = resource_type in self.rules.get(ptype, self.rules["other"])["block_types"] or not first_party
+
+        stats = self._page_stats(ptype)
+        if block:
+            stats["blocked_requests"] += 1
+            stats["bytes_saved_estimate"] += self.estimated_sizes.get(resource_type, 0)
+        else:
+            stats["allowed_requests"] += 1
+        return block
+
+    def on_response(self, response):
+        try:
+            length = int(response.headers.get("content-length", 0))
+            ptype = page_type(response.frame.url)
+        except Exception:
+            return
+        self._page_stats(ptype)["bytes_loaded"] += length
+
+    def install(self, context, detector=None):
+        def handle(route, request):
+            if self.should_block(request):
+                route.abort()
+            elif detector is not None and request.is_navigation_request() and detector.handle(route, request):
+                return
+            else:
+                route.continue_()
+
+        context.route("**/*", handle)
+        context.on("response", self.on_response)
+
+    async def install_async(self, context, detector=None):
+        async def handle(route, request):
+            if self.should_block(request):
+                await route.abort()
+            elif detector is not None and request.is_navigation_request() and await detector.handle_async(route, request):
+                return
+            else:
+                await route.continue_()
+
+        await context.route("**/*", handle)
+        context.on("response", self.on_response)
+
+    def navigation_started(self) -> float:
+        return time.monotonic()
+
+    def navigation_finished(self, url: str, started: float):
+        stats = self._page_stats(page_type(url))
+        stats["navigations"] += 1
+        stats["latency_total"] += time.monotonic() - started
+
+    def summary(self) -> Dict:
+        summary = {}
+        for ptype, stats in self.report.items():
+            summary[ptype] = dict(stats)
+            navigations = stats["navigations"]
+            summary[ptype]["avg_latency"] = round(stats["latency_total"] / navigations, 3) if navigations else None
+        return summary
+
+    def log_summary(self):
+        for ptype, stats in self.summary().items():
+            logging.info(f"Page type {ptype}: {stats}")
@@ -0,0 +1,116 @@
+import time
+import heapq
+import random
+import logging
+import threading
+
+from typing import Any, Dict, Optional, Tuple
+
+from metrics import METRICS
+
+
+class AimdLimiter():
+    # Темп запросов подстраивается по схеме AIMD: после каждого успешного запроса скорость
+    # растет на постоянную величину, после ошибки, капчи или медленного ответа - падает в разы
+    def __init__(self, rate=0.5, min_rate=0.05, max_rate=5.0, increase=0.05, decrease=0.5,
+                 latency_target=5.0):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_target = latency_target
+        self.next_at = 0.0
+
+    def reserve(self) -> float:
+        now = time.monotonic()
+        start = max(now, self.next_at)
+        self.next_at = start + 1 / self.rate
+        return start - now
+
+    def on_success(self, latency: Optional[float] = None):
+        if latency is not None and latency > self.latency_target:
+            self.rate = max(self.min_rate, self.rate * 0.8)
+        else:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_failure(self, kind="error"):
+        factor = self.decrease if kind == "error" else self.decrease / 2
+        self.rate = max(self.min_rate, self.rate * factor)
+
+
+class Scheduler():
+    def __init__(self, global_rate=2.0, proxy_rate=0.5, max_global_rate=10.0, max_proxy_rate=3.0,
+                 base_backoff=30.0, max_backoff=1800.0):
+        self.global_limiter = AimdLimiter(rate=global_rate, max_rate=max_global_rate, min_rate=0.1)
+        self.proxy_rate = proxy_rate
+        self.max_proxy_rate = max_proxy_rate
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.proxy_limiters: Dict[str, AimdLimiter] = {}
+        self._lock = threading.Lock()
+
+    def _limiter(self, proxy: Optional[Dict]) -> AimdLimiter:
+        key = proxy["server"] if proxy else "direct"
+        if key not in self.proxy_limiters:
+            self.proxy_limiters[key] = AimdLimiter(rate=self.proxy_rate, max_rate=self.max_proxy_rate)
+        return self.proxy_limiters[key]
+
+    def reserve(self, proxy: Optional[Dict]) -> float:
+        with self._lock:
+            return max(self.global_limiter.reserve(), self._limiter(proxy).reserve())
+
+    def wait(self, proxy: Optional[Dict]):
+        delay = self.reserve(proxy)
+        if delay > 0:
+            METRICS.sleep(delay, "pacing")
+
+    async def wait_async(self, proxy: Optional[Dict]):
+        delay = self.reserve(proxy)
+        if delay > 0:
+            import asyncio
+            METRICS.inc("sleep_seconds_total", delay, reason="pacing")
+            await asyncio.sleep(delay)
+
+    def on_success(self, proxy: Optional[Dict], latency: Optional[float] = None):
+        with self._lock:
+            self.global_limiter.on_success(latency)
+            self._limiter(proxy).on_success(latency)
+
+    def on_failure(self, proxy: Optional[Dict], kind="error"):
+        with self._lock:
+            self.global_limiter.on_failure(kind)
+            self._limiter(proxy).on_failure(kind)
+
+    def backoff(self, attempt: int) -> float:
+        # Экспоненциальная пауза с разбросом, чтобы повторы не приходили пачкой
+        delay = min(self.base_backoff * 2 ** attempt, self.max_backoff)
+        return delay * random.uniform(0.5, 1.0)
+
+    def rates(self) -> Dict:
+        with self._lock:
+            rates = {key: round(limiter.rate, 3) for key, limiter in self.proxy_limiters.items()}
+            rates["global"] = round(self.global_limiter.rate, 3)
+        return rates
+
+
+class RetryQueue():
+    # Очередь повторов: в работу возвращается только то, что не удалось, и только когда подошел срок
+    def __init__(self):
+        self._heap = []
+        self._counter = 0
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, item: Any, delay=0.0, attempt=0):
+        self._counter += 1
+        heapq.heappush(self._heap, (time.monotonic() + delay, self._counter, attempt, item))
+
+    def pop_wait(self) -> Tuple[Any, int]:
+        ready_at, _, attempt, item = heapq.heappop(self._heap)
+        delay = ready_at - time.monotonic()
+        if delay > 0:
+            logging.info(f"Next retry in {delay:.0f}s, {len(self._heap) + 1} items pending")
+            METRICS.sleep(delay, "retry_backoff")
+        return item, attempt
@@ -0,0 +1,67 @@
+import time
+import json
+import hashlib
+import logging
+
+from pathlib import Path
+from typing import Dict, Optional
+
+from metrics import METRICS
+
+
+DIRECT = "direct"
+
+
+def proxy_identity(proxy: Optional[Dict]) -> str:
+    # Сессия привязана к выходному адресу: сервер прокси и логин
+    if proxy is None:
+        return DIRECT
+    return f"{proxy['server']}|{proxy.get('username', '')}"
+
+
+class SessionStore():
+    # Cookies и localStorage контекста браузера сохраняются отдельно для каждого прокси
+    # и подставляются при создании нового контекста с тем же прокси
+    def __init__(self, path="./data/sessions", max_age=24 * 60 * 60):
+        self.path = Path(path)
+        self.max_age = max_age
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def state_path(self, proxy: Optional[Dict]) -> Path:
+        digest = hashlib.sha1(proxy_identity(proxy).encode()).hexdigest()[:16]
+        return self.path / f"{digest}.json"
+
+    def load(self, proxy: Optional[Dict]) -> Optional[str]:
+        path = self.state_path(proxy)
+        if not path.exists():
+            METRICS.inc("session_restores_total", result="missing")
+            return None
+        if time.time() - path.stat().st_mtime > self.max_age:
+            METRICS.inc("session_restores_total", result="expired")
+            path.unlink(missing_ok=True)
+            return None
+        METRICS.inc("session_restores_total", result="restored")
+        return str(path)
+
+    def _replace(self, proxy: Optional[Dict], state: Dict):
+        path = self.state_path(proxy)
+        tmp_path = path.with_suffix(".json.tmp")
+        with open(tmp_path, 'w') as fp:
+            json.dump(state, fp, ensure_ascii=False)
+        tmp_path.replace(path)
+
+    def save(self, context, proxy: Optional[Dict]):
+        try:
+            self._replace(proxy, context.storage_state())
+        except Exception as e:
+            logging.error(f"Cant save session state for {proxy_identity(proxy)}: {e}")
+
+    async def save_async(self, context, proxy: Optional[Dict]):
+        try:
+            self._replace(proxy, await context.storage_state())
+        except Exception as e:
+            logging.error(f"Cant save session state for {proxy_identity(proxy)}: {e}")
+
+    def discard(self, proxy: Optional[Dict]):
+        # После блокировки или капчи сохраненные cookies только мешают: сессия начинается заново
+        self.state_path(proxy).unlink(missing_ok=True)
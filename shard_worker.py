@@ -0,0 +1,155 @@
+import json
+import logging
+import argparse
+
+from typing import Dict, Iterator
+
+from journals_parser import ElibraryParser, read_json
+from proxy_pool import ProxyPool
+from leases import LeaseStore, WorkUnit
+from metrics import METRICS
+
+
+PHASES = ("links", "prepare", "crawl")
+
+
+class ShardWorker():
+    # Один узел распределенного обхода. Узлы не общаются друг с другом: работа делится
+    # через аренды в общей базе, результаты сливаются туда же идемпотентными вставками
+    def __init__(self, parser: ElibraryParser, leases: LeaseStore, categories, poll_interval=10.0):
+        self.parser = parser
+        self.state = parser.state
+        self.leases = leases
+        self.categories = categories
+        self.poll_interval = poll_interval
+        self.processed = {phase: 0 for phase in PHASES}
+
+    def units(self, kind: str) -> Iterator[WorkUnit]:
+        while True:
+            unit = self.leases.claim(kind)
+            if unit is not None:
+                yield unit
+                continue
+            if not self.leases.has_pending(kind):
+                return
+            # Остальное держат другие узлы: ждем их завершения или истечения аренды упавшего узла
+            wait = self.leases.next_expiry_in(kind)
+            METRICS.sleep(min(wait if wait is not None else self.poll_interval, self.poll_interval) + 0.1,
+                          "lease_wait")
+
+    def run_phase(self, kind: str, handler):
+        for unit in self.units(kind):
+            try:
+                finished = handler(json.loads(unit.payload))
+            except Exception as e:
+                logging.error(f"Worker {self.leases.worker_id} failed on {unit}: {e}")
+                finished = False
+            if finished:
+                self.leases.complete(unit)
+                self.processed[kind] += 1
+                METRICS.inc("units_total", kind=kind)
+            else:
+                self.leases.release(unit)
+                METRICS.inc("retries_total", stage=f"unit_{kind}", reason="error")
+        logging.info(f"Phase {kind} finished on {self.leases.worker_id}: {self.leases.stats(kind)}")
+
+    def seed_links(self):
+        names = read_json(self.parser.issn_codes_path)
+        self.leases.seed("links", ((name, json.dumps(issns)) for name, issns in names.items()))
+
+    def seed_prepare(self):
+        links = self.state.issn_links() or read_json(self.parser.issn_links_path)
+        self.leases.seed("prepare", ((issn, json.dumps({"issn": issn, "link": link}))
+                                     for issn, link in links.items() if link != ""))
+
+    def seed_crawl(self):
+        units = []
+        links = self.state.issn_links() or read_json(self.parser.issn_links_path)
+        for issn, link in links.items():
+            info = self.state.journal_info(issn) if link != "" else None
+            if info is None:
+                continue
+            for rubric, counters in info.items():
+                if counters["parsed"] < int(counters["amount"]):
+                    units.append((f"{issn}/{rubric}", json.dumps({"issn": issn, "link": link, "rubric": rubric})))
+        self.leases.seed("crawl", units)
+
+    def resolve_links(self, payload) -> bool:
+        url = f"{self.parser.base_url}/titles.asp"
+        page = self.parser.open_url(url)
+        try:
+            for issn in payload:
+                page, link = self.parser._get_journal_link_with_retries(page, url, issn)
+                self.state.set_issn_link(issn, link)
+                if len(link) != 0:
+                    break
+        finally:
+            self.parser.page_pool.release(page)
+        return True
+
+    def prepare_journal(self, payload: Dict) -> bool:
+        issn, link = payload["issn"], payload["link"]
+        if self.state.journal_info(issn) is None:
+            issn_info = self.parser._get_journal_pubs_info_with_retries(issn, link)
+            self.parser._save_journal_info(issn, link, issn_info, self.categories)
+        return True
+
+    def crawl_rubric(self, payload: Dict) -> bool:
+        issn, rubric = payload["issn"], payload["rubric"]
+        info = self.state.journal_info(issn) or {}
+        if rubric not in info:
+            return True
+        self.parser.parse_journal(f"{self.parser.base_url}/{payload['link']}", {rubric: info[rubric]}, issn)
+        # Другие рубрики журнала в это же время обходят другие узлы: выгружается только своя
+        self.state.update_journal(issn)
+        self.state.export_journal(issn, self.parser.journals_path, rubrics=[rubric])
+        return self.state.parsed_count(issn, rubric) >= int(info[rubric]["amount"])
+
+    def run(self, phases=PHASES):
+        self.leases.start_heartbeat()
+        handlers = {
+            "links": (self.seed_links, self.resolve_links),
+            "prepare": (self.seed_prepare, self.prepare_journal),
+            "crawl": (self.seed_crawl, self.crawl_rubric),
+        }
+        # Фазы идут по порядку: следующая засевается только когда предыдущая закрыта на всех узлах
+        for phase in phases:
+            seed, handler = handlers[phase]
+            seed()
+            self.run_phase(phase, handler)
+        return self.processed
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Sharded crawl worker, run one per machine or process")
+    arg_parser.add_argument("phase", choices=PHASES + ("all",))
+    arg_parser.add_argument("--db", default="./data/crawl_state.sqlite", help="shared state database")
+    arg_parser.add_argument("--worker-id", default=None)
+    arg_parser.add_argument("--proxies", default=None, help="this node's proxy allotment (json)")
+    arg_parser.add_argument("--categories", default="data/interrest_cats.json")
+    arg_parser.add_argument("--base-url", default=None)
+    arg_parser.add_argument("--lease-ttl", type=float, default=300.0)
+    arg_parser.add_argument("--max-attempts", type=int, default=10)
+    arg_parser.add_argument("--headless", action="store_true")
+    args = arg_parser.parse_args()
+
+    proxy_pool = None
+    if args.proxies:
+        proxy_pool = ProxyPool.from_json(args.proxies)
+        proxy_pool.load("./data/proxy_stats.json")
+
+    parser = ElibraryParser(headless_mode=args.headless, proxy_pool=proxy_pool, state_path=args.db)
+    if args.base_url:
+        parser.base_url = args.base_url.rstrip("/")
+    leases = LeaseStore(args.db, worker_id=args.worker_id, lease_ttl=args.lease_ttl, max_attempts=args.max_attempts)
+    worker = ShardWorker(parser, leases, read_json(args.categories), poll_interval=min(10.0, args.lease_ttl / 3))
+    try:
+        processed = worker.run(PHASES if args.phase == "all" else (args.phase,))
+        print(json.dumps({"worker": leases.worker_id, "processed": processed}))
+    finally:
+        leases.close()
+        parser.close()
+
+
+if __name__ == "__main__":
+    main()
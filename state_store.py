@@ -0,0 +1,405 @@
+import os
+import csv
+import json
+import time
+import sqlite3
+import logging
+import argparse
+
+from pathlib import Path
+from contextlib import contextmanager
+from typing import List, Dict, Optional, Iterable, Tuple
+
+
+RESULTS_PER_PAGE = 20
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS journals (
+    issn TEXT PRIMARY KEY,
+    link TEXT NOT NULL DEFAULT '',
+    done INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL
+);
+CREATE TABLE IF NOT EXISTS rubrics (
+    issn TEXT NOT NULL,
+    rubric TEXT NOT NULL,
+    amount INTEGER NOT NULL DEFAULT 0,
+    parsed INTEGER NOT NULL DEFAULT 0,
+    last_page INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (issn, rubric)
+);
+CREATE TABLE IF NOT EXISTS articles (
+    issn TEXT NOT NULL,
+    rubric TEXT NOT NULL,
+    elib_id TEXT NOT NULL,
+    title TEXT,
+    link TEXT,
+    page INTEGER,
+    PRIMARY KEY (issn, rubric, elib_id)
+);
+CREATE INDEX IF NOT EXISTS articles_elib_id ON articles (elib_id);
+CREATE TABLE IF NOT EXISTS issn_links (
+    issn TEXT PRIMARY KEY,
+    link TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS page_ranges (
+    issn TEXT NOT NULL,
+    rubric TEXT NOT NULL,
+    first_page INTEGER NOT NULL,
+    last_page INTEGER,
+    next_page INTEGER NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (issn, rubric, first_page)
+);
+CREATE TABLE IF NOT EXISTS union_scans (
+    issn TEXT PRIMARY KEY,
+    rubrics TEXT NOT NULL,
+    last_page INTEGER NOT NULL DEFAULT 0,
+    done INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS union_articles (
+    issn TEXT NOT NULL,
+    elib_id TEXT NOT NULL,
+    title TEXT,
+    link TEXT,
+    page INTEGER,
+    attributed INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (issn, elib_id)
+);
+CREATE TABLE IF NOT EXISTS refreshes (
+    issn TEXT NOT NULL,
+    rubric TEXT NOT NULL,
+    watermark INTEGER NOT NULL,
+    started_at REAL,
+    PRIMARY KEY (issn, rubric)
+);
+"""
+
+
+class CrawlStateStore():
+    def __init__(self, path="./data/crawl_state.sqlite", batch_size=200):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.batch_size = batch_size
+        # Базу могут одновременно писать несколько процессов (см. shard_worker.py)
+        self.conn = sqlite3.connect(str(path), isolation_level=None, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    @contextmanager
+    def transaction(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self.conn
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        else:
+            self.conn.execute("COMMIT")
+
+    def has_journals(self) -> bool:
+        return self.conn.execute("SELECT 1 FROM journals LIMIT 1").fetchone() is not None
+
+    def upsert_journal(self, issn: str, link: str = ""):
+        self.conn.execute("INSERT INTO journals (issn, link, updated_at) VALUES (?, ?, ?) "
+                          "ON CONFLICT (issn) DO UPDATE SET link = excluded.link",
+                          (issn, link, time.time()))
+
+    def set_journal_info(self, issn: str, info: Dict, link: str = ""):
+        # Сохраняет счетчики рубрик; прогресс по уже известным рубрикам не сбрасывается
+        with self.transaction() as conn:
+            conn.execute("INSERT INTO journals (issn, link, updated_at) VALUES (?, ?, ?) "
+                         "ON CONFLICT (issn) DO UPDATE SET updated_at = excluded.updated_at",
+                         (issn, link, time.time()))
+            if link:
+                conn.execute("UPDATE journals SET link = ? WHERE issn = ?", (link, issn))
+            conn.executemany("INSERT INTO rubrics (issn, rubric, amount) VALUES (?, ?, ?) "
+                             "ON CONFLICT (issn, rubric) DO UPDATE SET amount = excluded.amount",
+                             [(issn, rubric, int(counters["amount"])) for rubric, counters in info.items()])
+            placeholders = ",".join("?" * len(info))
+            conn.execute(f"DELETE FROM rubrics WHERE issn = ? AND rubric NOT IN ({placeholders})",
+                         (issn, *info.keys()))
+        self.update_journal(issn)
+
+    def set_issn_link(self, issn: str, link: str):
+        self.conn.execute("INSERT INTO issn_links (issn, link) VALUES (?, ?) "
+                          "ON CONFLICT (issn) DO UPDATE SET link = excluded.link", (issn, link))
+
+    def issn_links(self) -> Dict[str, str]:
+        return dict(self.conn.execute("SELECT issn, link FROM issn_links ORDER BY rowid").fetchall())
+
+    def journal_info(self, issn: str) -> Optional[Dict]:
+        if self.conn.execute("SELECT 1 FROM journals WHERE issn = ?", (issn,)).fetchone() is None:
+            return None
+        rows = self.conn.execute("SELECT rubric, amount, parsed FROM rubrics WHERE issn = ? ORDER BY rowid",
+                                 (issn,)).fetchall()
+        return {rubric: {"amount": amount, "parsed": parsed} for rubric, amount, parsed in rows}
+
+    def is_done(self, issn: str) -> bool:
+        row = self.conn.execute("SELECT done FROM journals WHERE issn = ?", (issn,)).fetchone()
+        return row is not None and row[0] == 1
+
+    def parsed_count(self, issn: str, rubric: str) -> int:
+        row = self.conn.execute("SELECT parsed FROM rubrics WHERE issn = ? AND rubric = ?", (issn, rubric)).fetchone()
+        return row[0] if row is not None else 0
+
+    def last_page(self, issn: str, rubric: str) -> int:
+        row = self.conn.execute("SELECT last_page FROM rubrics WHERE issn = ? AND rubric = ?",
+                                (issn, rubric)).fetchone()
+        return row[0] if row is not None else 0
+
+    def complete_page(self, issn: str, rubric: str, page: int, rows: Iterable[List],
+                      range_start: Optional[int] = None) -> int:
+        # Строки страницы и номер последней полностью обработанной страницы
+        # фиксируются одной транзакцией, дубликаты отбрасываются первичным ключом
+        return self.add_articles(issn, rubric, rows, page, range_start)
+
+    def add_articles(self, issn: str, rubric: str, rows: Iterable[List], page: Optional[int] = None,
+                     range_start: Optional[int] = None) -> int:
+        values = []
+        for elib_id, title, link in rows:
+            if not elib_id:
+                logging.error(f"Row without elib_id in {issn}/{rubric}: {title}. Skip")
+                continue
+            values.append((issn, rubric, str(elib_id), title, link, page))
+
+        with self.transaction() as conn:
+            before = conn.total_changes
+            conn.executemany("INSERT OR IGNORE INTO articles (issn, rubric, elib_id, title, link, page) "
+                             "VALUES (?, ?, ?, ?, ?, ?)", values)
+            inserted = conn.total_changes - before
+            conn.execute("UPDATE rubrics SET parsed = parsed + ? WHERE issn = ? AND rubric = ?",
+                         (inserted, issn, rubric))
+            if page is not None and range_start is not None:
+                # Страница диапазона двигает только его отметку, общая отметка рубрики - после всех диапазонов
+                conn.execute("UPDATE page_ranges SET next_page = MAX(next_page, ?) "
+                             "WHERE issn = ? AND rubric = ? AND first_page = ?", (page + 1, issn, rubric, range_start))
+            elif page is not None:
+                conn.execute("UPDATE rubrics SET last_page = MAX(last_page, ?) WHERE issn = ? AND rubric = ?",
+                             (page, issn, rubric))
+        return inserted
+
+    def plan_ranges(self, issn: str, rubric: str, total_pages: int, range_pages: int) -> List[Tuple[int, Optional[int]]]:
+        # Большая рубрика делится на диапазоны страниц, начиная с первой необработанной;
+        # последний диапазон открыт, чтобы захватить статьи, добавленные после подсчета
+        with self.transaction() as conn:
+            pending = conn.execute("SELECT first_page, last_page FROM page_ranges "
+                                   "WHERE issn = ? AND rubric = ? AND done = 0 ORDER BY first_page",
+                                   (issn, rubric)).fetchall()
+            if len(pending) != 0:
+                return pending
+            conn.execute("DELETE FROM page_ranges WHERE issn = ? AND rubric = ?", (issn, rubric))
+            start = conn.execute("SELECT last_page FROM rubrics WHERE issn = ? AND rubric = ?",
+                                 (issn, rubric)).fetchone()[0] + 1
+            ranges = []
+            for first_page in range(start, max(total_pages, start) + 1, range_pages):
+                last_page = first_page + range_pages - 1
+                ranges.append((first_page, last_page if last_page < total_pages else None))
+            conn.executemany("INSERT INTO page_ranges (issn, rubric, first_page, last_page, next_page) "
+                             "VALUES (?, ?, ?, ?, ?)",
+                             [(issn, rubric, first_page, last_page, first_page) for first_page, last_page in ranges])
+        return ranges
+
+    def has_pending_ranges(self, issn: str, rubric: str) -> bool:
+        return self.conn.execute("SELECT 1 FROM page_ranges WHERE issn = ? AND rubric = ? AND done = 0 LIMIT 1",
+                                 (issn, rubric)).fetchone() is not None
+
+    def range_next_page(self, issn: str, rubric: str, first_page: int) -> int:
+        row = self.conn.execute("SELECT next_page FROM page_ranges WHERE issn = ? AND rubric = ? AND first_page = ?",
+                                (issn, rubric, first_page)).fetchone()
+        return row[0] if row is not None else first_page
+
+    def finish_range(self, issn: str, rubric: str, first_page: int):
+        with self.transaction() as conn:
+            conn.execute("UPDATE page_ranges SET done = 1 WHERE issn = ? AND rubric = ? AND first_page = ?",
+                         (issn, rubric, first_page))
+            conn.execute("UPDATE rubrics SET last_page = MAX(last_page, "
+                         "(SELECT MAX(next_page) - 1 FROM page_ranges WHERE issn = ? AND rubric = ?)) "
+                         "WHERE issn = ? AND rubric = ? AND NOT EXISTS "
+                         "(SELECT 1 FROM page_ranges WHERE issn = ? AND rubric = ? AND done = 0)",
+                         (issn, rubric, issn, rubric, issn, rubric))
+
+    def begin_union_scan(self, issn: str, rubrics: List[str]) -> List[str]:
+        # Незавершенный проход по объединению рубрик продолжается с тем же набором рубрик
+        self.conn.execute("INSERT INTO union_scans (issn, rubrics) VALUES (?, ?) ON CONFLICT (issn) DO UPDATE "
+                          "SET rubrics = excluded.rubrics, last_page = 0, done = 0 WHERE done = 1",
+                          (issn, json.dumps(rubrics)))
+        return self.union_rubrics(issn)
+
+    def union_rubrics(self, issn: str) -> List[str]:
+        row = self.conn.execute("SELECT rubrics FROM union_scans WHERE issn = ?", (issn,)).fetchone()
+        return json.loads(row[0]) if row is not None else []
+
+    def union_last_page(self, issn: str) -> int:
+        row = self.conn.execute("SELECT last_page FROM union_scans WHERE issn = ?", (issn,)).fetchone()
+        return row[0] if row is not None else 0
+
+    def complete_union_page(self, issn: str, page: int, rows: Iterable[List]) -> int:
+        values = [(issn, str(elib_id), title, link, page) for elib_id, title, link in rows if elib_id]
+        with self.transaction() as conn:
+            before = conn.total_changes
+            conn.executemany("INSERT OR IGNORE INTO union_articles (issn, elib_id, title, link, page) "
+                             "VALUES (?, ?, ?, ?, ?)", values)
+            inserted = conn.total_changes - before
+            conn.execute("UPDATE union_scans SET last_page = MAX(last_page, ?) WHERE issn = ?", (page, issn))
+        return inserted
+
+    def finish_union_scan(self, issn: str):
+        self.conn.execute("UPDATE union_scans SET done = 1 WHERE issn = ?", (issn,))
+
+    def unattributed(self, issn: str) -> List[Tuple[str, str, str, int]]:
+        return self.conn.execute("SELECT elib_id, title, link, page FROM union_articles "
+                                 "WHERE issn = ? AND attributed = 0 ORDER BY rowid", (issn,)).fetchall()
+
+    def union_candidates(self, issn: str, rubric: str) -> List[str]:
+        # Статьи объединения, которых еще нет в рубрике: недостающие статьи рубрики могут быть только среди них
+        return [elib_id for (elib_id,) in self.conn.execute(
+            "SELECT u.elib_id FROM union_articles u WHERE u.issn = ? AND u.attributed = 0 AND NOT EXISTS "
+            "(SELECT 1 FROM articles a WHERE a.issn = u.issn AND a.rubric = ? AND a.elib_id = u.elib_id) "
+            "ORDER BY u.rowid", (issn, rubric)).fetchall()]
+
+    def attribute(self, issn: str, memberships: Dict[str, List[str]]) -> Dict[str, int]:
+        # Статья из объединения записывается в каждую свою рубрику, счетчики рубрик растут как при обычном обходе
+        added = {}
+        with self.transaction() as conn:
+            for elib_id, rubrics in memberships.items():
+                for rubric in rubrics:
+                    before = conn.total_changes
+                    conn.execute("INSERT OR IGNORE INTO articles (issn, rubric, elib_id, title, link, page) "
+                                 "SELECT issn, ?, elib_id, title, link, page FROM union_articles "
+                                 "WHERE issn = ? AND elib_id = ?", (rubric, issn, elib_id))
+                    added[rubric] = added.get(rubric, 0) + conn.total_changes - before
+                conn.execute("UPDATE union_articles SET attributed = 1 WHERE issn = ? AND elib_id = ?",
+                             (issn, elib_id))
+            conn.executemany("UPDATE rubrics SET parsed = parsed + ? WHERE issn = ? AND rubric = ?",
+                             [(count, issn, rubric) for rubric, count in added.items()])
+        return added
+
+    def begin_refresh(self, issn: str, rubric: str):
+        # Все статьи рубрики с rowid не больше отметки были известны до начала обновления;
+        # отметка переживает перезапуск, поэтому прерванное обновление не остановится на своих же строках
+        self.conn.execute("INSERT OR IGNORE INTO refreshes (issn, rubric, watermark, started_at) "
+                          "SELECT ?, ?, COALESCE(MAX(rowid), 0), ? FROM articles", (issn, rubric, time.time()))
+
+    def refresh_watermark(self, issn: str, rubric: str) -> Optional[int]:
+        row = self.conn.execute("SELECT watermark FROM refreshes WHERE issn = ? AND rubric = ?",
+                                (issn, rubric)).fetchone()
+        return row[0] if row is not None else None
+
+    def pending_refreshes(self, issn: str) -> List[str]:
+        return [rubric for (rubric,) in self.conn.execute("SELECT rubric FROM refreshes WHERE issn = ? "
+                                                          "ORDER BY rubric", (issn,)).fetchall()]
+
+    def known_before(self, issn: str, rubric: str, elib_ids: List[str], watermark: int) -> int:
+        if len(elib_ids) == 0:
+            return 0
+        placeholders = ",".join("?" * len(elib_ids))
+        return self.conn.execute(f"SELECT COUNT(*) FROM articles WHERE issn = ? AND rubric = ? AND rowid <= ? "
+                                 f"AND elib_id IN ({placeholders})",
+                                 (issn, rubric, watermark, *[str(elib_id) for elib_id in elib_ids])).fetchone()[0]
+
+    def finish_refresh(self, issn: str, rubric: str):
+        self.conn.execute("DELETE FROM refreshes WHERE issn = ? AND rubric = ?", (issn, rubric))
+
+    def update_journal(self, issn: str) -> bool:
+        row = self.conn.execute("SELECT COUNT(*), SUM(parsed >= amount) FROM rubrics WHERE issn = ?",
+                                (issn,)).fetchone()
+        done = row[0] != 0 and row[0] == row[1]
+        self.conn.execute("UPDATE journals SET done = ?, updated_at = ? WHERE issn = ?",
+                          (int(done), time.time(), issn))
+        return done
+
+    def import_tree(self, journals_path="data/journals", issn_links_path: Optional[str] = None) -> int:
+        # Перенос существующих info.json / csv / done.txt в базу
+        links = {}
+        if issn_links_path is not None and Path(issn_links_path).exists():
+            with open(issn_links_path) as f:
+                links = json.load(f)
+
+        imported = 0
+        for journal_path in sorted(Path(journals_path).iterdir()):
+            info_file = journal_path / "info.json"
+            if not journal_path.is_dir() or not info_file.exists():
+                continue
+            issn = journal_path.name
+            with open(info_file) as f:
+                info = json.load(f)
+
+            self.set_journal_info(issn, info, links.get(issn, "") or "")
+            for rubric in info.keys():
+                csv_file = journal_path / f"{rubric}.csv"
+                if not csv_file.exists():
+                    continue
+                with open(csv_file, newline="", encoding="utf-8") as f:
+                    rows = [row for row in csv.reader(f) if len(row) == 3]
+                for start in range(0, len(rows), self.batch_size):
+                    self.add_articles(issn, rubric, rows[start:start + self.batch_size])
+                # В старом формате известно только число строк: считаем завершенными полные страницы
+                self.conn.execute("UPDATE rubrics SET last_page = ? WHERE issn = ? AND rubric = ?",
+                                  (len(rows) // RESULTS_PER_PAGE, issn, rubric))
+
+            if (journal_path / "done.txt").exists():
+                self.conn.execute("UPDATE journals SET done = 1 WHERE issn = ?", (issn,))
+            imported += 1
+        logging.info(f"Imported {imported} journals from {journals_path}")
+        return imported
+
+    def export_journal(self, issn: str, journals_path="data/journals", rubrics: Optional[List[str]] = None):
+        # Файлы журнала могут одновременно выгружать несколько процессов (shard_worker.py):
+        # каждый пишет во временный файл со своим pid и атомарно подменяет готовый
+        journal_path = Path(journals_path) / issn
+        journal_path.mkdir(parents=True, exist_ok=True)
+        info = self.journal_info(issn) or {}
+        for rubric in info.keys() if rubrics is None else rubrics:
+            # Диапазоны страниц пишутся параллельно: порядок выдачи восстанавливается по номеру страницы
+            rows = self.conn.execute("SELECT elib_id, title, link FROM articles "
+                                     "WHERE issn = ? AND rubric = ? ORDER BY COALESCE(page, 0), rowid",
+                                     (issn, rubric))
+            tmp_path = journal_path / f"{rubric}.csv.{os.getpid()}.tmp"
+            with open(tmp_path, mode="w", newline="", encoding="utf-8") as file:
+                csv.writer(file).writerows(rows)
+            os.replace(tmp_path, journal_path / f"{rubric}.csv")
+
+        tmp_path = journal_path / f"info.json.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as fp:
+            json.dump(info, fp, ensure_ascii=False)
+        os.replace(tmp_path, journal_path / "info.json")
+        if self.is_done(issn):
+            with open(journal_path / "done.txt", 'w') as fp:
+                fp.write("1")
+        else:
+            # Журнал снова открыт обновлением (refresh_journals): старая отметка завершения снимается
+            (journal_path / "done.txt").unlink(missing_ok=True)
+
+    def journals(self) -> List[str]:
+        return [issn for (issn,) in self.conn.execute("SELECT issn FROM journals ORDER BY issn").fetchall()]
+
+    def export_csv(self, journals_path="data/journals"):
+        for issn in self.journals():
+            self.export_journal(issn, journals_path)
+
+    def close(self):
+        self.conn.close()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Crawl state store maintenance")
+    arg_parser.add_argument("command", choices=["import", "export"])
+    arg_parser.add_argument("--db", default="./data/crawl_state.sqlite")
+    arg_parser.add_argument("--journals", default="data/journals")
+    arg_parser.add_argument("--issn-links", default="./data/issn_links.json")
+    args = arg_parser.parse_args()
+
+    store = CrawlStateStore(args.db)
+    try:
+        if args.command == "import":
+            store.import_tree(args.journals, args.issn_links)
+        else:
+            store.export_csv(args.journals)
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()